@@ -0,0 +1,84 @@
+"""
+asyncio interface to DomainsConfig
+
+Mirrors the DomainsConfig and DomainsConfigKeys APIs, using the same key definitions and value codecs.
+Methods are coroutines which run the DomainsConfig methods in a thread pool, using the DomainsConfig redis connection pools,
+so that daemons can process multiple workers concurrently on a single event loop.
+"""
+import asyncio
+import inspect
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from cwm_worker_operator import config
+from cwm_worker_operator.domains_config import DomainsConfig, DomainsConfigKey
+
+
+def _call(func, args, kwargs):
+    # generators are consumed in the thread pool, so that their redis commands don't block the event loop
+    res = func(*args, **kwargs)
+    if inspect.isgenerator(res):
+        res = list(res)
+    return res
+
+
+# wraps an object so that its methods are coroutines which run in the executor, other attributes are returned as is
+class AsyncProxy:
+
+    def __init__(self, target, executor):
+        self._target = target
+        self._executor = executor
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if not callable(value):
+            return value
+
+        @functools.wraps(value)
+        async def method(*args, **kwargs):
+            return await asyncio.get_running_loop().run_in_executor(self._executor, _call, value, args, kwargs)
+
+        return method
+
+
+class AsyncDomainsConfigKeys:
+
+    def __init__(self, keys, executor):
+        for key_name, key in vars(keys).items():
+            if isinstance(key, DomainsConfigKey):
+                setattr(self, key_name, AsyncProxy(key, executor))
+
+
+class AsyncDomainsConfig(AsyncProxy):
+
+    # concurrency - max number of DomainsConfig method calls which run concurrently
+    def __init__(self, domains_config=None, concurrency=None):
+        self.domains_config = domains_config if domains_config else DomainsConfig()
+        self.concurrency = concurrency if concurrency else config.DAEMONS_ASYNC_CONCURRENCY
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='async_domains_config')
+        super(AsyncDomainsConfig, self).__init__(self.domains_config, executor)
+        self.keys = AsyncDomainsConfigKeys(self.domains_config.keys, executor)
+
+    # returns the AsyncDomainsConfig of the given domains_config, it's created on first use and kept for next calls
+    @staticmethod
+    def get(domains_config):
+        async_domains_config = getattr(domains_config, '_async_domains_config', None)
+        if async_domains_config is None:
+            async_domains_config = domains_config._async_domains_config = AsyncDomainsConfig(domains_config)
+        return async_domains_config
+
+    # runs a function which uses the blocking DomainsConfig API in the executor
+    async def run(self, func, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, _call, func, args, kwargs)
+
+    # runs func(item) for each of the items concurrently, returns the results in the same order as the items
+    async def map(self, func, items):
+        return await asyncio.gather(*[self.run(func, item) for item in items])
+
+    def close(self):
+        self._executor.shutdown()
+
+
+# runs a daemon iteration coroutine - async_run_single_iteration(async_domains_config, **kwargs)
+def run_async_single_iteration(async_run_single_iteration, domains_config, **kwargs):
+    return asyncio.run(async_run_single_iteration(AsyncDomainsConfig.get(domains_config), **kwargs))
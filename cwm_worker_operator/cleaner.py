@@ -11,10 +11,7 @@ def cleanup_node(node, domains_config, deployments_manager):
     with deployments_manager.node_cleanup_pod(node['name']) as node_cleanup_pod:
         for namespace_name in node_cleanup_pod.list_cache_namespaces():
             worker_id = common.get_worker_id_from_namespace_name(namespace_name)
-            is_valid_for_cleanup = True
-            for hostname in domains_config.iterate_worker_hostnames(worker_id):
-                if domains_config.keys.hostname_available.exists(hostname):
-                    is_valid_for_cleanup = False
+            is_valid_for_cleanup = not any(domains_config.keys.hostname_available.exists_many(domains_config.iterate_worker_hostnames(worker_id)))
             if is_valid_for_cleanup or not deployments_manager.worker_has_pod_on_node(namespace_name, node['name']):
                 node_cleanup_pod.clear_cache_namespace(namespace_name)
 
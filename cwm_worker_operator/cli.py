@@ -199,6 +199,111 @@ def start_minio_auth_server_devel():
     uvicorn.run('cwm_worker_operator.minio_auth_plugin.app:app', host='0.0.0.0', port=5000, reload=True)
 
 
+@main.command(short_help="Add existing keys to the prefix key indexes")
+def backfill_prefix_indexes():
+    """
+    Add existing keys to the prefix key indexes
+
+    Should run once before enabling DOMAINS_CONFIG_PREFIX_INDEX_ENABLED on existing data
+    """
+    from cwm_worker_operator import domains_config
+    for key_name, num_suffixes in domains_config.DomainsConfig().backfill_prefix_indexes():
+        print('{}: {}'.format(key_name, num_suffixes))
+
+
+@main.command(short_help="Move the internal worker string keys to the per-worker hashes")
+def migrate_worker_hashes():
+    """
+    Move the internal worker string keys to the per-worker hashes
+
+    Should run once after enabling DOMAINS_CONFIG_WORKER_HASH_ENABLED on existing data
+    """
+    from cwm_worker_operator import domains_config
+    for key_name, num_moved in domains_config.DomainsConfig().migrate_worker_hashes():
+        print('{}: {}'.format(key_name, num_moved))
+
+
+@main.command(short_help="Move the deployment api metric string keys to the per-namespace hashes")
+def migrate_deployment_api_metrics():
+    """
+    Move the deployment api metric string keys to the per-namespace hashes
+
+    Should run once after enabling DEPLOYMENT_API_METRICS_HASH_ENABLED on existing data
+    """
+    from cwm_worker_operator import domains_config
+    print(domains_config.DomainsConfig().migrate_deployment_api_metrics())
+
+
+@main.command(short_help="Set the TTL of existing keys which declare a TTL policy")
+def apply_keys_ttl():
+    """
+    Set the TTL of existing keys which declare a TTL policy
+
+    Should run once after enabling DOMAINS_CONFIG_KEYS_TTL_ENABLED on existing data
+    """
+    from cwm_worker_operator import domains_config
+    for key_name, num_expired in domains_config.DomainsConfig().apply_keys_ttl():
+        print('{}: {}'.format(key_name, num_expired))
+
+
+@main.command(short_help="Report number of keys, memory usage and TTL coverage of each key in the redis pools")
+@click.option('--sample-rate', type=float, help='ratio of keys to sample after the min samples of each key (default KEYS_MEMORY_REPORT_SAMPLE_RATE)')
+@click.option('--json', 'is_json', is_flag=True, help='print each key report as a json line')
+def keys_memory_report(sample_rate, is_json):
+    """
+    Report number of keys, memory usage and TTL coverage of each key in the redis pools
+
+    Memory usage and TTL are sampled, keys which don't match any DomainsConfigKeys key are grouped by prefix
+    """
+    import json
+    from cwm_worker_operator import domains_config
+    report = domains_config.DomainsConfig().get_keys_memory_report(sample_rate=sample_rate)
+    if not is_json:
+        print('{:<10} {:<50} {:>10} {:>8} {:>12} {:>10} {:>10} {:>6}'.format('pool', 'key', 'keys', 'sampled', 'total (MB)', 'p50 (B)', 'p99 (B)', 'ttl'))
+    for group in report:
+        if is_json:
+            print(json.dumps(group))
+        else:
+            print('{:<10} {:<50} {:>10} {:>8} {:>12.2f} {:>10} {:>10} {:>5}%'.format(
+                group['pool'], group['title'], group['total'], group['sampled'], group['total_bytes'] / 1024 / 1024,
+                group['p50_bytes'], group['p99_bytes'], round(group['ttl_ratio'] * 100)
+            ))
+
+
+@main.command(short_help="Add existing hostnames to the worker request hostnames sets")
+def backfill_worker_request_hostnames():
+    """
+    Add existing hostnames to the worker request hostnames sets
+
+    Should run once before enabling DOMAINS_CONFIG_WORKER_REQUEST_HOSTNAMES_ENABLED on existing data
+    """
+    from cwm_worker_operator import domains_config
+    print(domains_config.DomainsConfig().backfill_worker_request_hostnames())
+
+
+@main.command(short_help="Add existing workers and hostnames to the search index")
+def backfill_search_index():
+    """
+    Add existing workers and hostnames to the search index
+
+    Should run once after enabling DOMAINS_CONFIG_SEARCH_INDEX_ENABLED on existing data
+    """
+    from cwm_worker_operator import domains_config
+    print(domains_config.DomainsConfig().backfill_search_index())
+
+
+@main.command(short_help="Print the hostname availability / error events published by the operator")
+def subscribe_hostname_events():
+    """
+    Print the hostname availability / error events published by the operator
+
+    Reference subscriber of the events published when DOMAINS_CONFIG_HOSTNAME_EVENTS_ENABLED, prints each event as a json line
+    """
+    import json
+    from cwm_worker_operator import domains_config, hostname_events
+    hostname_events.subscribe(domains_config.DomainsConfig(), lambda event: print(json.dumps(event), flush=True))
+
+
 @main.command(short_help="Start consecutive daemon run once commands")
 @click.argument('DAEMON_NAME', nargs=-1)
 def multi_run_once(daemon_name):
@@ -27,6 +27,50 @@ def strptime(value, dateformat):
         return datetime.datetime.strptime(value + 'z+0000', dateformat+'z%z')
 
 
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=pytz.UTC)
+MILLISECOND = datetime.timedelta(milliseconds=1)
+
+
+# parses datetime values stored in redis, supports integer epoch milliseconds and the legacy formats:
+#   %Y%m%d%H%M%S, %Y%m%dT%H%M%S, %Y%m%dT%H%M%S.%f, %Y-%m-%d %H:%M:%S, %Y-%m-%dT%H:%M:%S (optionally with +HH:MM / +HHMM offset)
+# legacy values are 14 digits once separators are removed, so they can't be confused with epoch milliseconds (13 digits)
+# values without an offset are assumed to be utc, raises ValueError for invalid values
+def parse_datetime(value):
+    if not value:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode()
+    if value.isdigit() and len(value) <= 13:
+        return EPOCH + int(value) * MILLISECOND
+    value, plus, offset = value.partition('+')
+    value, _, fraction = value.replace('-', '').replace(':', '').replace(' ', '').replace('T', '').partition('.')
+    if len(value) != 14 or not value.isdigit() or not (fraction == '' or fraction.isdigit()):
+        raise ValueError('invalid datetime value: {}{}{}'.format(value, plus, offset))
+    if plus:
+        offset = offset.replace(':', '')
+        if len(offset) != 4 or not offset.isdigit():
+            raise ValueError('invalid datetime offset: {}'.format(offset))
+        tzinfo = datetime.timezone(datetime.timedelta(hours=int(offset[:2]), minutes=int(offset[2:])))
+    else:
+        tzinfo = pytz.UTC
+    return datetime.datetime(
+        int(value[0:4]), int(value[4:6]), int(value[6:8]), int(value[8:10]), int(value[10:12]), int(value[12:14]),
+        int(fraction[:6].ljust(6, '0')) if fraction else 0, tzinfo=tzinfo
+    )
+
+
+# formats datetime values of operator-owned internal redis keys, using epoch milliseconds if DOMAINS_CONFIG_DATETIME_EPOCH_MS
+# is enabled otherwise the given legacy dateformat is used, naive datetimes are assumed to be utc
+# values which are read by other systems (shared metrics redis, cwm api) must keep using their legacy format
+def format_datetime(dt, dateformat):
+    if config.DOMAINS_CONFIG_DATETIME_EPOCH_MS:
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=pytz.UTC)
+        return str((dt - EPOCH) // MILLISECOND)
+    else:
+        return dt.strftime(dateformat)
+
+
 def bytes_to_gib(bytes, ndigits=2):
     return round(bytes / 1024 / 1024 / 1024, ndigits)
 
@@ -84,19 +128,47 @@ def is_worker_namespace(namespace_name):
     )
 
 
+def get_parent_hostname(hostname):
+    return hostname.partition('.')[2]
+
+
 def is_hostnames_match(full_hostname, partial_hostname):
-    if full_hostname.lower() == partial_hostname.lower():
-        return True
-    elif '.'.join(full_hostname.split('.')[1:]).lower() == partial_hostname.lower():
-        return True
-    else:
-        return False
+    full_hostname, partial_hostname = full_hostname.lower(), partial_hostname.lower()
+    return full_hostname == partial_hostname or get_parent_hostname(full_hostname) == partial_hostname
 
 
 def is_hostnames_match_in_list(full_hostname, partial_hostnames):
     return any((is_hostnames_match(full_hostname, partial_hostname) for partial_hostname in partial_hostnames))
 
 
+# index of partial hostnames (e.g. volume config hostnames) for matching full hostnames (e.g. request hostnames), see is_hostnames_match
+# should be built once and reused for matching multiple full hostnames, e.g. VolumeConfig.get_hostnames_index
+# partial hostnames are keyed by lower case hostname, so a full hostname is matched with 2 lookups - the full hostname and its parent domain
+class HostnameIndex:
+
+    def __init__(self, partial_hostnames=()):
+        self.partial_hostnames = {}
+        for partial_hostname in partial_hostnames:
+            self.add(partial_hostname)
+
+    def add(self, partial_hostname):
+        self.partial_hostnames.setdefault(partial_hostname.lower(), partial_hostname)
+
+    # returns the partial hostname which matches the full hostname, or None if there is no match
+    def match(self, full_hostname):
+        full_hostname = full_hostname.lower()
+        partial_hostname = self.partial_hostnames.get(full_hostname)
+        if partial_hostname is None:
+            partial_hostname = self.partial_hostnames.get(get_parent_hostname(full_hostname))
+        return partial_hostname
+
+    def __contains__(self, full_hostname):
+        return self.match(full_hostname) is not None
+
+    def __len__(self):
+        return len(self.partial_hostnames)
+
+
 def dicts_merge(*dicts):
     res = {}
     for d in dicts:
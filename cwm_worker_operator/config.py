@@ -11,23 +11,108 @@ _default_redis_port = int(os.environ.get("REDIS_PORT") or "6379")
 _default_redis_pool_max_connections = int(os.environ.get("REDIS_POOL_MAX_CONNECTIONS") or "200")
 _default_redis_pool_timeout = int(os.environ.get("REDIS_POOL_TIMEOUT") or "5")
 
+# keep a redis set of the key suffixes for each operator-owned prefix key, so that listing doesn't need to scan the keyspace
+# before enabling on existing data, run the `cwm-worker-operator backfill-prefix-indexes` command
+DOMAINS_CONFIG_PREFIX_INDEX_ENABLED = os.environ.get("DOMAINS_CONFIG_PREFIX_INDEX_ENABLED") == "yes"
+# number of keys to request per SCAN / SSCAN call and per index verification batch
+DOMAINS_CONFIG_SCAN_COUNT = int(os.environ.get("DOMAINS_CONFIG_SCAN_COUNT") or "1000")
+# store the internal worker keys which are marked with in_worker_hash as fields of a single redis hash per worker (worker:<worker_id>)
+# while enabled, values are read from the hash with fallback to the legacy string keys, and writes move the values to the hash
+# to enable on existing data: run `cwm-worker-operator backfill-prefix-indexes`, enable, then run `cwm-worker-operator migrate-worker-hashes`
+# these keys are always indexed, because hash fields can't be found by scanning the keyspace
+DOMAINS_CONFIG_WORKER_HASH_ENABLED = os.environ.get("DOMAINS_CONFIG_WORKER_HASH_ENABLED") == "yes"
+# keep a redis set of the request hostnames of each worker, so that getting the worker hostnames doesn't need to list all hostname keys
+# before enabling on existing data, run the `cwm-worker-operator backfill-worker-request-hostnames` command
+DOMAINS_CONFIG_WORKER_REQUEST_HOSTNAMES_ENABLED = os.environ.get("DOMAINS_CONFIG_WORKER_REQUEST_HOSTNAMES_ENABLED") == "yes"
+# keep a redis sorted set of the known worker ids, namespaces and hostnames, used for prefix search in the web ui
+# before enabling on existing data, run the `cwm-worker-operator backfill-search-index` command
+DOMAINS_CONFIG_SEARCH_INDEX_ENABLED = os.environ.get("DOMAINS_CONFIG_SEARCH_INDEX_ENABLED") == "yes"
+# max number of results returned by a search
+DOMAINS_CONFIG_SEARCH_MAX_RESULTS = int(os.environ.get("DOMAINS_CONFIG_SEARCH_MAX_RESULTS") or "100")
+# store the deployment api metrics as a single redis hash per namespace (deploymentid:minio-metrics:<namespace_name>)
+# instead of a string key per metric (deploymentid:minio-metrics:<namespace_name>:<metric>)
+# while enabled, metrics are read from the hash with fallback to the legacy string keys if the hash doesn't exist
+# to enable on existing data: enable, then run `cwm-worker-operator migrate-deployment-api-metrics`
+DEPLOYMENT_API_METRICS_HASH_ENABLED = os.environ.get("DEPLOYMENT_API_METRICS_HASH_ENABLED") == "yes"
+# set transient keys which declare a TTL policy (e.g. hostname errors) with an expiry, so that redis expires them
+# instead of the redis_cleaner, which then only handles the conditional cases (failed deployments of unavailable workers)
+# to enable on existing data: enable, then run `cwm-worker-operator apply-keys-ttl`
+DOMAINS_CONFIG_KEYS_TTL_ENABLED = os.environ.get("DOMAINS_CONFIG_KEYS_TTL_ENABLED") == "yes"
+# maintain counters of the number of keys in each deployment flow stage (e.g. hostnames waiting for initialization, workers ready for deployment)
+# the counters are updated atomically with the keys modifications and are exposed as a gauge by the prometheus metrics of each daemon
+# the redis_cleaner reconciles the counters with the keys on each iteration, to correct drift due to keys which are not modified via the operator
+DOMAINS_CONFIG_FLOW_COUNTERS_ENABLED = os.environ.get("DOMAINS_CONFIG_FLOW_COUNTERS_ENABLED") == "yes"
+# publish hostname availability / error events on a pub/sub channel of the ingress redis, so that the ingress doesn't need to poll the hostname keys
+# events are published after the keys were modified, see hostname_events for the message format and a reference subscriber
+DOMAINS_CONFIG_HOSTNAME_EVENTS_ENABLED = os.environ.get("DOMAINS_CONFIG_HOSTNAME_EVENTS_ENABLED") == "yes"
+DOMAINS_CONFIG_HOSTNAME_EVENTS_CHANNEL = os.environ.get("DOMAINS_CONFIG_HOSTNAME_EVENTS_CHANNEL") or "hostname:events"
+# max number of parsed volume configs to keep in an in-process LRU cache, 0 disables the cache
+VOLUME_CONFIG_CACHE_MAX_SIZE = int(os.environ.get("VOLUME_CONFIG_CACHE_MAX_SIZE") or "0")
+# how cached volume configs are invalidated when volume config keys are modified:
+#   keyspace - using redis keyspace notifications (the operator tries to enable notify-keyspace-events K$ on the internal redis)
+#   version - using a version counter which is incremented on every volume config modification made by the operator
+VOLUME_CONFIG_CACHE_INVALIDATION = os.environ.get("VOLUME_CONFIG_CACHE_INVALIDATION") or "keyspace"
+# max time to keep a volume config in the cache, limits staleness in case an invalidation was missed
+VOLUME_CONFIG_CACHE_TTL_SECONDS = float(os.environ.get("VOLUME_CONFIG_CACHE_TTL_SECONDS") or "60")
+# time to cache the keys summary of all workers which is shown in the web ui index, 0 disables the cache
+# an expired summary is returned while it's refreshed in the background, unless it expired more than this time ago
+KEYS_SUMMARY_CACHE_TTL_SECONDS = float(os.environ.get("KEYS_SUMMARY_CACHE_TTL_SECONDS") or "0")
+# sampling of the keys memory report (MEMORY USAGE and TTL of each sampled key)
+# the first KEYS_MEMORY_REPORT_MIN_SAMPLES keys of each key are sampled, then keys are sampled with KEYS_MEMORY_REPORT_SAMPLE_RATE probability
+KEYS_MEMORY_REPORT_SAMPLE_RATE = float(os.environ.get("KEYS_MEMORY_REPORT_SAMPLE_RATE") or "0.1")
+KEYS_MEMORY_REPORT_MIN_SAMPLES = int(os.environ.get("KEYS_MEMORY_REPORT_MIN_SAMPLES") or "100")
+# codec used to encode new values of the internal json keys (e.g. volume configs), existing values are decoded with any codec:
+#   json - legacy plain json
+#   compact - a version byte followed by compact json, compressed with zlib if larger than DOMAINS_CONFIG_JSON_CODEC_ZLIB_MIN_BYTES
+DOMAINS_CONFIG_JSON_CODEC = os.environ.get("DOMAINS_CONFIG_JSON_CODEC") or "json"
+# min size in bytes of compact json values to compress with zlib, 0 disables compression
+DOMAINS_CONFIG_JSON_CODEC_ZLIB_MIN_BYTES = int(os.environ.get("DOMAINS_CONFIG_JSON_CODEC_ZLIB_MIN_BYTES") or "512")
+DOMAINS_CONFIG_JSON_CODEC_ZLIB_LEVEL = int(os.environ.get("DOMAINS_CONFIG_JSON_CODEC_ZLIB_LEVEL") or "6")
+# store new datetime values of the internal keys as integer epoch milliseconds instead of formatted strings
+# existing values in any of the legacy formats are still parsed, see common.parse_datetime
+DOMAINS_CONFIG_DATETIME_EPOCH_MS = os.environ.get("DOMAINS_CONFIG_DATETIME_EPOCH_MS") == "yes"
+
+# use redis cluster clients, the host / port of each redis pool are used as the cluster startup node and the db is ignored
+# worker and hostname keys are named with a hash tag (e.g. worker:health:{worker_id}) so that all keys of a worker / hostname are in the same slot
+# apps which share the ingress redis (cwm-worker-ingress) must use the same key names
+# the redis pools should use different clusters, or a single cluster if the keys of the pools don't overlap
+REDIS_CLUSTER_ENABLED = os.environ.get("REDIS_CLUSTER_ENABLED") == "yes"
+
+# prometheus metrics of redis connection pool checkout latency and of redis commands per pool and key (e.g. hostname_error, volume_config)
+# commands which are not executed via a specific key are labeled with key "other", not supported in redis cluster mode
+REDIS_METRICS_ENABLED = os.environ.get("REDIS_METRICS_ENABLED") == "yes"
+
+# optional read replica host of each redis pool (e.g. INGRESS_REDIS_READ_REPLICA_HOST), not supported in redis cluster mode
+# scans / iterations of keys, keys summaries and web ui reads use the replica, all writes and reads of specific keys use the primary
+# the replica is used only while its link to the primary is up and the last interaction with the primary was at most
+# REDIS_READ_REPLICA_MAX_LAG_SECONDS ago (primaries ping idle replicas every 10 seconds by default), otherwise reads fall back to the primary
+# the replication state is checked at most once every REDIS_READ_REPLICA_CHECK_INTERVAL_SECONDS
+REDIS_READ_REPLICA_MAX_LAG_SECONDS = int(os.environ.get("REDIS_READ_REPLICA_MAX_LAG_SECONDS") or "15")
+REDIS_READ_REPLICA_CHECK_INTERVAL_SECONDS = int(os.environ.get("REDIS_READ_REPLICA_CHECK_INTERVAL_SECONDS") or "5")
+
 INGRESS_REDIS_HOST = os.environ.get("INGRESS_REDIS_HOST") or _default_redis_host
 INGRESS_REDIS_PORT = int(os.environ.get("INGRESS_REDIS_PORT") or _default_redis_port)
 INGRESS_REDIS_POOL_MAX_CONNECTIONS = int(os.environ.get("INGRESS_REDIS_POOL_MAX_CONNECTIONS") or _default_redis_pool_max_connections)
 INGRESS_REDIS_POOL_TIMEOUT = int(os.environ.get("INGRESS_REDIS_POOL_TIMEOUT") or _default_redis_pool_timeout)
 INGRESS_REDIS_DB = int(os.environ.get("INGRESS_REDIS_DB", "0"))
+INGRESS_REDIS_READ_REPLICA_HOST = os.environ.get("INGRESS_REDIS_READ_REPLICA_HOST")
+INGRESS_REDIS_READ_REPLICA_PORT = int(os.environ.get("INGRESS_REDIS_READ_REPLICA_PORT") or INGRESS_REDIS_PORT)
 
 INTERNAL_REDIS_HOST = os.environ.get("INTERNAL_REDIS_HOST") or _default_redis_host
 INTERNAL_REDIS_PORT = int(os.environ.get("INTERNAL_REDIS_PORT") or _default_redis_port)
 INTERNAL_REDIS_POOL_MAX_CONNECTIONS = int(os.environ.get("INTERNAL_REDIS_POOL_MAX_CONNECTIONS") or _default_redis_pool_max_connections)
 INTERNAL_REDIS_POOL_TIMEOUT = int(os.environ.get("INTERNAL_REDIS_POOL_TIMEOUT") or _default_redis_pool_timeout)
 INTERNAL_REDIS_DB = int(os.environ.get("INTERNAL_REDIS_DB", "1"))
+INTERNAL_REDIS_READ_REPLICA_HOST = os.environ.get("INTERNAL_REDIS_READ_REPLICA_HOST")
+INTERNAL_REDIS_READ_REPLICA_PORT = int(os.environ.get("INTERNAL_REDIS_READ_REPLICA_PORT") or INTERNAL_REDIS_PORT)
 
 METRICS_REDIS_HOST = os.environ.get("METRICS_REDIS_HOST") or _default_redis_host
 METRICS_REDIS_PORT = int(os.environ.get("METRICS_REDIS_PORT") or _default_redis_port)
 METRICS_REDIS_POOL_MAX_CONNECTIONS = int(os.environ.get("METRICS_REDIS_POOL_MAX_CONNECTIONS") or _default_redis_pool_max_connections)
 METRICS_REDIS_POOL_TIMEOUT = int(os.environ.get("METRICS_REDIS_POOL_TIMEOUT") or _default_redis_pool_timeout)
 METRICS_REDIS_DB = int(os.environ.get("METRICS_REDIS_DB", "2"))
+METRICS_REDIS_READ_REPLICA_HOST = os.environ.get("METRICS_REDIS_READ_REPLICA_HOST")
+METRICS_REDIS_READ_REPLICA_PORT = int(os.environ.get("METRICS_REDIS_READ_REPLICA_PORT") or METRICS_REDIS_PORT)
 
 CWM_API_URL = os.environ["CWM_API_URL"]
 CWM_API_KEY = os.environ["CWM_API_KEY"]
@@ -40,14 +125,44 @@ VOLUME_CONFIG_OVERRIDE_URL = os.environ.get('VOLUME_CONFIG_OVERRIDE_URL')
 VOLUME_CONFIG_OVERRIDE_USERNAME = os.environ.get('VOLUME_CONFIG_OVERRIDE_USERNAME')
 VOLUME_CONFIG_OVERRIDE_PASSWORD = os.environ.get('VOLUME_CONFIG_OVERRIDE_PASSWORD')
 
+# number of workers / hostnames which the initializer, throttler and redis_cleaner process concurrently, using asyncio
+# redis commands run in a thread pool of this size, so it should not exceed the redis pools max connections
+# 0 disables concurrency, workers / hostnames are processed sequentially
+DAEMONS_ASYNC_CONCURRENCY = int(os.environ.get("DAEMONS_ASYNC_CONCURRENCY") or "0")
+
 INITIALIZER_SLEEP_TIME_BETWEEN_ITERATIONS_SECONDS = float(os.environ.get("INITIALIZER_SLEEP_TIME_BETWEEN_ITERATIONS_SECONDS") or "0.001")
+# wait for redis keyspace notifications on the initializer keys instead of polling every INITIALIZER_SLEEP_TIME_BETWEEN_ITERATIONS_SECONDS
+# the operator tries to enable keyspace notifications for string commands (notify-keyspace-events K$) on the ingress and internal redis
+INITIALIZER_WAKEUP_ON_KEYSPACE_NOTIFICATIONS = os.environ.get("INITIALIZER_WAKEUP_ON_KEYSPACE_NOTIFICATIONS") == "yes"
+# when waiting for keyspace notifications, run an iteration anyway after this time, in case notifications were missed
+INITIALIZER_WAKEUP_MAX_SLEEP_SECONDS = float(os.environ.get("INITIALIZER_WAKEUP_MAX_SLEEP_SECONDS") or "5.0")
 
 DEPLOYER_WAIT_DEPLOYMENT_READY_MAX_SECONDS = float(os.environ.get("DEPLOYER_WAIT_DEPLOYMENT_READY_MAX_SECONDS") or "10.0")
 DEPLOYER_WAIT_DEPLOYMENT_ERROR_MAX_SECONDS = float(os.environ.get("DEPLOYER_WAIT_DEPLOYMENT_ERROR_MAX_SECONDS") or "2.0")
 DEPLOYER_MAX_ATTEMPT_NUMBERS = int(os.environ.get('DEPLOYER_MAX_ATTEMPT_NUMBERS') or "10")
 DEPLOYER_SLEEP_TIME_BETWEEN_ITERATIONS_SECONDS = float(os.environ.get("DEPLOYER_SLEEP_TIME_BETWEEN_ITERATIONS_SECONDS") or "0.01")
 
+# hand off worker ids from initializer to deployer to waiter using reliable redis list queues, instead of listing the flow keys on each iteration
+# the flow keys remain the source of truth, the queues are recovered and backfilled from them when the deployer / waiter start
+# requires redis >= 6.2 (LMOVE / BLMOVE)
+DEPLOYMENT_FLOW_QUEUES_ENABLED = os.environ.get("DEPLOYMENT_FLOW_QUEUES_ENABLED") == "yes"
+# when a queue is empty, the deployer / waiter block up to this time waiting for new items
+DEPLOYMENT_FLOW_QUEUES_BLOCK_SECONDS = float(os.environ.get("DEPLOYMENT_FLOW_QUEUES_BLOCK_SECONDS") or "1.0")
+# worker ids which are still pending at the end of an iteration (e.g. waiting for deployment complete) are queued again after this delay
+DEPLOYMENT_FLOW_QUEUES_RETRY_DELAY_SECONDS = float(os.environ.get("DEPLOYMENT_FLOW_QUEUES_RETRY_DELAY_SECONDS") or "0.5")
+# initializer / deployer iterations load the flow keys once at the start of the iteration, using pipelined scans
+# instead of checking the flow keys of each worker / hostname, keys modified by the iteration itself are checked in redis
+DEPLOYMENT_FLOW_SNAPSHOT_ENABLED = os.environ.get("DEPLOYMENT_FLOW_SNAPSHOT_ENABLED") == "yes"
+
 WORKER_ERROR_MAX_ATTEMPTS = int(os.environ.get("WORKER_ERROR_MAX_ATTEMPTS", "5"))
+# hostnames which failed to get a volume config for WORKER_ERROR_MAX_ATTEMPTS are denied in ingress redis (hostname:deny:<hostname>)
+# while a hostname is denied the initializer doesn't call the cwm api for it, the ingress may reject it immediately
+HOSTNAME_DENY_ENABLED = os.environ.get("HOSTNAME_DENY_ENABLED") == "yes"
+# deny duration starts from min seconds and doubles on each deny of the same hostname, up to max seconds
+HOSTNAME_DENY_MIN_SECONDS = int(os.environ.get("HOSTNAME_DENY_MIN_SECONDS") or "60")
+HOSTNAME_DENY_MAX_SECONDS = int(os.environ.get("HOSTNAME_DENY_MAX_SECONDS") or "86400")
+# the number of denies is forgotten if the hostname wasn't denied again for this time after the deny expired
+HOSTNAME_DENY_DECAY_SECONDS = int(os.environ.get("HOSTNAME_DENY_DECAY_SECONDS") or "86400")
 
 WAITER_VERIFY_WORKER_ACCESS = (os.environ.get("WAITER_VERIFY_WORKER_ACCESS") or "yes") == "yes"
 WAITER_MAX_PARALLEL_DEPLOY_PROCESSES = int(os.environ.get('WAITER_MAX_PARALLEL_DEPLOY_PROCESSES') or '2')
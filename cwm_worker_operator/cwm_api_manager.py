@@ -26,8 +26,7 @@ class CwmApiManager:
             raise Exception("Failed to send agg metrics to CWM: {} {}".format(res.status_code, res.text))
 
     def get_utc_timestamp(self, t):
-        from cwm_worker_operator.metrics_updater import DATEFORMAT
-        return common.strptime(t, DATEFORMAT).strftime(CWM_DATEFORMAT)
+        return common.parse_datetime(t).strftime(CWM_DATEFORMAT)
 
     def get_gib_measurement(self, m, key):
         try:
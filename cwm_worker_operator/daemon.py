@@ -3,7 +3,9 @@ import signal
 
 import prometheus_client
 
+from cwm_worker_operator import config
 from cwm_worker_operator import logs
+from cwm_worker_operator import metrics
 from cwm_worker_operator.domains_config import DomainsConfig
 from cwm_worker_operator.deployments_manager import DeploymentsManager
 
@@ -13,7 +15,8 @@ class Daemon:
     def __init__(self, name, sleep_time_between_iterations_seconds,
                  metrics_class=None, domains_config=None, metrics=None, run_single_iteration_callback=None,
                  prometheus_metrics_port=None, run_single_iteration_extra_kwargs=None,
-                 deployments_manager=None, run_initialization_callback=None):
+                 deployments_manager=None, run_initialization_callback=None,
+                 wakeup_key_names=None, wakeup_max_sleep_seconds=None):
         self.name = name
         self.metrics = metrics if metrics else (metrics_class() if metrics_class else None)
         self.domains_config = domains_config if domains_config else DomainsConfig()
@@ -24,12 +27,19 @@ class Daemon:
         self.run_single_iteration_extra_kwargs = {} if run_single_iteration_extra_kwargs is None else run_single_iteration_extra_kwargs
         self.deployments_manager = deployments_manager if deployments_manager else DeploymentsManager()
         self.terminate_requested = False
+        # if wakeup key names are set, instead of sleeping between iterations, the daemon waits for keyspace notifications
+        # on these keys, up to wakeup_max_sleep_seconds
+        self.wakeup_key_names = wakeup_key_names
+        self.wakeup_max_sleep_seconds = wakeup_max_sleep_seconds
+        self.wakeup_event = None
 
     def start(self, once=False, with_prometheus=None):
         if with_prometheus is None:
             with_prometheus = bool(self.prometheus_metrics_port)
         with logs.alert_exception_catcher(self.domains_config, daemon=self.name):
             if with_prometheus:
+                if config.DOMAINS_CONFIG_FLOW_COUNTERS_ENABLED:
+                    metrics.FlowCountersCollector.register(self.domains_config)
                 prometheus_client.start_http_server(self.prometheus_metrics_port)
             if self.run_initialization_callback:
                 self.run_initialization_callback(
@@ -46,17 +56,40 @@ class Daemon:
     def on_sigterm(self, *args, **kwargs):
         logs.debug_info(f"SIGTERM received for daemon {self.name}")
         self.terminate_requested = True
+        if self.wakeup_event is not None:
+            self.wakeup_event.set()
 
     def start_main_loop(self):
         signal.signal(signal.SIGTERM, self.on_sigterm)
-        while not self.terminate_requested:
-            self.run_single_iteration(**self.run_single_iteration_extra_kwargs)
-            if self.terminate_requested:
-                break
-            time.sleep(self.sleep_time_between_iterations_seconds)
+        if self.wakeup_key_names:
+            self.start_wakeup_main_loop()
+        else:
+            while not self.terminate_requested:
+                self.run_single_iteration(**self.run_single_iteration_extra_kwargs)
+                if self.terminate_requested:
+                    break
+                time.sleep(self.sleep_time_between_iterations_seconds)
         assert self.terminate_requested, f'Unexpected termination of daemon {self.name}'
         logs.debug_info(f"Graceful termination of daemon {self.name}")
 
+    def start_wakeup_main_loop(self):
+        wakeup_keys = [getattr(self.domains_config.keys, key_name) for key_name in self.wakeup_key_names]
+        with self.domains_config.keyspace_notifications_event(wakeup_keys) as wakeup_event:
+            self.wakeup_event = wakeup_event
+            try:
+                while not self.terminate_requested:
+                    # event is cleared before the iteration, so notifications received during the iteration
+                    # cause the next iteration to start immediately
+                    wakeup_event.clear()
+                    self.run_single_iteration(**self.run_single_iteration_extra_kwargs)
+                    if self.terminate_requested:
+                        break
+                    wakeup_event.wait(self.wakeup_max_sleep_seconds)
+                    if not self.terminate_requested:
+                        time.sleep(self.sleep_time_between_iterations_seconds)
+            finally:
+                self.wakeup_event = None
+
     def run_single_iteration(self, **kwargs):
         self.run_single_iteration_callback(
             domains_config=self.domains_config,
@@ -115,7 +115,7 @@ def deploy_worker_preprocess(worker_id: str, domains_config: domains_config_modu
             logs.debug_info("Failed to get volume config", **log_kwargs)
             flow_manager.set_worker_error(worker_id, domains_config.WORKER_ERROR_FAILED_TO_GET_VOLUME_CONFIG)
             return None, None, None, None
-        if not force and not flow_manager.is_valid_worker_hostnames_for_deployment(worker_id, volume_config.hostnames):
+        if not force and not flow_manager.is_valid_worker_hostnames_for_deployment(worker_id, volume_config.hostnames, volume_config.get_hostnames_index()):
             if not dry_run or not debug:
                 logs.debug_info("flow_manager says that worker_hostnames are not valid for deployment, sorry", **log_kwargs)
                 return namespace_name, None, None, None
@@ -281,17 +281,23 @@ class DeployerMultiprocessor(Multiprocessor):
         return worker_id
 
 
-def run_single_iteration(domains_config: domains_config_module.DomainsConfig, metrics, deployments_manager, extra_minio_extra_configs=None, is_async=True, **_):
+def run_initialization(domains_config: domains_config_module.DomainsConfig, **_):
+    if config.DEPLOYMENT_FLOW_QUEUES_ENABLED:
+        DeployerDeploymentFlowManager(domains_config).recover_queue()
+
+
+def run_single_iteration(domains_config: domains_config_module.DomainsConfig, metrics, deployments_manager, extra_minio_extra_configs=None, is_async=True, queue_block_seconds=None, **_):
     multiprocessor = DeployerMultiprocessor(config.DEPLOYER_MAX_PARALLEL_DEPLOY_PROCESSES if is_async else 1)
-    flow_manager = DeployerDeploymentFlowManager(domains_config)
+    flow_manager = DeployerDeploymentFlowManager(domains_config, with_snapshot=True)
     preprocess_results = {}
-    for worker_id in flow_manager.iterate_worker_ids_ready_for_deployment():
+    for worker_id in flow_manager.iterate_worker_ids_ready_for_deployment(queue_block_seconds):
         preprocess_results[worker_id] = deploy_worker_preprocess(
             worker_id, domains_config, metrics, flow_manager, False, False, extra_minio_extra_configs, deployments_manager)
     for worker_id, preprocess_result in preprocess_results.items():
         multiprocessor.process(worker_id, extra_minio_extra_configs, domains_config, metrics, deployments_manager,
                                flow_manager, preprocess_result)
     multiprocessor.finalize()
+    flow_manager.complete_iteration()
 
 
 def start_daemon(once=False, with_prometheus=True, deployer_metrics=None, domains_config=None, extra_minio_extra_configs=None):
@@ -304,8 +310,12 @@ def start_daemon(once=False, with_prometheus=True, deployer_metrics=None, domain
         domains_config=domains_config,
         metrics=deployer_metrics,
         run_single_iteration_callback=run_single_iteration,
+        run_initialization_callback=run_initialization,
         prometheus_metrics_port=config.PROMETHEUS_METRICS_PORT_DEPLOYER,
-        run_single_iteration_extra_kwargs={'extra_minio_extra_configs': extra_minio_extra_configs},
+        run_single_iteration_extra_kwargs={
+            'extra_minio_extra_configs': extra_minio_extra_configs,
+            'queue_block_seconds': config.DEPLOYMENT_FLOW_QUEUES_BLOCK_SECONDS
+        },
         deployments_manager=deployments_manager
     ).start(
         once=once,
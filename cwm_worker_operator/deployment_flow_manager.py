@@ -1,3 +1,5 @@
+import threading
+
 from cwm_worker_operator import config
 from cwm_worker_operator import common
 from cwm_worker_operator.domains_config import DomainsConfig
@@ -7,6 +9,7 @@ INITIALIZER_WORKER_READY_FOR_DEPLOYMENT = 'INITIALIZER_WORKER_READY_FOR_DEPLOYME
 INITIALIZER_HOSTNAME_ERROR_MAX_ATTEMPTS = 'INITIALIZER_HOSTNAME_ERROR_MAX_ATTEMPTS'
 INITIALIZER_HOSTNAME_ERROR_RETRY = 'INITIALIZER_HOSTNAME_ERROR_RETRY'
 INITIALIZER_HOSTNAME_ERROR_NO_RETRY = 'INITIALIZER_HOSTNAME_ERROR_NO_RETRY'
+INITIALIZER_HOSTNAME_DENIED = 'INITIALIZER_HOSTNAME_DENIED'
 INITIALIZER_WORKER_FORCE_DELETE = 'INITIALIZER_WORKER_FORCE_DELETE'
 DEPLOYER_WORKER_ERROR = 'DEPLOYER_WORKER_ERROR'
 DEPLOYER_WAIT_RETRY_DEPLOYMENT = 'DEPLOYER_WAIT_RETRY_DEPLOYMENT'
@@ -18,67 +21,191 @@ WAITER_WORKER_AVAILABLE = 'WAITER_WORKER_AVAILABLE'
 
 def set_last_action(deployment_flow_manager, action, worker_id=None, hostname=None):
     assert worker_id or hostname, 'must specify either worker_id or hostname (or both)'
-    if worker_id:
-        deployment_flow_manager.domains_config.keys.worker_last_deployment_flow_action.set(worker_id, action)
-        deployment_flow_manager.domains_config.keys.worker_last_deployment_flow_time.set(worker_id)
-        for worker_hostname in deployment_flow_manager.domains_config.iterate_worker_hostnames(worker_id):
-            deployment_flow_manager.domains_config.keys.hostname_last_deployment_flow_action.set(worker_hostname, action)
-            deployment_flow_manager.domains_config.keys.hostname_last_deployment_flow_time.set(worker_hostname)
-            deployment_flow_manager.domains_config.keys.hostname_last_deployment_flow_worker_id.set(worker_hostname, worker_id)
-    if hostname:
-        deployment_flow_manager.domains_config.keys.hostname_last_deployment_flow_action.set(hostname, action)
-        deployment_flow_manager.domains_config.keys.hostname_last_deployment_flow_time.set(hostname)
+    domains_config = deployment_flow_manager.domains_config
+    hostnames = list(domains_config.iterate_worker_hostnames(worker_id)) if worker_id else []
+    if hostname and hostname not in hostnames:
+        hostnames.append(hostname)
+    now = common.now()
+    with domains_config.pipeline() as pipeline:
         if worker_id:
-            deployment_flow_manager.domains_config.keys.hostname_last_deployment_flow_worker_id.set(hostname, worker_id)
+            domains_config.keys.worker_last_deployment_flow_action.set_many({worker_id: action}, pipeline=pipeline)
+            domains_config.keys.worker_last_deployment_flow_time.set_many({worker_id: now}, pipeline=pipeline)
+            domains_config.keys.hostname_last_deployment_flow_worker_id.set_many({h: worker_id for h in hostnames}, pipeline=pipeline)
+        domains_config.keys.hostname_last_deployment_flow_action.set_many({h: action for h in hostnames}, pipeline=pipeline)
+        domains_config.keys.hostname_last_deployment_flow_time.set_many({h: now for h in hostnames}, pipeline=pipeline)
 
 
-class InitializerDeploymentFlowManager:
+def flow_key_exists(deployment_flow_manager, key_name, param):
+    if deployment_flow_manager.snapshot:
+        return deployment_flow_manager.snapshot.exists(key_name, param)
+    else:
+        return getattr(deployment_flow_manager.domains_config.keys, key_name).exists(param)
+
+
+# snapshot is used only by daemon iterations, which check the flow keys of all the workers / hostnames
+def get_flow_snapshot(domains_config, with_snapshot):
+    return FlowSnapshot(domains_config) if with_snapshot and config.DEPLOYMENT_FLOW_SNAPSHOT_ENABLED else None
+
+
+# flow keys of a single iteration, loaded once on first use, so that checking keys of a worker / hostname doesn't require redis commands
+# keys which the iteration modifies should be invalidated, following checks of invalidated workers / hostnames are done in redis
+class FlowSnapshot:
+
+    WORKER_KEY_NAMES = ['worker_ready_for_deployment', 'worker_waiting_for_deployment_complete', 'worker_force_update', 'worker_force_delete']
+    HOSTNAME_KEY_NAMES = ['hostname_initialize']
 
     def __init__(self, domains_config: DomainsConfig):
+        self.domains_config = domains_config
+        self.lock = threading.Lock()
+        self.suffixes = None
+        # lower case partial hostname -> hostnames waiting for initialization which match it, see common.is_hostnames_match
+        self.hostname_initialize_matches = None
+        self.invalidated_worker_ids = set()
+        self.invalidated_hostnames = set()
+
+    def load(self):
+        with self.lock:
+            if self.suffixes is None:
+                suffixes = self.domains_config.get_prefix_keys_suffixes(self.WORKER_KEY_NAMES + self.HOSTNAME_KEY_NAMES)
+                self.hostname_initialize_matches = {}
+                for hostname in suffixes['hostname_initialize']:
+                    self.hostname_initialize_matches.setdefault(hostname.lower(), set()).add(hostname)
+                    self.hostname_initialize_matches.setdefault(common.get_parent_hostname(hostname).lower(), set()).add(hostname)
+                self.suffixes = suffixes
+
+    # returns the suffixes of the key when the snapshot was loaded
+    def get_suffixes(self, key_name):
+        self.load()
+        return list(self.suffixes[key_name])
+
+    def exists(self, key_name, param):
+        self.load()
+        invalidated = self.invalidated_hostnames if key_name in self.HOSTNAME_KEY_NAMES else self.invalidated_worker_ids
+        if param in invalidated:
+            return getattr(self.domains_config.keys, key_name).exists(param)
+        return param in self.suffixes[key_name]
+
+    # returns True if any of the hostnames waiting for initialization matches one of the given partial hostnames
+    def is_hostname_initialize_match(self, hostnames):
+        self.load()
+        for hostname in hostnames:
+            for request_hostname in self.hostname_initialize_matches.get(hostname.lower(), ()):
+                if self.exists('hostname_initialize', request_hostname):
+                    return True
+        return False
+
+    def invalidate(self, worker_id=None, hostname=None):
+        if worker_id:
+            self.invalidated_worker_ids.add(worker_id)
+        if hostname:
+            self.invalidated_hostnames.add(hostname)
+
+
+class InitializerDeploymentFlowManager:
+
+    def __init__(self, domains_config: DomainsConfig, with_snapshot=False):
         self.domains_config = domains_config
         self.hostnames_forced_update = set()
+        self.snapshot = get_flow_snapshot(domains_config, with_snapshot)
+
+    def get_worker_ids_force_update(self):
+        if self.snapshot:
+            return self.snapshot.get_suffixes('worker_force_update')
+        else:
+            return self.domains_config.get_worker_ids_force_update()
+
+    def get_hostnames_waiting_for_initialization(self):
+        if self.snapshot:
+            return self.snapshot.get_suffixes('hostname_initialize')
+        else:
+            return self.domains_config.get_hostnames_waiting_for_initialization()
+
+    def get_worker_force_delete(self, worker_id):
+        if self.snapshot and not self.snapshot.exists('worker_force_delete', worker_id):
+            return None
+        else:
+            return self.domains_config.get_worker_force_delete(worker_id)
 
     def iterate_volume_configs_forced_update(self, metrics):
-        for worker_id in self.domains_config.get_worker_ids_force_update():
-            volume_config = self.domains_config.get_cwm_api_volume_config(worker_id=worker_id, force_update=True, metrics=metrics)
-            for hostname in volume_config.hostnames:
-                self.hostnames_forced_update.add(hostname)
-            if self.domains_config.keys.worker_ready_for_deployment.exists(worker_id):
-                # worker is already ready for deployment, no need to initialize
-                continue
-            if self.domains_config.keys.worker_waiting_for_deployment_complete.exists(worker_id):
-                # worker is already waiting for deployment to complete, no need to initialize
-                continue
-            yield volume_config, worker_id
+        for worker_id in self.get_worker_ids_force_update():
+            volume_config = self.get_volume_config_forced_update(worker_id, metrics)
+            if volume_config is not None:
+                yield volume_config, worker_id
+
+    # returns the volume config of a forced update worker, or None if the worker doesn't need to be initialized
+    def get_volume_config_forced_update(self, worker_id, metrics):
+        volume_config = self.domains_config.get_cwm_api_volume_config(worker_id=worker_id, force_update=True, metrics=metrics)
+        for hostname in volume_config.hostnames:
+            self.hostnames_forced_update.add(hostname)
+        if flow_key_exists(self, 'worker_ready_for_deployment', worker_id):
+            # worker is already ready for deployment, no need to initialize
+            return None
+        if flow_key_exists(self, 'worker_waiting_for_deployment_complete', worker_id):
+            # worker is already waiting for deployment to complete, no need to initialize
+            return None
+        return volume_config
 
     def iterate_volume_config_hostnames_waiting_for_initialization(self, metrics):
-        for hostname in self.domains_config.get_hostnames_waiting_for_initialization():
-            if hostname in self.hostnames_forced_update:
-                # hostname was already handled in the forced updates
-                continue
-            volume_config = self.domains_config.get_cwm_api_volume_config(hostname=hostname, metrics=metrics)
-            worker_id = volume_config.id
-            if not worker_id or volume_config._error:
-                yield volume_config, hostname, True
-            elif (
-                self.domains_config.keys.worker_ready_for_deployment.exists(worker_id)
-                or self.domains_config.keys.worker_waiting_for_deployment_complete.exists(worker_id)
-                or self.domains_config.keys.worker_force_update.exists(worker_id)
-            ):
-                # worker is already handled in other flow steps
-                continue
-            else:
-                yield volume_config, hostname, False
+        for hostname in self.get_hostnames_waiting_for_initialization():
+            res = self.get_volume_config_hostname_waiting_for_initialization(hostname, metrics)
+            if res is not None:
+                volume_config, failed_to_get_volume_config = res
+                yield volume_config, hostname, failed_to_get_volume_config
+
+    # returns a tuple of the volume config and whether it failed to get the volume config
+    # or None if the hostname doesn't need to be initialized
+    def get_volume_config_hostname_waiting_for_initialization(self, hostname, metrics):
+        volume_config = self.get_hostname_volume_config(hostname, metrics)
+        if volume_config is None:
+            return None
+        return self.check_hostname_volume_config(volume_config)
+
+    # returns the volume config of a hostname waiting for initialization from the cwm api
+    # or None if the hostname doesn't need to be initialized
+    def get_hostname_volume_config(self, hostname, metrics):
+        if hostname in self.hostnames_forced_update:
+            # hostname was already handled in the forced updates
+            return None
+        if config.HOSTNAME_DENY_ENABLED and self.domains_config.is_hostname_denied(hostname):
+            # hostname failed to get a volume config too many times, cwm api is not called until the deny expires
+            self.set_hostname_denied(hostname)
+            if metrics:
+                metrics.hostname_denied(hostname, common.now())
+            return None
+        return self.domains_config.get_cwm_api_volume_config(hostname=hostname, metrics=metrics)
+
+    # checks the flow keys of the worker of a hostname volume config, see get_volume_config_hostname_waiting_for_initialization
+    def check_hostname_volume_config(self, volume_config):
+        worker_id = volume_config.id
+        if not worker_id or volume_config._error:
+            return volume_config, True
+        elif (
+            flow_key_exists(self, 'worker_ready_for_deployment', worker_id)
+            or flow_key_exists(self, 'worker_waiting_for_deployment_complete', worker_id)
+            or flow_key_exists(self, 'worker_force_update', worker_id)
+        ):
+            # worker is already handled in other flow steps
+            return None
+        else:
+            return volume_config, False
+
+    def invalidate(self, worker_id=None, hostname=None):
+        if self.snapshot:
+            self.snapshot.invalidate(worker_id=worker_id, hostname=hostname)
 
     def set_worker_ready_for_deployment(self, worker_id):
+        self.invalidate(worker_id=worker_id)
         self.domains_config.set_worker_ready_for_deployment(worker_id)
         set_last_action(self, INITIALIZER_WORKER_READY_FOR_DEPLOYMENT, worker_id=worker_id)
 
     def set_hostname_error(self, hostname, error_msg, allow_retry=False, worker_id=None):
+        self.invalidate(worker_id=worker_id, hostname=hostname)
         if allow_retry:
             error_attempt_number = self.domains_config.increment_worker_error_attempt_number(hostname)
             if error_attempt_number >= config.WORKER_ERROR_MAX_ATTEMPTS:
                 self.domains_config.set_worker_error_by_hostname(hostname, error_msg)
+                if config.HOSTNAME_DENY_ENABLED and not worker_id:
+                    self.domains_config.deny_hostname(hostname)
                 set_last_action(self, INITIALIZER_HOSTNAME_ERROR_MAX_ATTEMPTS, hostname=hostname, worker_id=worker_id)
             else:
                 set_last_action(self, INITIALIZER_HOSTNAME_ERROR_RETRY, hostname=hostname, worker_id=worker_id)
@@ -86,7 +213,13 @@ class InitializerDeploymentFlowManager:
             self.domains_config.set_worker_error_by_hostname(hostname, error_msg)
             set_last_action(self, INITIALIZER_HOSTNAME_ERROR_NO_RETRY, hostname=hostname, worker_id=worker_id)
 
+    def set_hostname_denied(self, hostname):
+        self.invalidate(hostname=hostname)
+        self.domains_config.set_worker_error_by_hostname(hostname, self.domains_config.WORKER_ERROR_FAILED_TO_GET_VOLUME_CONFIG, with_worker=False)
+        set_last_action(self, INITIALIZER_HOSTNAME_DENIED, hostname=hostname)
+
     def set_worker_force_delete(self, worker_id):
+        self.invalidate(worker_id=worker_id)
         self.domains_config.del_worker_force_update(worker_id)
         self.domains_config.set_worker_force_delete(worker_id)
         set_last_action(self, INITIALIZER_WORKER_FORCE_DELETE, worker_id=worker_id)
@@ -94,36 +227,82 @@ class InitializerDeploymentFlowManager:
 
 class DeployerDeploymentFlowManager:
 
-    def __init__(self, domains_config: DomainsConfig):
+    def __init__(self, domains_config: DomainsConfig, with_snapshot=False):
         self.domains_config = domains_config
+        self.queue_worker_ids = []
+        self.snapshot = get_flow_snapshot(domains_config, with_snapshot)
+
+    def recover_queue(self):
+        self.domains_config.keys.worker_ready_for_deployment_queue.recover(
+            worker_id for worker_id in self.domains_config.get_worker_ids_ready_for_deployment()
+            if not self.domains_config.keys.worker_waiting_for_deployment_complete.exists(worker_id)
+        )
 
-    def iterate_worker_ids_ready_for_deployment(self):
-        for worker_id in self.domains_config.get_worker_ids_ready_for_deployment():
-            if self.domains_config.keys.worker_waiting_for_deployment_complete.exists(worker_id):
+    def iterate_worker_ids_ready_for_deployment(self, queue_block_seconds=None):
+        if config.DEPLOYMENT_FLOW_QUEUES_ENABLED:
+            self.queue_worker_ids = self.domains_config.keys.worker_ready_for_deployment_queue.pop_all(queue_block_seconds)
+            worker_ids = self.queue_worker_ids
+        elif self.snapshot:
+            worker_ids = self.snapshot.get_suffixes('worker_ready_for_deployment')
+        else:
+            worker_ids = self.domains_config.get_worker_ids_ready_for_deployment()
+        for worker_id in worker_ids:
+            if flow_key_exists(self, 'worker_waiting_for_deployment_complete', worker_id):
+                continue
+            if config.DEPLOYMENT_FLOW_QUEUES_ENABLED and not flow_key_exists(self, 'worker_ready_for_deployment', worker_id):
+                # the flow keys are the source of truth, queue may contain worker ids which were already handled
                 continue
             yield worker_id
 
-    def is_valid_worker_hostnames_for_deployment(self, worker_id, hostnames):
-        if self.domains_config.keys.worker_force_update.exists(worker_id):
+    # should be called after all the worker ids of the iteration were processed
+    # worker ids which are still ready for deployment (e.g. deployment failed with an exception) are queued again after a delay
+    # other worker ids are queued again only by the flow transitions
+    def complete_iteration(self):
+        if self.queue_worker_ids:
+            self.domains_config.keys.worker_ready_for_deployment_queue.complete_many(self.queue_worker_ids, delay_seconds=config.DEPLOYMENT_FLOW_QUEUES_RETRY_DELAY_SECONDS, delayed_items=set(
+                worker_id for worker_id, is_ready, is_waiting in zip(
+                    self.queue_worker_ids,
+                    self.domains_config.keys.worker_ready_for_deployment.exists_many(self.queue_worker_ids),
+                    self.domains_config.keys.worker_waiting_for_deployment_complete.exists_many(self.queue_worker_ids)
+                ) if is_ready and not is_waiting
+            ))
+            self.queue_worker_ids = []
+
+    # hostnames_index - common.HostnameIndex of the hostnames, built from the hostnames if not provided
+    def is_valid_worker_hostnames_for_deployment(self, worker_id, hostnames, hostnames_index=None):
+        if flow_key_exists(self, 'worker_force_update', worker_id):
             return True
+        if self.snapshot and self.snapshot.is_hostname_initialize_match(hostnames):
+            return True
+        # hostnames which were not in the snapshot are checked in redis before deleting the ready for deployment key
+        if hostnames_index is None:
+            hostnames_index = common.HostnameIndex(hostnames)
         for request_hostname in self.domains_config.keys.hostname_initialize.iterate_prefix_key_suffixes():
-            if common.is_hostnames_match_in_list(request_hostname, hostnames):
+            if request_hostname in hostnames_index:
                 return True
         print('WARNING! worker_id is not marked for force_update and none of the hostnames are waiting to initialize:'
               'deleting ready for deployment key and skipping')
+        self.invalidate(worker_id)
         self.domains_config.keys.worker_ready_for_deployment.delete(worker_id)
         return False
 
+    def invalidate(self, worker_id):
+        if self.snapshot:
+            self.snapshot.invalidate(worker_id=worker_id)
+
     def set_worker_error(self, worker_id, error_msg):
+        self.invalidate(worker_id)
         self.domains_config.set_worker_error(worker_id, error_msg)
         set_last_action(self, DEPLOYER_WORKER_ERROR, worker_id=worker_id)
 
     def wait_retry_deployment(self, worker_id):
+        self.invalidate(worker_id)
         self.domains_config.increment_worker_deployment_attempt_number(worker_id)
         self.domains_config.set_worker_waiting_for_deployment(worker_id, wait_for_error=True)
         set_last_action(self, DEPLOYER_WAIT_RETRY_DEPLOYMENT, worker_id=worker_id)
 
     def set_worker_waiting_for_deployment(self, worker_id):
+        self.invalidate(worker_id)
         self.domains_config.set_worker_waiting_for_deployment(worker_id)
         set_last_action(self, DEPLOYER_WORKER_WAITING_FOR_DEPLOYMENT, worker_id=worker_id)
 
@@ -132,21 +311,48 @@ class WaiterDeploymentFlowManager:
 
     def __init__(self, domains_config: DomainsConfig):
         self.domains_config = domains_config
+        self.queue_worker_ids = []
+
+    def recover_queue(self):
+        self.domains_config.keys.worker_waiting_for_deployment_complete_queue.recover(
+            self.domains_config.get_worker_ids_waiting_for_deployment_complete()
+        )
 
-    def iterate_worker_ids_waiting_for_deployment_complete(self):
-        for worker_id in self.domains_config.get_worker_ids_waiting_for_deployment_complete():
+    def iterate_worker_ids_waiting_for_deployment_complete(self, queue_block_seconds=None):
+        if config.DEPLOYMENT_FLOW_QUEUES_ENABLED:
+            self.queue_worker_ids = self.domains_config.keys.worker_waiting_for_deployment_complete_queue.pop_all(queue_block_seconds)
+            worker_ids = self.queue_worker_ids
+        else:
+            worker_ids = self.domains_config.get_worker_ids_waiting_for_deployment_complete()
+        for worker_id in worker_ids:
+            if config.DEPLOYMENT_FLOW_QUEUES_ENABLED and not self.domains_config.keys.worker_waiting_for_deployment_complete.exists(worker_id):
+                # the flow keys are the source of truth, queue may contain worker ids which were already handled
+                continue
             if not self.domains_config.keys.worker_ready_for_deployment.exists(worker_id):
                 print('WARNING! worker_id does not have ready for deployment key: deleting waiting for deployment key and skipping')
                 self.domains_config.keys.worker_waiting_for_deployment_complete.delete(worker_id)
                 continue
             yield worker_id
 
+    # should be called after all the worker ids of the iteration were processed
+    # worker ids which are still waiting for deployment complete are queued again after a delay to check them again
+    # other worker ids are queued again only by the flow transitions
+    def complete_iteration(self):
+        if self.queue_worker_ids:
+            self.domains_config.keys.worker_waiting_for_deployment_complete_queue.complete_many(self.queue_worker_ids, delay_seconds=config.DEPLOYMENT_FLOW_QUEUES_RETRY_DELAY_SECONDS, delayed_items=set(
+                worker_id for worker_id, exists in zip(
+                    self.queue_worker_ids,
+                    self.domains_config.keys.worker_waiting_for_deployment_complete.exists_many(self.queue_worker_ids)
+                ) if exists
+            ))
+            self.queue_worker_ids = []
+
     def set_worker_error(self, worker_id, error_msg):
         self.domains_config.set_worker_error(worker_id, error_msg)
         set_last_action(self, WAITER_WORKER_ERROR, worker_id=worker_id)
 
     def set_worker_wait_for_error_complete(self, worker_id):
-        self.domains_config.keys.worker_waiting_for_deployment_complete.delete(worker_id)
+        self.domains_config.del_worker_waiting_for_deployment(worker_id)
         set_last_action(self, WAITER_WORKER_ERROR_COMPLETE, worker_id=worker_id)
 
     def set_worker_available(self, worker_id, internal_hostname):
@@ -1,8 +1,12 @@
 import json
 
 import redis
+import redis.cluster
+import time
+import random
 import traceback
-from copy import deepcopy
+import threading
+from collections import OrderedDict
 from contextlib import contextmanager
 
 import cwm_worker_deployment.deployment
@@ -10,26 +14,303 @@ import cwm_worker_deployment.deployment
 from cwm_worker_operator import config
 from cwm_worker_operator import logs
 from cwm_worker_operator import common
+from cwm_worker_operator import metrics
 from cwm_worker_operator import cwm_api_manager
+from cwm_worker_operator import value_codec
+from cwm_worker_operator import hostname_events
 
 
 WORKER_ID_VALIDATION_INVALID_WORKER_ID = 'WORKER_ID_VALIDATION_INVALID_WORKER_ID'
 WORKER_ID_VALIDATION_API_FAILURE = 'WORKER_ID_VALIDATION_API_FAILURE'
 WORKER_ID_VALIDATION_MISSING_VOLUME_CONFIG_ID = 'WORKER_ID_VALIDATION_MISSING_VOLUME_CONFIG_ID'
 
+PREFIX_INDEX_KEY_PREFIX = '__index__'
+PREFIX_VERSION_KEY_PREFIX = '__version__'
+PREFIX_COUNT_KEY_PREFIX = '__count__'
+WORKER_HASH_KEY_PREFIX = 'worker'
+REDIS_POOL_NAMES = ['ingress', 'internal', 'metrics']
+
+# KEYS[1] = index set key, KEYS[2..] = keys of the suffixes in ARGV[2..]
+# ARGV[1] = worker hash field, if not empty KEYS[2..] are pairs of the string key and the worker hash key of each suffix
+# removes suffixes from the index if their key doesn't exist and returns the removed suffixes
+# it runs atomically, so a suffix which was concurrently re-added is not removed
+PREFIX_INDEX_PRUNE_LUA = """
+local removed = {}
+local field = ARGV[1]
+for i = 2, #ARGV do
+    local exists
+    if field == '' then
+        exists = redis.call('exists', KEYS[i]) == 1
+    else
+        exists = redis.call('exists', KEYS[2 * i - 2]) == 1 or redis.call('hexists', KEYS[2 * i - 1], field) == 1
+    end
+    if not exists then
+        redis.call('srem', KEYS[1], ARGV[i])
+        table.insert(removed, ARGV[i])
+    end
+end
+return removed
+"""
+
+# KEYS[1] = worker hash key, KEYS[2..] = string keys to move into the hash, ARGV = the hash field of each string key
+# values which are already set in the hash are newer, so the string key is deleted without overwriting them
+# returns the number of moved values
+WORKER_HASH_MIGRATE_LUA = """
+local moved = 0
+for i, field in ipairs(ARGV) do
+    local value = redis.call('get', KEYS[i + 1])
+    if value then
+        moved = moved + redis.call('hsetnx', KEYS[1], field, value)
+        redis.call('del', KEYS[i + 1])
+    end
+end
+return moved
+"""
+
+# KEYS[1] = queue list key, KEYS[2] = delayed items sorted set key (score is the time the item is due), ARGV[1] = current time
+# moves the delayed items which are due to the queue, returns the due time of the next delayed item or nil if there are no delayed items
+QUEUE_DUE_ITEMS_LUA = """
+local items = redis.call('zrangebyscore', KEYS[2], '-inf', ARGV[1])
+if #items > 0 then
+    for _, item in ipairs(items) do
+        redis.call('lpush', KEYS[1], item)
+    end
+    redis.call('zremrangebyscore', KEYS[2], '-inf', ARGV[1])
+end
+return redis.call('zrange', KEYS[2], 0, 0, 'withscores')[2]
+"""
+
+# KEYS[1] = counter key, ARGV[1] = the number to add to the counter
+# used to correct the counter drift without overwriting concurrent increments / decrements, counters which reach 0 are deleted
+COUNTER_ADD_LUA = """
+local value = redis.call('incrby', KEYS[1], ARGV[1])
+if value <= 0 then
+    redis.call('del', KEYS[1])
+end
+return value
+"""
+
+# KEYS[1] = hostname deny count key, ARGV = min seconds, max seconds, decay seconds
+# increments the deny count and sets its expiry atomically, so that concurrent denies of the same hostname are all counted
+# returns the deny count and the deny duration in seconds, which doubles on each deny from min seconds up to max seconds
+HOSTNAME_DENY_COUNT_LUA = """
+local count = redis.call('incr', KEYS[1])
+local seconds = math.min(tonumber(ARGV[1]) * 2 ^ math.min(count - 1, 32), tonumber(ARGV[2]))
+redis.call('expire', KEYS[1], seconds + tonumber(ARGV[3]))
+return {count, seconds}
+"""
+
+# executes a list of write operations atomically, used to apply DomainsConfigPipeline operations
+# each key in KEYS has an operation name in ARGV, followed by the operation value if the operation requires one
+# counters are maintained using exists_before / exists_after operations on the locations of a value (a key, or a hash field if a field is given)
+# before and after it's modified, followed by a count operation on the counter key, which is incremented / decremented if the value was added / removed
+# counters which reach 0 are deleted
+KEY_OPS_LUA = """
+local i = 1
+local existed, exists = false, false
+for _, key in ipairs(KEYS) do
+    local op = ARGV[i]
+    if op == 'set' then
+        redis.call('set', key, ARGV[i + 1])
+        i = i + 2
+    elseif op == 'setex' then
+        redis.call('set', key, ARGV[i + 2], 'EX', ARGV[i + 1])
+        i = i + 3
+    elseif op == 'del' then
+        redis.call('del', key)
+        i = i + 1
+    elseif op == 'del_unless' then
+        if redis.call('get', key) ~= ARGV[i + 1] then
+            redis.call('del', key)
+        end
+        i = i + 2
+    elseif op == 'sadd' then
+        redis.call('sadd', key, ARGV[i + 1])
+        i = i + 2
+    elseif op == 'srem' then
+        redis.call('srem', key, ARGV[i + 1])
+        i = i + 2
+    elseif op == 'zadd' then
+        redis.call('zadd', key, ARGV[i + 1], ARGV[i + 2])
+        i = i + 3
+    elseif op == 'zrem' then
+        redis.call('zrem', key, ARGV[i + 1])
+        i = i + 2
+    elseif op == 'lpush' then
+        redis.call('lpush', key, ARGV[i + 1])
+        i = i + 2
+    elseif op == 'lrem' then
+        redis.call('lrem', key, 0, ARGV[i + 1])
+        i = i + 2
+    elseif op == 'hset' then
+        redis.call('hset', key, ARGV[i + 1], ARGV[i + 2])
+        i = i + 3
+    elseif op == 'hdel' then
+        redis.call('hdel', key, ARGV[i + 1])
+        i = i + 2
+    elseif op == 'incr' then
+        redis.call('incr', key)
+        i = i + 1
+    elseif op == 'hincrby' then
+        redis.call('hincrby', key, ARGV[i + 1], ARGV[i + 2])
+        i = i + 3
+    elseif op == 'exists_before' or op == 'exists_after' then
+        local location_exists
+        if ARGV[i + 1] == '' then
+            location_exists = redis.call('exists', key) == 1
+        else
+            location_exists = redis.call('hexists', key, ARGV[i + 1]) == 1
+        end
+        if op == 'exists_before' then
+            existed = existed or location_exists
+        else
+            exists = exists or location_exists
+        end
+        i = i + 2
+    elseif op == 'count' then
+        if exists ~= existed and redis.call('incrby', key, exists and 1 or -1) == 0 then
+            redis.call('del', key)
+        end
+        existed, exists = false, false
+        i = i + 1
+    else
+        return redis.error_reply('invalid key operation: ' .. tostring(op))
+    end
+end
+return #KEYS
+"""
+
+# number of values which follow each operation name in the KEY_OPS_LUA ARGV
+KEY_OPS_NUM_VALUES = {
+    'set': 1, 'setex': 2, 'del': 0, 'del_unless': 1, 'sadd': 1, 'srem': 1, 'zadd': 2, 'zrem': 1, 'lpush': 1, 'lrem': 1, 'hset': 2, 'hdel': 1, 'incr': 0, 'hincrby': 2,
+    'exists_before': 1, 'exists_after': 1, 'count': 0,
+}
+
+
+# returns the group of keys which don't match any DomainsConfigKeys key, used for reporting
+# keys are grouped by their first path segment (e.g. '__index__:*'), so that the number of groups is bounded
+def get_unknown_key_group(key):
+    prefix, sep, _ = key.partition(':')
+    return '{}:*'.format(prefix) if sep else '*'
+
+
+# sizes - sorted list of values, returns the nearest-rank percentile
+def get_percentile(sizes, percentile):
+    if not sizes:
+        return 0
+    return sizes[min(len(sizes) - 1, len(sizes) * percentile // 100)]
+
+
+# in redis cluster mode, only the part of the key inside braces is used to choose the cluster slot
+def hash_tag(value):
+    if config.REDIS_CLUSTER_ENABLED:
+        return '{{{}}}'.format(value)
+    else:
+        return value
+
+
+def strip_hash_tag(value):
+    if config.REDIS_CLUSTER_ENABLED and value.startswith('{') and value.endswith('}'):
+        return value[1:-1]
+    else:
+        return value
+
+
+def get_worker_hash_key(worker_id):
+    return '{}:{}'.format(WORKER_HASH_KEY_PREFIX, hash_tag(worker_id))
+
+
+def is_redis_cluster(r):
+    return isinstance(r, (redis.cluster.RedisCluster, redis.cluster.ClusterPipeline))
+
+
+# in redis cluster mode each primary node is scanned separately, because SCAN only returns the keys of a single node
+def scan_iter(r, match, count=None):
+    if isinstance(r, redis.cluster.RedisCluster):
+        for node in r.get_primaries():
+            yield from r.get_redis_connection(node).scan_iter(match, count=count)
+    else:
+        yield from r.scan_iter(match, count=count)
+
+
+# used instead of redis Script objects in redis cluster mode
+# scripts are executed using EVAL, because SCRIPT LOAD can't be routed to the node which holds the keys
+class ClusterScript:
+
+    def __init__(self, script):
+        self.script = script
+
+    def __call__(self, keys=(), args=(), client=None):
+        return client.eval(self.script, len(keys), *keys, *args)
+
+
+class InstrumentedBlockingConnectionPool(redis.BlockingConnectionPool):
+
+    def __init__(self, *args, pool_name=None, redis_metrics=None, **kwargs):
+        self.pool_name = pool_name
+        self.redis_metrics = redis_metrics
+        super(InstrumentedBlockingConnectionPool, self).__init__(*args, **kwargs)
+
+    def get_connection(self, command_name, *keys, **options):
+        start_time = time.perf_counter()
+        connection = super(InstrumentedBlockingConnectionPool, self).get_connection(command_name, *keys, **options)
+        self.redis_metrics.observe_pool_checkout(self.pool_name, time.perf_counter() - start_time)
+        return connection
+
+
+class InstrumentedPipeline(redis.client.Pipeline):
+
+    def __init__(self, *args, key_name=None, **kwargs):
+        self.key_name = key_name
+        super(InstrumentedPipeline, self).__init__(*args, **kwargs)
+
+    def execute(self, raise_on_error=True):
+        start_time = time.perf_counter()
+        try:
+            return super(InstrumentedPipeline, self).execute(raise_on_error)
+        finally:
+            self.connection_pool.redis_metrics.observe_command(self.connection_pool.pool_name, self.key_name, 'PIPELINE', time.perf_counter() - start_time)
+
+
+# redis client which observes the latency of each command, should be used with an InstrumentedBlockingConnectionPool
+class InstrumentedRedis(redis.Redis):
+
+    def __init__(self, *args, key_name=None, **kwargs):
+        self.key_name = key_name
+        super(InstrumentedRedis, self).__init__(*args, **kwargs)
+
+    def execute_command(self, *args, **options):
+        start_time = time.perf_counter()
+        try:
+            return super(InstrumentedRedis, self).execute_command(*args, **options)
+        finally:
+            self.connection_pool.redis_metrics.observe_command(self.connection_pool.pool_name, self.key_name, args[0], time.perf_counter() - start_time)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint, key_name=self.key_name)
+
 
 class DomainsConfigKey:
 
     def __init__(self, redis_pool_name, domains_config, **extra_kwargs):
-        assert redis_pool_name in ['ingress', 'internal', 'metrics']
+        assert redis_pool_name in REDIS_POOL_NAMES
         self.redis_pool_name = redis_pool_name
         self.domains_config = domains_config
+        # name of the DomainsConfigKeys attribute, used to label redis metrics
+        self.key_name = None
         for k, v in extra_kwargs.items():
             setattr(self, k, v)
+        # in redis cluster mode, keys of a worker / hostname are named with a hash tag, so they are stored in the same slot
+        self.with_hash_tag = getattr(self, 'keys_summary_param', None) in ('worker_id', 'hostname')
 
     @contextmanager
     def get_redis(self):
-        with getattr(self.domains_config, 'get_{}_redis'.format(self.redis_pool_name))() as r:
+        with getattr(self.domains_config, 'get_{}_redis'.format(self.redis_pool_name))(key_name=self.key_name) as r:
+            yield r
+
+    @contextmanager
+    def get_read_redis(self):
+        with self.domains_config.get_read_redis(self.redis_pool_name, key_name=self.key_name) as r:
             yield r
 
     def get(self, *args):
@@ -44,39 +325,348 @@ class DomainsConfigKey:
         with self.get_redis() as r:
             r.delete(self._(*args))
 
+    # pipeline - a DomainsConfigPipeline to queue the commands in, if not provided commands are executed immediately
+    @contextmanager
+    def get_pipe(self, pipeline=None):
+        with self.domains_config.pipeline(pipeline) as pipeline:
+            yield pipeline.get_pipe(self.redis_pool_name)
+
+    def _format_value(self, value):
+        return value
+
+    def _parse_value(self, value):
+        return value
+
+    # keys which declare a TTL policy are expired by redis, the policy is set using extra kwargs:
+    #   ttl_seconds_config - name of the config value with the TTL seconds
+    #   ttl_unless_values - values which are set without a TTL
+    def get_ttl_seconds(self, value):
+        ttl_seconds_config = getattr(self, 'ttl_seconds_config', None)
+        if not ttl_seconds_config or not config.DOMAINS_CONFIG_KEYS_TTL_ENABLED:
+            return None
+        if isinstance(value, bytes):
+            value = value.decode()
+        if value in getattr(self, 'ttl_unless_values', ()):
+            return None
+        ttl_seconds = getattr(config, ttl_seconds_config)
+        return ttl_seconds if ttl_seconds > 0 else None
+
+    def _queue_set(self, pipe, param, value):
+        pipe.set(self._(param), value, ex=self.get_ttl_seconds(value))
+
+    def _queue_delete(self, pipe, param, unless_value=None):
+        if unless_value is None:
+            pipe.delete(self._(param))
+        else:
+            pipe.delete_unless(self._(param), unless_value)
+
+    def _get_raw_many(self, params):
+        with self.get_redis() as r:
+            if is_redis_cluster(r):
+                return r.mget_nonatomic([self._(param) for param in params])
+            else:
+                return r.mget([self._(param) for param in params])
+
+    def get_many(self, params):
+        params = list(params)
+        if len(params) == 0:
+            return []
+        return [self._parse_value(value) for value in self._get_raw_many(params)]
+
+    def exists_many(self, params):
+        params = list(params)
+        if len(params) == 0:
+            return []
+        with self.get_redis() as r:
+            pipe = r.pipeline(transaction=False)
+            for param in params:
+                pipe.exists(self._(param))
+            return [bool(exists) for exists in pipe.execute()]
+
+    def set_many(self, values, pipeline=None):
+        if len(values) > 0:
+            with self.get_pipe(pipeline) as pipe:
+                for param, value in values.items():
+                    self._queue_set(pipe, param, self._format_value(value))
+
+    # unless_value - if provided, keys which have this value are not deleted
+    def delete_many(self, params, pipeline=None, unless_value=None):
+        params = list(params)
+        if len(params) > 0:
+            with self.get_pipe(pipeline) as pipe:
+                for param in params:
+                    self._queue_delete(pipe, param, unless_value)
+
 
 class DomainsConfigKeyPrefix(DomainsConfigKey):
 
-    def __init__(self, key_prefix, redis_pool_name, domains_config, **extra_kwargs):
+    # with_index should be set to False for keys which are written by other apps (e.g. cwm-worker-ingress)
+    # because the index is only updated when keys are modified via the operator
+    # in_worker_hash - when worker hash layout is enabled, the value is stored in a field of the worker hash (the param is the worker id)
+    # with_version - when versioning is enabled, a version counter is incremented on every modification of the key
+    # codec - name of the value_codec used by get_json / set_json, if None the codec from config is used
+    # with_count - when flow counters are enabled, a counter of the number of keys is maintained atomically with the modifications of the key
+    def __init__(self, key_prefix, redis_pool_name, domains_config, with_index=True, in_worker_hash=False, with_version=False, codec=None, with_count=False, **extra_kwargs):
         self.key_prefix = key_prefix
+        self.codec = codec
+        self.with_index = with_index
+        self.with_version = with_version
+        self.with_count = with_count
+        self.in_worker_hash = in_worker_hash
+        if in_worker_hash:
+            assert with_index and redis_pool_name == 'internal' and key_prefix.startswith('{}:'.format(WORKER_HASH_KEY_PREFIX))
+            assert 'ttl_seconds_config' not in extra_kwargs, 'hash fields can\'t expire'
+            self.worker_hash_field = key_prefix[len(WORKER_HASH_KEY_PREFIX) + 1:]
         super(DomainsConfigKeyPrefix, self).__init__(redis_pool_name, domains_config, **extra_kwargs)
 
     def _(self, param):
-        return '{}:{}'.format(self.key_prefix, param)
+        return '{}:{}'.format(self.key_prefix, hash_tag(param) if self.with_hash_tag else param)
+
+    # returns the param of a key of this prefix
+    def get_param(self, key):
+        param = key[len(self.key_prefix) + 1:]
+        return strip_hash_tag(param) if self.with_hash_tag else param
+
+    def _index(self):
+        return '{}:{}'.format(PREFIX_INDEX_KEY_PREFIX, self.key_prefix)
+
+    def _hash(self, worker_id):
+        return get_worker_hash_key(worker_id)
+
+    def _version(self):
+        return '{}:{}'.format(PREFIX_VERSION_KEY_PREFIX, self.key_prefix)
+
+    def _count(self):
+        return '{}:{}'.format(PREFIX_COUNT_KEY_PREFIX, self.key_prefix)
+
+    # in redis cluster mode the counter and the keys are in different slots, so the counter is only set by DomainsConfig.reconcile_flow_counters
+    def is_counted(self):
+        return self.with_count and config.DOMAINS_CONFIG_FLOW_COUNTERS_ENABLED and not config.REDIS_CLUSTER_ENABLED
+
+    # counted keys are modified using the key operations script, which updates the counter according to the key existence before and after
+    @contextmanager
+    def _queue_count(self, pipe, param):
+        if self.is_counted() and isinstance(pipe, DomainsConfigKeyOps):
+            locations = [(self._(param), '')]
+            if self.is_worker_hash():
+                locations.append((self._hash(param), self.worker_hash_field))
+            for key, field in locations:
+                pipe.exists_before(key, field)
+            yield
+            for key, field in locations:
+                pipe.exists_after(key, field)
+            pipe.count(self._count())
+        else:
+            yield
+
+    # the version is only used by the volume config cache, so it's maintained only when the cache uses it
+    def is_versioned(self):
+        return self.with_version and config.VOLUME_CONFIG_CACHE_MAX_SIZE > 0 and config.VOLUME_CONFIG_CACHE_INVALIDATION == 'version'
+
+    def get_version(self):
+        with self.get_redis() as r:
+            return int(r.get(self._version()) or 0)
+
+    def is_worker_hash(self):
+        return self.in_worker_hash and config.DOMAINS_CONFIG_WORKER_HASH_ENABLED
 
-    def iterate_prefix_key_suffixes(self):
+    # hash fields can't be found by scanning the keyspace, so worker hash keys are always indexed
+    def is_indexed(self):
+        return self.with_index and (config.DOMAINS_CONFIG_PREFIX_INDEX_ENABLED or self.is_worker_hash())
+
+    # in worker hash layout values are read from the hash, falling back to the legacy string keys which were not migrated yet
+    def _get_raw_many(self, params):
+        if not self.is_worker_hash():
+            return super(DomainsConfigKeyPrefix, self)._get_raw_many(params)
         with self.get_redis() as r:
-            for key in r.keys("{}:*".format(self.key_prefix)):
-                yield key.decode().replace('{}:'.format(self.key_prefix), '')
+            pipe = r.pipeline(transaction=False)
+            for param in params:
+                pipe.hget(self._hash(param), self.worker_hash_field)
+                pipe.get(self._(param))
+            values = pipe.execute()
+            return [hash_value if hash_value is not None else value for hash_value, value in zip(values[::2], values[1::2])]
+
+    def get(self, param):
+        if self.is_worker_hash():
+            return self._get_raw_many([param])[0]
+        else:
+            return super(DomainsConfigKeyPrefix, self).get(param)
+
+    # values which were set as plain json strings are decoded as legacy json
+    def get_json(self, param):
+        return value_codec.decode(self.get(param))
+
+    def set_json(self, param, value):
+        self.set(param, value_codec.encode(value, self.codec))
+
+    def exists_many(self, params):
+        params = list(params)
+        if not self.is_worker_hash() or len(params) == 0:
+            return super(DomainsConfigKeyPrefix, self).exists_many(params)
+        with self.get_redis() as r:
+            pipe = r.pipeline(transaction=False)
+            for param in params:
+                pipe.hexists(self._hash(param), self.worker_hash_field)
+                pipe.exists(self._(param))
+            values = pipe.execute()
+            return [bool(hash_exists or exists) for hash_exists, exists in zip(values[::2], values[1::2])]
+
+    def exists(self, param):
+        if self.is_worker_hash():
+            return self.exists_many([param])[0]
+        else:
+            return super(DomainsConfigKeyPrefix, self).exists(param)
+
+    # use_read_replica - if False, the keys are iterated on the primary, should be used by operations which modify all keys (e.g. migrations)
+    def iterate_prefix_key_suffixes(self, use_read_replica=True):
+        if self.is_indexed():
+            yield from self.iterate_index_key_suffixes(use_read_replica)
+        else:
+            yield from self.scan_prefix_key_suffixes(use_read_replica)
+
+    def scan_prefix_key_suffixes(self, use_read_replica=True):
+        # SCAN may return the same key more than once, so we keep track of yielded suffixes
+        yielded_suffixes = set()
+        with (self.get_read_redis() if use_read_replica else self.get_redis()) as r:
+            for key in scan_iter(r, "{}:*".format(self.key_prefix), count=config.DOMAINS_CONFIG_SCAN_COUNT):
+                suffix = self.get_param(key.decode())
+                if suffix not in yielded_suffixes:
+                    yielded_suffixes.add(suffix)
+                    yield suffix
+
+    def iterate_index_key_suffixes(self, use_read_replica=True):
+        with (self.get_read_redis() if use_read_replica else self.get_redis()) as r:
+            suffixes = list({suffix.decode() for suffix in r.sscan_iter(self._index(), count=config.DOMAINS_CONFIG_SCAN_COUNT)})
+        # suffixes of keys which were deleted without going through the operator are pruned from the index, using the primary
+        with self.get_redis() as r:
+            for i in range(0, len(suffixes), config.DOMAINS_CONFIG_SCAN_COUNT):
+                batch = suffixes[i:i + config.DOMAINS_CONFIG_SCAN_COUNT]
+                if is_redis_cluster(r):
+                    removed_suffixes = self._prune_index_non_atomic(r, batch)
+                else:
+                    removed_suffixes = self._prune_index(r, batch)
+                for suffix in batch:
+                    if suffix not in removed_suffixes:
+                        yield suffix
+
+    def _prune_index(self, r, suffixes):
+        if self.is_worker_hash():
+            keys = [key for suffix in suffixes for key in (self._(suffix), self._hash(suffix))]
+            worker_hash_field = self.worker_hash_field
+        else:
+            keys = [self._(suffix) for suffix in suffixes]
+            worker_hash_field = ''
+        return {
+            suffix.decode() for suffix
+            in self.domains_config.prefix_index_prune_script(keys=[self._index(), *keys], args=[worker_hash_field, *suffixes], client=r)
+        }
+
+    # in redis cluster mode the index and the keys are in different slots, so the index can't be pruned using a script
+    # suffixes which were concurrently re-added while pruning are added back to the index
+    def _prune_index_non_atomic(self, r, suffixes):
+        removed_suffixes = [suffix for suffix, exists in zip(suffixes, self.exists_many(suffixes)) if not exists]
+        if removed_suffixes:
+            r.srem(self._index(), *removed_suffixes)
+            readded_suffixes = [suffix for suffix, exists in zip(removed_suffixes, self.exists_many(removed_suffixes)) if exists]
+            if readded_suffixes:
+                r.sadd(self._index(), *readded_suffixes)
+        else:
+            readded_suffixes = []
+        return set(removed_suffixes) - set(readded_suffixes)
+
+    def backfill_index(self, excluded_key_prefixes=()):
+        # excluded_key_prefixes - prefixes of other keys which start with this key prefix
+        # (e.g. worker:volume:config:hostname_worker_id for worker:volume:config)
+        num_suffixes = 0
+        with self.get_redis() as r:
+            for suffix in self.scan_prefix_key_suffixes(use_read_replica=False):
+                if any('{}:{}'.format(self.key_prefix, suffix).startswith('{}:'.format(key_prefix)) for key_prefix in excluded_key_prefixes):
+                    continue
+                r.sadd(self._index(), suffix)
+                num_suffixes += 1
+        return num_suffixes
+
+    def _queue_set(self, pipe, param, value):
+        with self._queue_count(pipe, param):
+            if self.is_worker_hash():
+                pipe.hset(self._hash(param), self.worker_hash_field, value)
+                pipe.delete(self._(param))
+            else:
+                pipe.set(self._(param), value, ex=self.get_ttl_seconds(value))
+        if self.is_indexed():
+            pipe.sadd(self._index(), param)
+        if self.is_versioned():
+            pipe.incr(self._version())
+
+    def _queue_delete(self, pipe, param, unless_value=None):
+        with self._queue_count(pipe, param):
+            if self.is_worker_hash():
+                assert unless_value is None, 'conditional delete is not supported for worker hash keys'
+                pipe.hdel(self._hash(param), self.worker_hash_field)
+            super(DomainsConfigKeyPrefix, self)._queue_delete(pipe, param, unless_value)
+        # when deletion is conditional the index is not modified, if key was deleted it will be pruned from the index
+        if self.is_indexed() and unless_value is None:
+            pipe.srem(self._index(), param)
+        if self.is_versioned():
+            pipe.incr(self._version())
 
     def set(self, param, value):
+        if self.is_counted():
+            with self.get_pipe() as pipe:
+                self._queue_set(pipe, param, value)
+            return
         with self.get_redis() as r:
-            r.set(self._(param), value)
+            if self.is_indexed() or self.is_versioned():
+                pipe = r.pipeline()
+                self._queue_set(pipe, param, value)
+                pipe.execute()
+            else:
+                r.set(self._(param), value, ex=self.get_ttl_seconds(value))
+
+    def delete(self, param):
+        if self.is_counted():
+            with self.get_pipe() as pipe:
+                self._queue_delete(pipe, param)
+            return
+        with self.get_redis() as r:
+            if self.is_indexed() or self.is_versioned():
+                pipe = r.pipeline()
+                self._queue_delete(pipe, param)
+                pipe.execute()
+            else:
+                r.delete(self._(param))
 
 
 class DomainsConfigKeyPrefixInt(DomainsConfigKeyPrefix):
 
+    def _format_value(self, value):
+        return int(value)
+
+    def _parse_value(self, value):
+        return 0 if not value else int(value)
+
     def set(self, param, value):
-        value = int(value)
-        super(DomainsConfigKeyPrefixInt, self).set(param, value)
+        super(DomainsConfigKeyPrefixInt, self).set(param, self._format_value(value))
 
     def get(self, param):
-        val = super(DomainsConfigKeyPrefixInt, self).get(param)
-        return 0 if not val else int(val)
+        return self._parse_value(super(DomainsConfigKeyPrefixInt, self).get(param))
 
     def increment(self, param):
         with self.get_redis() as r:
-            return int(r.incr(self._(param)))
+            if self.is_worker_hash():
+                pipe = r.pipeline()
+                self.domains_config.worker_hash_migrate_script(keys=[self._hash(param), self._(param)], args=[self.worker_hash_field], client=pipe)
+                pipe.hincrby(self._hash(param), self.worker_hash_field)
+                pipe.sadd(self._index(), param)
+                _, value, _ = pipe.execute()
+            elif self.is_indexed():
+                pipe = r.pipeline()
+                pipe.incr(self._(param))
+                pipe.sadd(self._index(), param)
+                value, _ = pipe.execute()
+            else:
+                value = r.incr(self._(param))
+            return int(value)
 
 
 class DomainsConfigKeyPrefixBoolean(DomainsConfigKeyPrefix):
@@ -90,33 +680,80 @@ class DomainsConfigKeyPrefixBoolean(DomainsConfigKeyPrefix):
     def get(self, param):
         return bool(self.exists(param))
 
+    def set_many(self, values, pipeline=None):
+        with self.domains_config.pipeline(pipeline) as pipeline:
+            super(DomainsConfigKeyPrefixBoolean, self).set_many({param: '' for param, value in values.items() if value}, pipeline=pipeline)
+            self.delete_many([param for param, value in values.items() if not value], pipeline=pipeline)
+
+    def get_many(self, params):
+        return self.exists_many(params)
+
 
 class DomainsConfigKeyPrefixDateTime(DomainsConfigKeyPrefix):
 
-    def set(self, param, value=None):
+    def _format_value(self, value):
         if not value:
             value = common.now()
-        super(DomainsConfigKeyPrefixDateTime, self).set(param, value.strftime('%Y%m%d%H%M%S'))
+        return common.format_datetime(value, '%Y%m%d%H%M%S')
+
+    def _parse_value(self, value):
+        return common.parse_datetime(value)
+
+    def set(self, param, value=None):
+        super(DomainsConfigKeyPrefixDateTime, self).set(param, self._format_value(value))
 
     def get(self, param):
-        value = super(DomainsConfigKeyPrefixDateTime, self).get(param)
-        if value:
-            return common.strptime(value.decode(), '%Y%m%d%H%M%S')
-        else:
-            return None
+        return self._parse_value(super(DomainsConfigKeyPrefixDateTime, self).get(param))
 
 
 class DomainsConfigKeyPrefixJson(DomainsConfigKeyPrefix):
 
+    def _format_value(self, value):
+        return value_codec.encode(value, self.codec)
+
+    def _parse_value(self, value):
+        return value_codec.decode(value)
+
     def set(self, param, value):
-        super(DomainsConfigKeyPrefixJson, self).set(param, json.dumps(value))
+        super(DomainsConfigKeyPrefixJson, self).set(param, self._format_value(value))
 
     def get(self, param):
-        value = super(DomainsConfigKeyPrefixJson, self).get(param)
-        if value:
-            return json.loads(value)
-        else:
-            return None
+        return self._parse_value(super(DomainsConfigKeyPrefixJson, self).get(param))
+
+
+class DomainsConfigKeyPrefixSet(DomainsConfigKeyPrefix):
+
+    def get(self, param):
+        with self.get_redis() as r:
+            return {member.decode() for member in r.smembers(self._(param))}
+
+    def set(self, param, members):
+        with self.domains_config.pipeline() as pipeline:
+            self.delete_many([param], pipeline=pipeline)
+            self.add_many(param, members, pipeline=pipeline)
+
+    def add_many(self, param, members, pipeline=None):
+        members = list(members)
+        if len(members) > 0:
+            with self.get_pipe(pipeline) as pipe:
+                for member in members:
+                    pipe.sadd(self._(param), member)
+                if self.is_indexed():
+                    pipe.sadd(self._index(), param)
+
+
+class DomainsConfigKeyPrefixHash(DomainsConfigKeyPrefix):
+
+    def get_hash(self, param):
+        with self.get_redis() as r:
+            return {field.decode(): value.decode() for field, value in r.hgetall(self._(param)).items()}
+
+    # values - dict of field: value to increment by
+    def increment_hash(self, param, values, pipeline=None):
+        if len(values) > 0:
+            with self.get_pipe(pipeline) as pipe:
+                for field, value in values.items():
+                    pipe.hincrby(self._(param), field, value)
 
 
 class DomainsConfigKeyTemplate(DomainsConfigKey):
@@ -126,7 +763,13 @@ class DomainsConfigKeyTemplate(DomainsConfigKey):
         super(DomainsConfigKeyTemplate, self).__init__(redis_pool_name, domains_config, **extra_kwargs)
 
     def _(self, param):
-        return self.key_template.format(param)
+        return self.key_template.format(hash_tag(param) if self.with_hash_tag else param)
+
+    # returns the param of a key of this template
+    def get_param(self, key):
+        prefix, suffix = self.key_template.split('{}')
+        param = key[len(prefix):len(key) - len(suffix)]
+        return strip_hash_tag(param) if self.with_hash_tag else param
 
     def set(self, param, value):
         with self.get_redis() as r:
@@ -147,48 +790,176 @@ class DomainsConfigKeyStatic(DomainsConfigKey):
             r.set(self._(), value)
 
 
+# a sorted set with all members at score 0, so that members can be searched by prefix using ZRANGEBYLEX
+# entries are tuples of (type, value), stored as "<lower case value> <type> <value>" members, so that the search is case-insensitive
+class DomainsConfigKeyLexIndex(DomainsConfigKeyStatic):
+    TYPE_WORKER = 'worker'
+    TYPE_NAMESPACE = 'namespace'
+    TYPE_HOSTNAME = 'hostname'
+
+    def _member(self, entry):
+        entry_type, value = entry
+        return '{} {} {}'.format(value.lower(), entry_type, value)
+
+    def add_many(self, entries, pipeline=None):
+        entries = list(entries)
+        if len(entries) > 0:
+            with self.get_pipe(pipeline) as pipe:
+                for entry in entries:
+                    pipe.zadd(self._(), self._member(entry))
+
+    def remove_many(self, entries, pipeline=None):
+        entries = list(entries)
+        if len(entries) > 0:
+            with self.get_pipe(pipeline) as pipe:
+                for entry in entries:
+                    pipe.zrem(self._(), self._member(entry))
+
+    # returns up to limit entries which value starts with the prefix, ordered by value
+    def search(self, prefix, limit):
+        prefix = prefix.lower().encode()
+        with self.get_read_redis() as r:
+            members = r.zrangebylex(self._(), b'[' + prefix, b'[' + prefix + b'\xff', start=0, num=limit)
+        return [tuple(member.decode().split(' ', 2)[1:]) for member in members]
+
+    def count(self):
+        with self.get_read_redis() as r:
+            return r.zcard(self._())
+
+
+# a reliable queue - items are pushed to the left and popped from the right of the queue list
+# popped items are atomically moved to a processing list, and removed from it when the processing is completed
+# items which are left in the processing list (e.g. after a crash) are moved back to the queue by recover()
+class DomainsConfigKeyQueue(DomainsConfigKeyStatic):
+
+    # in redis cluster mode the queue key is a hash tag, so that the processing list is in the same slot
+    def _(self):
+        return hash_tag(self.key)
+
+    def processing_key(self):
+        return '{}:processing'.format(self._())
+
+    # sorted set of items which are queued again after a delay, the score is the time the item is due
+    def delayed_key(self):
+        return '{}:delayed'.format(self._())
+
+    # moves delayed items which are due to the queue, returns the seconds until the next delayed item is due or None
+    def _queue_due_items(self, r):
+        now = time.time()
+        next_due_time = self.domains_config.queue_due_items_script(keys=[self._(), self.delayed_key()], args=[now], client=r)
+        return None if next_due_time is None else max(0.0, float(next_due_time) - now)
+
+    def push_many(self, items, pipeline=None):
+        items = list(items)
+        if len(items) > 0:
+            with self.get_pipe(pipeline) as pipe:
+                for item in items:
+                    pipe.lpush(self._(), item)
+
+    # pops all the items currently in the queue and the delayed items which are due, moving them to the processing list
+    # block_timeout_seconds - if the queue is empty, wait up to this time for an item, or until the next delayed item is due
+    def pop_all(self, block_timeout_seconds=None):
+        items = []
+        with self.get_redis() as r:
+            next_due_seconds = self._queue_due_items(r)
+            if block_timeout_seconds and next_due_seconds is not None:
+                block_timeout_seconds = min(block_timeout_seconds, next_due_seconds)
+            if block_timeout_seconds:
+                item = r.blmove(self._(), self.processing_key(), block_timeout_seconds, 'RIGHT', 'LEFT')
+                if item is None and next_due_seconds is not None:
+                    self._queue_due_items(r)
+                    item = r.lmove(self._(), self.processing_key(), 'RIGHT', 'LEFT')
+            else:
+                item = r.lmove(self._(), self.processing_key(), 'RIGHT', 'LEFT')
+            while item is not None:
+                items.append(item.decode())
+                item = r.lmove(self._(), self.processing_key(), 'RIGHT', 'LEFT')
+        # the same item may be pushed more than once, it's processed only once
+        return list(dict.fromkeys(items))
+
+    # completes processing of popped items
+    # items in delayed_items are still pending, they are queued again after delay_seconds using the delayed items sorted set
+    def complete_many(self, items, delayed_items=(), delay_seconds=0, pipeline=None):
+        items = list(items)
+        if len(items) > 0:
+            due_time = time.time() + delay_seconds
+            with self.get_pipe(pipeline) as pipe:
+                for item in items:
+                    pipe.lrem(self.processing_key(), item)
+                    if item in delayed_items:
+                        pipe.zadd(self.delayed_key(), item, due_time)
+
+    # moves items from the processing list back to the queue and pushes expected items which are not in any of the lists
+    # should run when the consumer starts, before popping items
+    def recover(self, expected_items=()):
+        with self.get_redis() as r:
+            while r.lmove(self.processing_key(), self._(), 'LEFT', 'RIGHT') is not None:
+                pass
+            queued_items = set(item.decode() for item in r.lrange(self._(), 0, -1))
+            queued_items.update(item.decode() for item in r.zrange(self.delayed_key(), 0, -1))
+        self.push_many(item for item in expected_items if item not in queued_items)
+        return len(queued_items)
+
+
 class DomainsConfigKeys:
 
     def __init__(self, domains_config=None):
         self.domains_config = domains_config
 
         # ingress_redis - keys shared with cwm-worker-ingress
-        self.hostname_initialize = DomainsConfigKeyPrefix("hostname:initialize", 'ingress', domains_config, keys_summary_param='hostname')
+        self.hostname_initialize = DomainsConfigKeyPrefix("hostname:initialize", 'ingress', domains_config, with_index=False, with_count=True, keys_summary_param='hostname')
         self.hostname_available = DomainsConfigKeyPrefix("hostname:available", 'ingress', domains_config, keys_summary_param='hostname')
         self.hostname_ingress_hostname = DomainsConfigKeyTemplate("hostname:ingress:hostname:{}", 'ingress', domains_config, keys_summary_param='hostname')
-        self.hostname_error = DomainsConfigKeyPrefix("hostname:error", 'ingress', domains_config, keys_summary_param='hostname')
+        # hostname errors expire after REDIS_CLEANER_DELETE_ANY_HOSTNAME_ERROR_MIN_SECONDS, except throttled which are handled by the throttler
+        self.hostname_error = DomainsConfigKeyPrefix("hostname:error", 'ingress', domains_config, with_count=True, keys_summary_param='hostname',
+                                                     ttl_seconds_config='REDIS_CLEANER_DELETE_ANY_HOSTNAME_ERROR_MIN_SECONDS', ttl_unless_values=(DomainsConfig.WORKER_ERROR_THROTTLED,))
         self.node_healthy = DomainsConfigKeyPrefix("node:healthy", 'ingress', domains_config, keys_summary_param='node')
+        # expires after the hostname deny duration, see config.HOSTNAME_DENY_ENABLED
+        self.hostname_deny = DomainsConfigKeyPrefix("hostname:deny", 'ingress', domains_config, with_index=False, keys_summary_param='hostname')
 
         # internal_redis - keys used internally only by cwm-worker-operator
-        self.hostname_error_attempt_number = DomainsConfigKeyPrefix("hostname:error_attempt_number", 'internal', domains_config, keys_summary_param='hostname')
-        self.volume_config = DomainsConfigKeyPrefix("worker:volume:config", 'internal', domains_config, keys_summary_param='worker_id')
+        self.hostname_error_attempt_number = DomainsConfigKeyPrefix("hostname:error_attempt_number", 'internal', domains_config, keys_summary_param='hostname', ttl_seconds_config='REDIS_CLEANER_DELETE_ANY_HOSTNAME_ERROR_MIN_SECONDS')
+        # expires after the hostname deny duration + HOSTNAME_DENY_DECAY_SECONDS
+        self.hostname_deny_count = DomainsConfigKeyPrefixInt("hostname:deny_count", 'internal', domains_config, with_index=False, keys_summary_param='hostname')
+        self.volume_config = DomainsConfigKeyPrefix("worker:volume:config", 'internal', domains_config, with_version=True, keys_summary_param='worker_id')
         self.volume_config_hostname_worker_id = DomainsConfigKeyPrefix("worker:volume:config:hostname_worker_id", 'internal', domains_config, keys_summary_param='hostname')
-        self.worker_ready_for_deployment = DomainsConfigKeyPrefix("worker:opstatus:ready_for_deployment", 'internal', domains_config, keys_summary_param='worker_id')
-        self.worker_deployment_error_attempt = DomainsConfigKeyPrefixInt("worker:opstatus:deployment_error_attempt", 'internal', domains_config, keys_summary_param='worker_id')
-        self.worker_waiting_for_deployment_complete = DomainsConfigKeyPrefix("worker:opstatus:waiting_for_deployment", 'internal', domains_config, keys_summary_param='worker_id')
+        self.worker_ready_for_deployment = DomainsConfigKeyPrefix("worker:opstatus:ready_for_deployment", 'internal', domains_config, in_worker_hash=True, with_count=True, keys_summary_param='worker_id')
+        self.worker_deployment_error_attempt = DomainsConfigKeyPrefixInt("worker:opstatus:deployment_error_attempt", 'internal', domains_config, in_worker_hash=True, keys_summary_param='worker_id')
+        self.worker_waiting_for_deployment_complete = DomainsConfigKeyPrefix("worker:opstatus:waiting_for_deployment", 'internal', domains_config, in_worker_hash=True, with_count=True, keys_summary_param='worker_id')
         self.worker_force_update = DomainsConfigKeyPrefix("worker:force_update", 'internal', domains_config, keys_summary_param='worker_id')
-        self.worker_force_delete = DomainsConfigKeyPrefix("worker:force_delete", 'internal', domains_config, keys_summary_param='worker_id')
-        self.worker_force_delete_data = DomainsConfigKeyPrefix("worker:force_delete_data", 'internal', domains_config, keys_summary_param='worker_id')
+        self.worker_force_delete = DomainsConfigKeyPrefix("worker:force_delete", 'internal', domains_config, in_worker_hash=True, with_count=True, keys_summary_param='worker_id')
+        self.worker_force_delete_data = DomainsConfigKeyPrefix("worker:force_delete_data", 'internal', domains_config, in_worker_hash=True, keys_summary_param='worker_id')
         self.worker_aggregated_metrics = DomainsConfigKeyPrefix("worker:aggregated-metrics", 'internal', domains_config, keys_summary_param='worker_id')
-        self.worker_aggregated_metrics_last_sent_update = DomainsConfigKeyPrefix("worker:aggregated-metrics-last-sent-update", 'internal', domains_config, keys_summary_param='worker_id')
-        self.worker_total_used_bytes = DomainsConfigKeyPrefix("worker:total-used-bytes", 'internal', domains_config, keys_summary_param='worker_id')
-        self.worker_health = DomainsConfigKeyPrefix("worker:health", 'internal', domains_config, keys_summary_param='worker_id')
+        self.worker_aggregated_metrics_last_sent_update = DomainsConfigKeyPrefix("worker:aggregated-metrics-last-sent-update", 'internal', domains_config, in_worker_hash=True, keys_summary_param='worker_id')
+        self.worker_total_used_bytes = DomainsConfigKeyPrefix("worker:total-used-bytes", 'internal', domains_config, in_worker_hash=True, keys_summary_param='worker_id')
+        self.worker_health = DomainsConfigKeyPrefix("worker:health", 'internal', domains_config, in_worker_hash=True, keys_summary_param='worker_id')
         self.alerts = DomainsConfigKeyStatic("alerts", 'internal', domains_config)
-        self.worker_last_clear_cache = DomainsConfigKeyPrefix("worker:last_clear_cache", 'internal', domains_config, keys_summary_param='worker_id')
+        self.worker_last_clear_cache = DomainsConfigKeyPrefix("worker:last_clear_cache", 'internal', domains_config, in_worker_hash=True, keys_summary_param='worker_id')
         self.updater_last_cwm_api_update = DomainsConfigKeyStatic("updater_last_cwm_api_update", 'internal', domains_config)
         self.node_nas_is_healthy = DomainsConfigKeyPrefixBoolean("node:nas:is_healthy", 'internal', domains_config, keys_summary_param='node')
         self.node_nas_last_check = DomainsConfigKeyPrefixDateTime("node:nas:last_check", 'internal', domains_config, keys_summary_param='node')
-        self.worker_last_deployment_flow_action = DomainsConfigKeyPrefix("worker:last_deployment_flow:action", 'internal', domains_config, keys_summary_param='worker_id')
-        self.worker_last_deployment_flow_time = DomainsConfigKeyPrefixDateTime("worker:last_deployment_flow:time", 'internal', domains_config, keys_summary_param='worker_id')
-        self.hostname_last_deployment_flow_action = DomainsConfigKeyPrefix("hostname:last_deployment_flow:action", 'internal', domains_config, keys_summary_param='hostname')
-        self.hostname_last_deployment_flow_time = DomainsConfigKeyPrefixDateTime("hostname:last_deployment_flow:time", 'internal', domains_config, keys_summary_param='hostname')
-        self.hostname_last_deployment_flow_worker_id = DomainsConfigKeyPrefix("hostname:last_deployment_flow:worker_id", 'internal', domains_config, keys_summary_param='hostname')
-        self.worker_last_throttle_check = DomainsConfigKeyPrefixJson("worker:throttle:last_check", 'internal', domains_config, keys_summary_param='worker_id')
-        self.worker_throttled_expiry = DomainsConfigKeyPrefixDateTime("worker:throttle:expiry", 'internal', domains_config, keys_summary_param='worker_id')
+        self.worker_last_deployment_flow_action = DomainsConfigKeyPrefix("worker:last_deployment_flow:action", 'internal', domains_config, in_worker_hash=True, keys_summary_param='worker_id')
+        self.worker_last_deployment_flow_time = DomainsConfigKeyPrefixDateTime("worker:last_deployment_flow:time", 'internal', domains_config, in_worker_hash=True, keys_summary_param='worker_id')
+        # the hostname deployment flow keys are set on every deployment flow action, so they expire when there was no action for the TTL
+        self.hostname_last_deployment_flow_action = DomainsConfigKeyPrefix("hostname:last_deployment_flow:action", 'internal', domains_config, keys_summary_param='hostname', ttl_seconds_config='REDIS_CLEANER_DELETE_ANY_HOSTNAME_ERROR_MIN_SECONDS')
+        self.hostname_last_deployment_flow_time = DomainsConfigKeyPrefixDateTime("hostname:last_deployment_flow:time", 'internal', domains_config, keys_summary_param='hostname', ttl_seconds_config='REDIS_CLEANER_DELETE_ANY_HOSTNAME_ERROR_MIN_SECONDS')
+        self.hostname_last_deployment_flow_worker_id = DomainsConfigKeyPrefix("hostname:last_deployment_flow:worker_id", 'internal', domains_config, keys_summary_param='hostname', ttl_seconds_config='REDIS_CLEANER_DELETE_ANY_HOSTNAME_ERROR_MIN_SECONDS')
+        self.worker_last_throttle_check = DomainsConfigKeyPrefixJson("worker:throttle:last_check", 'internal', domains_config, in_worker_hash=True, keys_summary_param='worker_id')
+        self.worker_throttled_expiry = DomainsConfigKeyPrefixDateTime("worker:throttle:expiry", 'internal', domains_config, in_worker_hash=True, with_count=True, keys_summary_param='worker_id')
+        self.worker_request_hostnames = DomainsConfigKeyPrefixSet("worker:request_hostnames", 'internal', domains_config, keys_summary_param='worker_id')
+        self.worker_ready_for_deployment_queue = DomainsConfigKeyQueue("queue:worker:ready_for_deployment", 'internal', domains_config)
+        self.worker_waiting_for_deployment_complete_queue = DomainsConfigKeyQueue("queue:worker:waiting_for_deployment", 'internal', domains_config)
+        # worker ids, namespaces and hostnames, maintained when DOMAINS_CONFIG_SEARCH_INDEX_ENABLED
+        self.search_index = DomainsConfigKeyLexIndex("search:index", 'internal', domains_config)
 
         # metrics_redis - keys shared with deployments to get metrics
-        self.deployment_last_action = DomainsConfigKeyPrefix("deploymentid:last_action", 'metrics', domains_config, keys_summary_param='namespace_name')
-        self.deployment_api_metric = DomainsConfigKeyPrefix("deploymentid:minio-metrics", 'metrics', domains_config, keys_summary_param='namespace_name')
+        self.deployment_last_action = DomainsConfigKeyPrefix("deploymentid:last_action", 'metrics', domains_config, with_index=False, keys_summary_param='namespace_name')
+        # a hash of the metrics per namespace, or a legacy string key per metric (deploymentid:minio-metrics:<namespace_name>:<metric>)
+        self.deployment_api_metric = DomainsConfigKeyPrefixHash("deploymentid:minio-metrics", 'metrics', domains_config, with_index=False, keys_summary_param='namespace_name')
+
+        for key_name, key in vars(self).items():
+            if isinstance(key, DomainsConfigKey):
+                key.key_name = key_name
 
 
 class VolumeConfigGatewayTypeS3:
@@ -216,16 +987,19 @@ class VolumeConfigGatewayTypeAzure:
 class VolumeConfig:
     GATEWAY_TYPE_S3 = 's3'
 
-    def __init__(self, data, domains_config, request_hostname=None, is_data_from_cache=False, request_worker_id=None):
-        request_data = deepcopy(data)
+    # data is not modified, so it doesn't need to be copied (e.g. when it's decoded from the volume config key)
+    # request_hostname_worker_id - the worker id which the request hostname is currently mapped to, if known
+    #                              the mapping is written only if it's different from the volume config id
+    def __init__(self, data, domains_config, request_hostname=None, is_data_from_cache=False, request_worker_id=None, request_hostname_worker_id=None):
         self.id = data.get('instanceId')
         self._error = data.get('__error')
         self._last_update = data.get('__last_update')
         self.zone = data.get('zone')
         self.hostnames = []
+        self._hostnames_index = None
         self.hostname_certs = {}
         self.hostname_challenges = {}
-        minio_extra_configs = self.fix_minio_extra_configs(data.get('minio_extra_configs', {}))
+        minio_extra_configs = self.fix_minio_extra_configs(dict(data.get('minio_extra_configs', {})))
         self.protocols_enabled = set()
         for protocol in minio_extra_configs.pop('protocols-enabled', ['http', 'https']):
             if protocol.lower() in ['http', 'https']:
@@ -283,16 +1057,21 @@ class VolumeConfig:
         self.gateway_updated_for_request_hostname = None
         self.update_for_hostname(request_hostname or data.get('__request_hostname'))
         if domains_config and request_worker_id and (not is_data_from_cache or (request_hostname is not None and data.get('__request_hostname') != request_hostname)):
-            request_data['__request_hostname'] = request_hostname
-            self._last_update = request_data["__last_update"] = common.now().strftime("%Y%m%dT%H%M%S")
-            domains_config.keys.volume_config.set(request_worker_id, json.dumps(request_data))
-        if domains_config and request_hostname and self.id is not None:
-            domains_config.keys.volume_config_hostname_worker_id.set(request_hostname, self.id)
+            self._last_update = common.now().strftime("%Y%m%dT%H%M%S")
+            domains_config.keys.volume_config.set_json(request_worker_id, {**data, '__request_hostname': request_hostname, '__last_update': self._last_update})
+            if config.HOSTNAME_DENY_ENABLED and self.hostnames:
+                # hostnames of a worker are not denied, in case they were denied before they were added to the worker
+                domains_config.keys.hostname_deny.delete_many(self.hostnames)
+        if domains_config and request_hostname and self.id is not None and self.id != request_hostname_worker_id:
+            with domains_config.pipeline() as pipeline:
+                domains_config.keys.volume_config_hostname_worker_id.set_many({request_hostname: self.id}, pipeline=pipeline)
+                if config.DOMAINS_CONFIG_WORKER_REQUEST_HOSTNAMES_ENABLED:
+                    domains_config.keys.worker_request_hostnames.add_many(self.id, [request_hostname], pipeline=pipeline)
 
     def __str__(self):
         res = {}
         for key in dir(self):
-            if key.startswith('__') and key.endswith('__'):
+            if (key.startswith('__') and key.endswith('__')) or key == '_hostnames_index':
                 continue
             value = getattr(self, key)
             if callable(value):
@@ -310,6 +1089,12 @@ class VolumeConfig:
             print(res)
             raise
 
+    # index of the hostnames for matching request hostnames, built on first use and kept with the volume config
+    def get_hostnames_index(self):
+        if self._hostnames_index is None:
+            self._hostnames_index = common.HostnameIndex(self.hostnames)
+        return self._hostnames_index
+
     def update_for_hostname(self, hostname):
         if not self._original_gateway and hostname:
             if not self.is_valid_zone_for_cluster and self.primary_hostname and not common.is_hostnames_match(hostname, self.primary_hostname):
@@ -368,7 +1153,7 @@ class VolumeConfig:
     def fix_minio_extra_configs(self, minio_extra_configs):
         """fix some configuration errors in source volume config data"""
         if minio_extra_configs.get('metricsLogger'):
-            metricsLogger = minio_extra_configs['metricsLogger']
+            metricsLogger = minio_extra_configs['metricsLogger'] = dict(minio_extra_configs['metricsLogger'])
             if (
                 metricsLogger.get('LOG_PROVIDER') == 's3'
                 and metricsLogger.get('S3_NON_AWS_TARGET')
@@ -381,7 +1166,293 @@ class VolumeConfig:
         return minio_extra_configs
 
 
+class VolumeConfigCache:
+    _metrics = None
+
+    # in-process LRU cache of parsed VolumeConfig objects by worker id and request hostname
+    # cached objects are shared between callers and should not be modified
+    def __init__(self, domains_config):
+        self.domains_config = domains_config
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # incremented on every invalidation, entries which were loaded before an invalidation are not stored
+        self.generation = 0
+        self.version = None
+        self.notifications_threads = None
+        if VolumeConfigCache._metrics is None:
+            VolumeConfigCache._metrics = metrics.VolumeConfigCacheMetrics()
+        self.metrics = VolumeConfigCache._metrics
+
+    def _on_notification(self, key, key_event):
+        worker_id = self.domains_config.keys.volume_config.get_param(key)
+        if not key.startswith('{}:'.format(self.domains_config.keys.volume_config_hostname_worker_id.key_prefix)):
+            self.invalidate(worker_id)
+
+    def _check_invalidation(self):
+        if config.VOLUME_CONFIG_CACHE_INVALIDATION == 'version':
+            version = self.domains_config.keys.volume_config.get_version()
+            if version != self.version:
+                self.invalidate()
+                self.version = version
+        elif self.notifications_threads is None:
+            self.notifications_threads = self.domains_config.start_keyspace_notifications_threads(
+                [self.domains_config.keys.volume_config], self._on_notification, on_error=self.invalidate
+            )
+
+    # returns a tuple of the cached volume config (or None) and the cache generation which should be passed to set
+    def get(self, worker_id, request_hostname):
+        self._check_invalidation()
+        with self.lock:
+            entry = self.entries.get((worker_id, request_hostname))
+            if entry is not None and time.monotonic() - entry[1] < config.VOLUME_CONFIG_CACHE_TTL_SECONDS:
+                self.entries.move_to_end((worker_id, request_hostname))
+                self.metrics.hit()
+                return entry[0], self.generation
+            else:
+                self.metrics.miss()
+                return None, self.generation
+
+    def set(self, worker_id, request_hostname, volume_config, generation):
+        with self.lock:
+            if generation == self.generation:
+                self.entries[(worker_id, request_hostname)] = (volume_config, time.monotonic())
+                self.entries.move_to_end((worker_id, request_hostname))
+                while len(self.entries) > config.VOLUME_CONFIG_CACHE_MAX_SIZE:
+                    self.entries.popitem(last=False)
+
+    # worker_id - invalidate the entries of this worker id
+    # request_hostnames - invalidate the entries of these request hostnames
+    # if neither is provided all entries are invalidated
+    def invalidate(self, worker_id=None, request_hostnames=None):
+        with self.lock:
+            self.generation += 1
+            if worker_id is None and request_hostnames is None:
+                self.entries.clear()
+            else:
+                request_hostnames = set(request_hostnames or [])
+                for key in [key for key in self.entries if key[0] == worker_id or key[1] in request_hostnames]:
+                    del self.entries[key]
+            self.metrics.invalidate()
+
+
+class KeysSummaryCache:
+
+    # caches the keys summary of all workers for KEYS_SUMMARY_CACHE_TTL_SECONDS
+    # an expired summary is returned while it's refreshed in a background thread, unless it expired more than a TTL ago
+    def __init__(self, domains_config):
+        self.domains_config = domains_config
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.refreshing = set()
+
+    def _set(self, max_keys_per_summary):
+        summaries = self.domains_config.get_keys_summary_multi_domain(max_keys_per_summary)
+        with self.lock:
+            self.entries[max_keys_per_summary] = (summaries, time.monotonic())
+        return summaries
+
+    def _refresh(self, max_keys_per_summary):
+        try:
+            self._set(max_keys_per_summary)
+        except Exception as e:
+            logs.debug_info("exception: {}".format(e))
+            if config.DEBUG and config.DEBUG_VERBOSITY >= 3:
+                traceback.print_exc()
+        finally:
+            with self.lock:
+                self.refreshing.discard(max_keys_per_summary)
+
+    def get(self, max_keys_per_summary):
+        with self.lock:
+            entry = self.entries.get(max_keys_per_summary)
+            if entry is not None:
+                age_seconds = time.monotonic() - entry[1]
+                if age_seconds < config.KEYS_SUMMARY_CACHE_TTL_SECONDS * 2:
+                    if age_seconds >= config.KEYS_SUMMARY_CACHE_TTL_SECONDS and max_keys_per_summary not in self.refreshing:
+                        self.refreshing.add(max_keys_per_summary)
+                        threading.Thread(target=self._refresh, args=(max_keys_per_summary,), daemon=True).start()
+                    return entry[0]
+        return self._set(max_keys_per_summary)
+
+
+class DomainsConfigKeyOps:
+
+    def __init__(self):
+        self.keys = []
+        self.args = []
+
+    # ex - expiry in seconds
+    def set(self, key, value, ex=None):
+        self.keys.append(key)
+        if ex:
+            self.args += ['setex', ex, value]
+        else:
+            self.args += ['set', value]
+
+    def delete(self, *keys):
+        for key in keys:
+            self.keys.append(key)
+            self.args.append('del')
+
+    def delete_unless(self, key, value):
+        self.keys.append(key)
+        self.args += ['del_unless', value]
+
+    def sadd(self, key, member):
+        self.keys.append(key)
+        self.args += ['sadd', member]
+
+    def srem(self, key, member):
+        self.keys.append(key)
+        self.args += ['srem', member]
+
+    # score defaults to 0, for lexicographic range queries
+    def zadd(self, key, member, score=0):
+        self.keys.append(key)
+        self.args += ['zadd', score, member]
+
+    def zrem(self, key, member):
+        self.keys.append(key)
+        self.args += ['zrem', member]
+
+    def hset(self, key, field, value):
+        self.keys.append(key)
+        self.args += ['hset', field, value]
+
+    def hdel(self, key, field):
+        self.keys.append(key)
+        self.args += ['hdel', field]
+
+    def incr(self, key):
+        self.keys.append(key)
+        self.args.append('incr')
+
+    def hincrby(self, key, field, value):
+        self.keys.append(key)
+        self.args += ['hincrby', field, value]
+
+    def lpush(self, key, value):
+        self.keys.append(key)
+        self.args += ['lpush', value]
+
+    # field - if not empty, the key is a hash and the location is the hash field
+    def exists_before(self, key, field=''):
+        self.keys.append(key)
+        self.args += ['exists_before', field]
+
+    def exists_after(self, key, field=''):
+        self.keys.append(key)
+        self.args += ['exists_after', field]
+
+    # increments / decrements the counter key if any of the locations didn't exist before and exists after or vice versa
+    def count(self, key):
+        self.keys.append(key)
+        self.args.append('count')
+
+    def lrem(self, key, value):
+        self.keys.append(key)
+        self.args += ['lrem', value]
+
+    # yields tuples of (keys, args) of the operations of each slot, keeping the order of operations in each slot
+    # keyslot - a function which returns the cluster slot of a key
+    def iterate_slots_key_ops(self, keyslot):
+        slots_key_ops = OrderedDict()
+        i = 0
+        for key in self.keys:
+            num_args = 1 + KEY_OPS_NUM_VALUES[self.args[i]]
+            slot_keys, slot_args = slots_key_ops.setdefault(keyslot(key), ([], []))
+            slot_keys.append(key)
+            slot_args += self.args[i:i + num_args]
+            i += num_args
+        yield from slots_key_ops.values()
+
+
+class DomainsConfigPipeline:
+
+    def __init__(self, domains_config):
+        self.domains_config = domains_config
+        self.pipes = {}
+        self.messages = []
+        self.callbacks = []
+
+    def get_pipe(self, redis_pool_name):
+        if redis_pool_name not in self.pipes:
+            self.pipes[redis_pool_name] = DomainsConfigKeyOps()
+        return self.pipes[redis_pool_name]
+
+    def execute(self):
+        for redis_pool_name, key_ops in self.pipes.items():
+            if len(key_ops.keys) > 0:
+                with getattr(self.domains_config, 'get_{}_redis'.format(redis_pool_name))(key_name='key_ops') as r:
+                    if is_redis_cluster(r):
+                        # keys of different slots can't be modified atomically, operations are applied atomically per slot
+                        for keys, args in key_ops.iterate_slots_key_ops(r.keyslot):
+                            self.domains_config.key_ops_script(keys=keys, args=args, client=r)
+                    else:
+                        self.domains_config.key_ops_script(keys=key_ops.keys, args=key_ops.args, client=r)
+        for redis_pool_name in OrderedDict.fromkeys(redis_pool_name for redis_pool_name, _, _ in self.messages):
+            with getattr(self.domains_config, 'get_{}_redis'.format(redis_pool_name))(key_name='publish') as r:
+                messages = [(channel, message) for message_pool_name, channel, message in self.messages if message_pool_name == redis_pool_name]
+                if is_redis_cluster(r):
+                    for channel, message in messages:
+                        r.publish(channel, message)
+                else:
+                    pipe = r.pipeline(transaction=False)
+                    for channel, message in messages:
+                        pipe.publish(channel, message)
+                    pipe.execute()
+        for callback in self.callbacks:
+            callback()
+
+    # messages are published after all the key operations were applied, so subscribers see the modified keys
+    def publish(self, redis_pool_name, channel, message):
+        self.messages.append((redis_pool_name, channel, message))
+
+    # callbacks are called after all the key operations were applied and the messages were published
+    def on_execute(self, callback):
+        self.callbacks.append(callback)
+
+
+# read replica of a redis pool, used only while it's in sync with the primary
+class RedisReadReplica:
+
+    def __init__(self, domains_config, redis_pool):
+        self.domains_config = domains_config
+        self.redis_pool = redis_pool
+        self.last_check_time = None
+        self.is_in_sync = False
+
+    def check_in_sync(self):
+        try:
+            with self.domains_config.get_redis(self.redis_pool, key_name='read_replica') as r:
+                info = r.info('replication')
+        except redis.RedisError:
+            logs.debug_info('failed to get redis read replica replication info: {}'.format(traceback.format_exc()))
+            return False
+        return (
+            info.get('role') == 'slave' and info.get('master_link_status') == 'up'
+            and 0 <= info.get('master_last_io_seconds_ago', -1) <= config.REDIS_READ_REPLICA_MAX_LAG_SECONDS
+        )
+
+    # concurrent checks may run at the same time, in that case the last check result is used
+    def is_available(self):
+        now = time.monotonic()
+        if self.last_check_time is None or now - self.last_check_time >= config.REDIS_READ_REPLICA_CHECK_INTERVAL_SECONDS:
+            self.last_check_time = now
+            is_in_sync = self.check_in_sync()
+            if is_in_sync != self.is_in_sync:
+                logs.debug_info('redis read replica {}'.format('is in sync' if is_in_sync else 'is not in sync, falling back to primary'))
+            self.is_in_sync = is_in_sync
+        return self.is_in_sync
+
+    # called when a command on the replica failed, reads fall back to the primary until the next check
+    def set_failed(self):
+        self.last_check_time = time.monotonic()
+        self.is_in_sync = False
+
+
 class DomainsConfig:
+    _redis_metrics = None
     WORKER_ERROR_TIMEOUT_WAITING_FOR_DEPLOYMENT = "TIMEOUT_WAITING_FOR_DEPLOYMENT"
     WORKER_ERROR_FAILED_TO_DEPLOY = "FAILED_TO_DEPLOY"
     WORKER_ERROR_INVALID_VOLUME_ZONE = "INVALID_VOLUME_ZONE"
@@ -409,43 +1480,194 @@ class DomainsConfig:
             config.METRICS_REDIS_POOL_MAX_CONNECTIONS, config.METRICS_REDIS_POOL_TIMEOUT,
             config.METRICS_REDIS_DB,
         )
-
-    def init_redis(self, type, host, port, pool_max_connections, pool_timeout, db):
+        self.read_replicas = {}
+        if not config.REDIS_CLUSTER_ENABLED:
+            for pool_name in REDIS_POOL_NAMES:
+                read_replica_host = getattr(config, '{}_REDIS_READ_REPLICA_HOST'.format(pool_name.upper()))
+                if read_replica_host:
+                    # the replica is not required to be available on startup, reads use the primary until it's in sync
+                    self.read_replicas[pool_name] = RedisReadReplica(self, self.init_redis(
+                        '{}_read_replica'.format(pool_name),
+                        read_replica_host, getattr(config, '{}_REDIS_READ_REPLICA_PORT'.format(pool_name.upper())),
+                        getattr(config, '{}_REDIS_POOL_MAX_CONNECTIONS'.format(pool_name.upper())),
+                        getattr(config, '{}_REDIS_POOL_TIMEOUT'.format(pool_name.upper())),
+                        getattr(config, '{}_REDIS_DB'.format(pool_name.upper())),
+                        ping=False
+                    ))
+        # scripts are registered once and executed using EVALSHA on the relevant pool
+        if config.REDIS_CLUSTER_ENABLED:
+            self.key_ops_script = ClusterScript(KEY_OPS_LUA)
+            self.prefix_index_prune_script = ClusterScript(PREFIX_INDEX_PRUNE_LUA)
+            self.worker_hash_migrate_script = ClusterScript(WORKER_HASH_MIGRATE_LUA)
+            self.hostname_deny_count_script = ClusterScript(HOSTNAME_DENY_COUNT_LUA)
+            self.counter_add_script = ClusterScript(COUNTER_ADD_LUA)
+            self.queue_due_items_script = ClusterScript(QUEUE_DUE_ITEMS_LUA)
+        else:
+            with self.get_internal_redis() as r:
+                self.key_ops_script = r.register_script(KEY_OPS_LUA)
+                self.prefix_index_prune_script = r.register_script(PREFIX_INDEX_PRUNE_LUA)
+                self.worker_hash_migrate_script = r.register_script(WORKER_HASH_MIGRATE_LUA)
+                self.hostname_deny_count_script = r.register_script(HOSTNAME_DENY_COUNT_LUA)
+                self.counter_add_script = r.register_script(COUNTER_ADD_LUA)
+                self.queue_due_items_script = r.register_script(QUEUE_DUE_ITEMS_LUA)
+        self.volume_config_cache = VolumeConfigCache(self) if config.VOLUME_CONFIG_CACHE_MAX_SIZE > 0 else None
+        self.keys_summary_cache = KeysSummaryCache(self) if config.KEYS_SUMMARY_CACHE_TTL_SECONDS > 0 else None
+
+    # in redis cluster mode returns a RedisCluster client, which manages a connection pool for each cluster node
+    def init_redis(self, type, host, port, pool_max_connections, pool_timeout, db, ping=True):
         # print("{}: host={} port={}".format(type, host, port))
-        redis_pool = redis.BlockingConnectionPool(
-            max_connections=pool_max_connections, timeout=pool_timeout,
-            host=host, port=port, db=db, health_check_interval=10
-        )
-        r = redis.Redis(connection_pool=redis_pool)
-        try:
+        if config.REDIS_CLUSTER_ENABLED:
+            r = redis.cluster.RedisCluster(host=host, port=port, max_connections=pool_max_connections, health_check_interval=10)
             assert r.ping()
-        finally:
-            r.close()
+            return r
+        if config.REDIS_METRICS_ENABLED:
+            if DomainsConfig._redis_metrics is None:
+                DomainsConfig._redis_metrics = metrics.RedisMetrics()
+            redis_pool = InstrumentedBlockingConnectionPool(
+                max_connections=pool_max_connections, timeout=pool_timeout,
+                host=host, port=port, db=db, health_check_interval=10,
+                pool_name=type, redis_metrics=DomainsConfig._redis_metrics
+            )
+        else:
+            redis_pool = redis.BlockingConnectionPool(
+                max_connections=pool_max_connections, timeout=pool_timeout,
+                host=host, port=port, db=db, health_check_interval=10
+            )
+        if ping:
+            r = redis.Redis(connection_pool=redis_pool)
+            try:
+                assert r.ping()
+            finally:
+                r.close()
         return redis_pool
 
+    # key_name - name of the key which the commands are executed for, used to label redis metrics
     @contextmanager
-    def get_redis(self, redis_pool):
-        r = redis.Redis(connection_pool=redis_pool)
-        try:
-            yield r
-        finally:
-            r.close()
+    def get_redis(self, redis_pool, key_name=None):
+        if isinstance(redis_pool, redis.cluster.RedisCluster):
+            yield redis_pool
+        else:
+            if isinstance(redis_pool, InstrumentedBlockingConnectionPool):
+                r = InstrumentedRedis(connection_pool=redis_pool, key_name=key_name or 'other')
+            else:
+                r = redis.Redis(connection_pool=redis_pool)
+            try:
+                yield r
+            finally:
+                r.close()
 
     @contextmanager
-    def get_ingress_redis(self):
-        with self.get_redis(self.ingress_redis_pool) as r:
+    def get_ingress_redis(self, key_name=None):
+        with self.get_redis(self.ingress_redis_pool, key_name) as r:
             yield r
 
     @contextmanager
-    def get_internal_redis(self):
-        with self.get_redis(self.internal_redis_pool) as r:
+    def get_internal_redis(self, key_name=None):
+        with self.get_redis(self.internal_redis_pool, key_name) as r:
             yield r
 
     @contextmanager
-    def get_metrics_redis(self):
-        with self.get_redis(self.metrics_redis_pool) as r:
+    def get_metrics_redis(self, key_name=None):
+        with self.get_redis(self.metrics_redis_pool, key_name) as r:
             yield r
 
+    # for read-only commands which can tolerate replication lag (e.g. scans), uses the pool read replica if it's configured and in sync
+    @contextmanager
+    def get_read_redis(self, pool_name, key_name=None):
+        read_replica = self.read_replicas.get(pool_name)
+        if read_replica and read_replica.is_available():
+            try:
+                with self.get_redis(read_replica.redis_pool, key_name) as r:
+                    yield r
+            except redis.ConnectionError:
+                read_replica.set_failed()
+                raise
+        else:
+            with getattr(self, 'get_{}_redis'.format(pool_name))(key_name=key_name) as r:
+                yield r
+
+    # all write operations queued in the pipeline are executed on exit, using a single atomic script call per redis pool
+    # if pipeline is provided, operations are queued in it and are executed when it exits
+    @contextmanager
+    def pipeline(self, pipeline=None):
+        if pipeline is not None:
+            yield pipeline
+        else:
+            pipeline = DomainsConfigPipeline(self)
+            yield pipeline
+            pipeline.execute()
+
+    # makes sure redis publishes keyspace notifications for string commands, keeping any other enabled event types
+    # managed redis servers may not allow CONFIG commands, in that case notifications must be enabled on the server
+    def enable_keyspace_notifications(self, r):
+        try:
+            events = r.config_get('notify-keyspace-events').get('notify-keyspace-events', '')
+            missing_events = ''.join(
+                event for event in ['K', '$']
+                if event not in events and not (event == '$' and 'A' in events)
+            )
+            if missing_events:
+                r.config_set('notify-keyspace-events', events + missing_events)
+        except redis.ResponseError:
+            logs.debug_info('failed to enable redis keyspace notifications: {}'.format(traceback.format_exc()))
+
+    # starts background threads which call on_notification(key, event) for keyspace notifications of the given prefix keys
+    # on_error is called when the subscription connection fails, notifications may have been missed in that case
+    # returns the threads, which should be stopped using thread.stop()
+    def start_keyspace_notifications_threads(self, keys, on_notification, on_error=None, sleep_time_seconds=1.0):
+
+        def on_message(message):
+            on_notification(message['channel'].decode().split(':', 1)[1], message['data'].decode())
+
+        def exception_handler(exception, pubsub, thread):
+            logs.debug_info('keyspace notifications subscription error: {}'.format(exception))
+            if on_error:
+                on_error()
+            time.sleep(sleep_time_seconds)
+
+        threads = []
+        try:
+            for redis_pool_name in sorted(set(key.redis_pool_name for key in keys)):
+                redis_pool = getattr(self, '{}_redis_pool'.format(redis_pool_name))
+                with self.get_redis(redis_pool) as r:
+                    if isinstance(r, redis.cluster.RedisCluster):
+                        # in redis cluster mode notifications are published only by the node which holds the key
+                        db, node_clients = 0, [r.get_redis_connection(node) for node in r.get_primaries()]
+                    else:
+                        db, node_clients = redis_pool.connection_kwargs.get('db') or 0, [r]
+                    pubsubs = []
+                    for node_r in node_clients:
+                        self.enable_keyspace_notifications(node_r)
+                        pubsubs.append(node_r.pubsub(ignore_subscribe_messages=True))
+                for pubsub in pubsubs:
+                    pubsub.psubscribe(**{
+                        '__keyspace@{}__:{}:*'.format(db, key.key_prefix): on_message
+                        for key in keys if key.redis_pool_name == redis_pool_name
+                    })
+                    threads.append(pubsub.run_in_thread(sleep_time=sleep_time_seconds, daemon=True, exception_handler=exception_handler))
+        except:
+            for thread in threads:
+                thread.stop()
+            raise
+        return threads
+
+    # yields a threading.Event which is set whenever one of the given prefix keys is set
+    # deletions / expirations are ignored, as they don't indicate new work for the daemons
+    @contextmanager
+    def keyspace_notifications_event(self, keys, sleep_time_seconds=1.0):
+        event = threading.Event()
+
+        def on_notification(key, key_event):
+            if key_event not in ('del', 'expired', 'evicted'):
+                event.set()
+
+        threads = self.start_keyspace_notifications_threads(keys, on_notification, on_error=event.set, sleep_time_seconds=sleep_time_seconds)
+        try:
+            yield event
+        finally:
+            for thread in threads:
+                thread.stop()
+
     def get_worker_ids_ready_for_deployment(self):
         return list(self.keys.worker_ready_for_deployment.iterate_prefix_key_suffixes())
 
@@ -493,14 +1715,24 @@ class DomainsConfig:
             raise Exception("either hostname or worker_id param is required")
         start_time = common.now()
         val = None
+        cache_worker_id, cache_generation = None, None
+        hostname_worker_id = None
         if force_update:
             val = None
         elif hostname:
             cached_worker_id = self.keys.volume_config_hostname_worker_id.get(hostname)
             if cached_worker_id:
-                val = self.keys.volume_config.get(cached_worker_id.decode())
+                cache_worker_id = hostname_worker_id = cached_worker_id.decode()
         elif worker_id:
-            val = self.keys.volume_config.get(worker_id)
+            cache_worker_id = worker_id
+        if cache_worker_id:
+            if self.volume_config_cache:
+                volume_config, cache_generation = self.volume_config_cache.get(cache_worker_id, hostname)
+                if volume_config is not None:
+                    if metrics:
+                        metrics.cwm_api_volume_config_success_from_cache(cache_worker_id, start_time)
+                    return volume_config
+            val = self.keys.volume_config.get(cache_worker_id)
         if val is None:
             if hostname:
                 query_param = 'hostname'
@@ -533,25 +1765,82 @@ class DomainsConfig:
                     metrics.cwm_api_volume_config_success_from_api(worker_id or 'missing', start_time)
                 else:
                     metrics.cwm_api_volume_config_error_from_api(worker_id or 'missing', start_time)
-            return VolumeConfig(volume_config, self, request_hostname=hostname, is_data_from_cache=False, request_worker_id=worker_id)
+            # the previous volume config is needed to remove hostnames which are no longer in the volume config from the search index
+            previous_data = self.keys.volume_config.get_json(worker_id) if config.DOMAINS_CONFIG_SEARCH_INDEX_ENABLED and worker_id else None
+            volume_config = VolumeConfig(volume_config, self, request_hostname=hostname, is_data_from_cache=False, request_worker_id=worker_id,
+                                         request_hostname_worker_id=hostname_worker_id)
+            if worker_id:
+                # the volume config key was set from the api response
+                self.invalidate_volume_config_cache(worker_id=worker_id)
+            if config.DOMAINS_CONFIG_SEARCH_INDEX_ENABLED:
+                self.update_volume_config_search_index(volume_config, hostname, hostname_worker_id,
+                                                       previous_hostnames=self.get_volume_config_data_hostnames(previous_data) if worker_id else None)
+            return volume_config
         else:
-            volume_config = VolumeConfig(json.loads(val), self, request_hostname=hostname, is_data_from_cache=True, request_worker_id=worker_id)
+            data = value_codec.decode(val)
+            volume_config = VolumeConfig(data, self, request_hostname=hostname, is_data_from_cache=True, request_worker_id=worker_id,
+                                         request_hostname_worker_id=hostname_worker_id)
+            if config.DOMAINS_CONFIG_SEARCH_INDEX_ENABLED:
+                self.update_volume_config_search_index(volume_config, hostname, hostname_worker_id)
+            # cwm gateway volume configs depend on the volume config of another worker, so they are not cached
+            if self.volume_config_cache and not volume_config._error and not (data.get('type') == 'gateway' and data.get('provider') == 'cwm'):
+                self.volume_config_cache.set(cache_worker_id, hostname, volume_config, cache_generation)
             if metrics and (worker_id or volume_config.id):
                 metrics.cwm_api_volume_config_success_from_cache((worker_id or volume_config.id), start_time)
             return volume_config
 
-    def set_worker_error(self, worker_id, error_msg):
-        for hostname in self.iterate_worker_hostnames(worker_id):
-            self.keys.hostname_error.set(hostname, error_msg)
-        self.del_worker_keys(worker_id, with_error=False, with_volume_config=False, with_deployment_flow=False)
+    # the volume config cache of this process is invalidated when it modifies the volume config keys
+    # keyspace notifications / version checks are only needed to invalidate the caches of other processes
+    # pipeline - if provided, the cache is invalidated after the pipeline is executed
+    def invalidate_volume_config_cache(self, worker_id=None, request_hostnames=None, pipeline=None):
+        volume_config_cache = self.volume_config_cache
+        if volume_config_cache:
+            if pipeline is None:
+                volume_config_cache.invalidate(worker_id=worker_id, request_hostnames=request_hostnames)
+            else:
+                pipeline.on_execute(lambda: volume_config_cache.invalidate(worker_id=worker_id, request_hostnames=request_hostnames))
 
-    def set_worker_error_by_hostname(self, hostname, error_msg):
-        self.keys.hostname_error.set(hostname, error_msg)
-        self.del_worker_hostname_keys(hostname, with_error=False, with_deployment_flow=False)
-        try:
-            self.set_worker_error(self.get_cwm_api_volume_config(hostname=hostname).id, error_msg)
-        except:
-            pass
+    # hostnames_data - dict of hostname to the event data, see hostname_events
+    def publish_hostname_events(self, event, hostnames_data, pipeline):
+        if config.DOMAINS_CONFIG_HOSTNAME_EVENTS_ENABLED:
+            publish_time_ms = int(time.time() * 1000)
+            for hostname, data in hostnames_data.items():
+                pipeline.publish('ingress', config.DOMAINS_CONFIG_HOSTNAME_EVENTS_CHANNEL, hostname_events.dumps(hostname, event, data, publish_time_ms))
+
+    def set_worker_error(self, worker_id, error_msg, pipeline=None):
+        hostnames = list(self.iterate_worker_hostnames(worker_id))
+        with self.pipeline(pipeline) as pipeline:
+            self.keys.hostname_error.set_many({hostname: error_msg for hostname in hostnames}, pipeline=pipeline)
+            self.publish_hostname_events(hostname_events.EVENT_ERROR, {hostname: error_msg for hostname in hostnames}, pipeline)
+            self.del_worker_keys(worker_id, with_error=False, with_volume_config=False, with_deployment_flow=False,
+                                 hostnames=hostnames, pipeline=pipeline)
+
+    # with_worker - set the error for all hostnames of the hostname's worker, requires getting the volume config of the hostname
+    def set_worker_error_by_hostname(self, hostname, error_msg, with_worker=True):
+        with self.pipeline() as pipeline:
+            self.keys.hostname_error.set_many({hostname: error_msg}, pipeline=pipeline)
+            self.publish_hostname_events(hostname_events.EVENT_ERROR, {hostname: error_msg}, pipeline)
+            self.del_worker_hostname_keys(hostname, with_error=False, with_deployment_flow=False, pipeline=pipeline)
+        if with_worker:
+            try:
+                self.set_worker_error(self.get_cwm_api_volume_config(hostname=hostname).id, error_msg)
+            except:
+                pass
+
+    # denies the hostname with exponential backoff, returns the deny duration in seconds
+    def deny_hostname(self, hostname):
+        with self.keys.hostname_deny_count.get_redis() as r:
+            deny_count, deny_seconds = self.hostname_deny_count_script(
+                keys=[self.keys.hostname_deny_count._(hostname)],
+                args=[config.HOSTNAME_DENY_MIN_SECONDS, config.HOSTNAME_DENY_MAX_SECONDS, config.HOSTNAME_DENY_DECAY_SECONDS],
+                client=r
+            )
+        with self.keys.hostname_deny.get_redis() as r:
+            r.set(self.keys.hostname_deny._(hostname), deny_count, ex=deny_seconds)
+        return deny_seconds
+
+    def is_hostname_denied(self, hostname):
+        return bool(self.keys.hostname_deny.exists(hostname))
 
     def increment_worker_error_attempt_number(self, hostname):
         attempt_number = self.keys.hostname_error_attempt_number.get(hostname)
@@ -560,17 +1849,20 @@ class DomainsConfig:
         return attempt_number + 1
 
     def set_worker_ready_for_deployment(self, worker_id):
-        self.keys.worker_ready_for_deployment.set(worker_id, common.now().strftime("%Y%m%dT%H%M%S.%f"))
+        with self.pipeline() as pipeline:
+            self.keys.worker_ready_for_deployment.set_many({worker_id: common.format_datetime(common.now(), "%Y%m%dT%H%M%S.%f")}, pipeline=pipeline)
+            if config.DEPLOYMENT_FLOW_QUEUES_ENABLED:
+                self.keys.worker_ready_for_deployment_queue.push_many([worker_id], pipeline=pipeline)
 
     def get_worker_ready_for_deployment_start_time(self, worker_id):
         try:
-            dt = common.strptime(self.keys.worker_ready_for_deployment.get(worker_id).decode(), "%Y%m%dT%H%M%S.%f")
+            dt = common.parse_datetime(self.keys.worker_ready_for_deployment.get(worker_id))
         except Exception as e:
             logs.debug_info("exception: {}".format(e), worker_id=worker_id)
             if config.DEBUG and config.DEBUG_VERBOSITY >= 3:
                 traceback.print_exc()
-            dt = common.now()
-        return dt
+            dt = None
+        return dt if dt else common.now()
 
     def get_volume_config_namespace_from_worker_id(self, metrics, worker_id):
         volume_config = self.get_cwm_api_volume_config(worker_id=worker_id, metrics=metrics)
@@ -578,7 +1870,17 @@ class DomainsConfig:
         return volume_config, namespace_name
 
     def set_worker_waiting_for_deployment(self, worker_id, wait_for_error=False):
-        self.keys.worker_waiting_for_deployment_complete.set(worker_id, 'error' if wait_for_error else '')
+        with self.pipeline() as pipeline:
+            self.keys.worker_waiting_for_deployment_complete.set_many({worker_id: 'error' if wait_for_error else ''}, pipeline=pipeline)
+            if config.DEPLOYMENT_FLOW_QUEUES_ENABLED:
+                self.keys.worker_waiting_for_deployment_complete_queue.push_many([worker_id], pipeline=pipeline)
+
+    # worker remains ready for deployment, so it's handed back to the deployer
+    def del_worker_waiting_for_deployment(self, worker_id):
+        with self.pipeline() as pipeline:
+            self.keys.worker_waiting_for_deployment_complete.delete_many([worker_id], pipeline=pipeline)
+            if config.DEPLOYMENT_FLOW_QUEUES_ENABLED:
+                self.keys.worker_ready_for_deployment_queue.push_many([worker_id], pipeline=pipeline)
 
     def get_worker_deployment_attempt_number(self, worker_id):
         return self.keys.worker_deployment_error_attempt.get(worker_id)
@@ -591,16 +1893,13 @@ class DomainsConfig:
             return True
         if self.keys.worker_ready_for_deployment.exists(worker_id):
             return True
-        for hostname in self.iterate_worker_hostnames(worker_id):
-            if self.keys.hostname_initialize.exists(hostname):
-                return True
-        return False
+        return any(self.keys.hostname_initialize.exists_many(self.iterate_worker_hostnames(worker_id)))
 
     def iterate_ingress_hostname_worker_ids(self):
-        with self.keys.hostname_ingress_hostname.get_redis() as r:
-            for key in r.keys(self.keys.hostname_ingress_hostname.key_template.format("*")):
+        with self.keys.hostname_ingress_hostname.get_read_redis() as r:
+            for key in scan_iter(r, self.keys.hostname_ingress_hostname._("*"), count=config.DOMAINS_CONFIG_SCAN_COUNT):
                 try:
-                    hostname = key.decode().replace(self.keys.hostname_ingress_hostname.key_template.format(""), '')
+                    hostname = self.keys.hostname_ingress_hostname.get_param(key.decode())
                     for protocol, internal_hostname in json.loads(self.keys.hostname_ingress_hostname.get(hostname)).items():
                         namespace_name = cwm_worker_deployment.deployment.get_namespace_name_from_hostname('minio', protocol, internal_hostname)
                         break
@@ -611,100 +1910,223 @@ class DomainsConfig:
 
     def iterate_worker_hostnames(self, worker_id):
         all_yielded_hostnames = set()
-        volume_hostnames = set()
-        for hostname in self.get_cwm_api_volume_config(worker_id=worker_id).hostnames:
-            volume_hostnames.add(hostname.lower())
+        volume_config = self.get_cwm_api_volume_config(worker_id=worker_id)
+        volume_hostnames = volume_config.get_hostnames_index()
+        for hostname in volume_config.hostnames:
             yield hostname
             all_yielded_hostnames.add(hostname.lower())
-        for hostnames_iterator in [
-            self.get_hostnames_waiting_for_initialization,
-            self.keys.hostname_error.iterate_prefix_key_suffixes,
-            self.keys.hostname_available.iterate_prefix_key_suffixes
-        ]:
-            for request_hostname in hostnames_iterator():
-                if request_hostname.lower() in all_yielded_hostnames:
-                    continue
-                if common.is_hostnames_match_in_list(request_hostname, volume_hostnames):
+        if config.DOMAINS_CONFIG_WORKER_REQUEST_HOSTNAMES_ENABLED:
+            request_hostnames = [
+                request_hostname for request_hostname in sorted(self.keys.worker_request_hostnames.get(worker_id))
+                if request_hostname.lower() not in all_yielded_hostnames and request_hostname in volume_hostnames
+            ]
+            # the set may contain hostnames which no longer have keys, only hostnames which have keys are yielded
+            for request_hostname, *hostname_keys_exist in zip(
+                request_hostnames,
+                self.keys.hostname_initialize.exists_many(request_hostnames),
+                self.keys.hostname_error.exists_many(request_hostnames),
+                self.keys.hostname_available.exists_many(request_hostnames)
+            ):
+                if any(hostname_keys_exist) and request_hostname.lower() not in all_yielded_hostnames:
                     yield request_hostname
                     all_yielded_hostnames.add(request_hostname.lower())
+        else:
+            for hostnames_iterator in [
+                self.get_hostnames_waiting_for_initialization,
+                self.keys.hostname_error.iterate_prefix_key_suffixes,
+                self.keys.hostname_available.iterate_prefix_key_suffixes
+            ]:
+                for request_hostname in hostnames_iterator():
+                    if request_hostname.lower() in all_yielded_hostnames:
+                        continue
+                    if request_hostname in volume_hostnames:
+                        yield request_hostname
+                        all_yielded_hostnames.add(request_hostname.lower())
+
+    # adds the hostnames which have keys to the request hostnames set of their worker
+    # should run once before enabling DOMAINS_CONFIG_WORKER_REQUEST_HOSTNAMES_ENABLED on existing data
+    def backfill_worker_request_hostnames(self):
+        num_hostnames = 0
+        hostnames = set()
+        for hostnames_iterator in [
+            self.keys.hostname_initialize.scan_prefix_key_suffixes,
+            self.keys.hostname_error.scan_prefix_key_suffixes,
+            self.keys.hostname_available.scan_prefix_key_suffixes
+        ]:
+            hostnames.update(hostnames_iterator(use_read_replica=False))
+        hostnames = sorted(hostnames)
+        for hostname, volume_config_worker_id, last_deployment_flow_worker_id in zip(
+            hostnames,
+            self.keys.volume_config_hostname_worker_id.get_many(hostnames),
+            self.keys.hostname_last_deployment_flow_worker_id.get_many(hostnames)
+        ):
+            worker_id = volume_config_worker_id or last_deployment_flow_worker_id
+            if worker_id:
+                self.keys.worker_request_hostnames.add_many(worker_id.decode(), [hostname])
+                num_hostnames += 1
+        return num_hostnames
+
+    def get_worker_search_index_entries(self, worker_id, hostnames):
+        entries = [(DomainsConfigKeyLexIndex.TYPE_WORKER, worker_id)]
+        try:
+            entries.append((DomainsConfigKeyLexIndex.TYPE_NAMESPACE, common.get_namespace_name_from_worker_id(worker_id)))
+        except common.InvalidWorkerIdException:
+            # invalid worker ids don't have a namespace
+            pass
+        entries += [(DomainsConfigKeyLexIndex.TYPE_HOSTNAME, hostname) for hostname in hostnames]
+        return entries
+
+    def get_volume_config_data_hostnames(self, data):
+        return [hostname['hostname'] for hostname in ((data or {}).get('minio_extra_configs') or {}).get('hostnames', [])]
+
+    # all the hostnames of the worker which may be in the search index, in addition to the given hostnames
+    def get_worker_search_index_hostnames(self, worker_id, hostnames=None):
+        all_hostnames = set(hostnames or [])
+        all_hostnames.update(self.get_volume_config_data_hostnames(self.keys.volume_config.get_json(worker_id)))
+        all_hostnames.update(self.keys.worker_request_hostnames.get(worker_id))
+        return sorted(all_hostnames)
+
+    # previous_hostnames - the hostnames of the previously stored volume config, if the volume config was fetched from the api
+    #                      the worker entries are updated and hostnames which are no longer in the volume config are removed
+    def update_volume_config_search_index(self, volume_config, request_hostname=None, request_hostname_worker_id=None, previous_hostnames=None):
+        if volume_config.id is None:
+            return
+        with self.pipeline() as pipeline:
+            if previous_hostnames is not None:
+                removed_hostnames = set(previous_hostnames) - set(volume_config.hostnames)
+                self.keys.search_index.remove_many([(DomainsConfigKeyLexIndex.TYPE_HOSTNAME, hostname) for hostname in sorted(removed_hostnames)], pipeline=pipeline)
+                self.keys.search_index.add_many(self.get_worker_search_index_entries(volume_config.id, volume_config.hostnames), pipeline=pipeline)
+            if request_hostname and volume_config.id != request_hostname_worker_id:
+                self.keys.search_index.add_many([(DomainsConfigKeyLexIndex.TYPE_HOSTNAME, request_hostname)], pipeline=pipeline)
+
+    # adds the workers and hostnames of the existing volume config keys to the search index
+    def backfill_search_index(self):
+        num_entries = 0
+        for worker_id in list(self.keys.volume_config.iterate_prefix_key_suffixes(use_read_replica=False)):
+            if ':' in worker_id:
+                # keys of other prefix keys under the volume config prefix (e.g. the hostname worker id keys)
+                continue
+            data = self.keys.volume_config.get_json(worker_id)
+            if data and data.get('instanceId'):
+                entries = self.get_worker_search_index_entries(worker_id, self.get_volume_config_data_hostnames(data))
+                self.keys.search_index.add_many(entries)
+                num_entries += len(entries)
+        hostnames = list(self.keys.volume_config_hostname_worker_id.iterate_prefix_key_suffixes(use_read_replica=False))
+        self.keys.search_index.add_many((DomainsConfigKeyLexIndex.TYPE_HOSTNAME, hostname) for hostname in hostnames)
+        return num_entries + len(hostnames)
 
     def set_worker_available(self, worker_id, ingress_hostname):
         # del_worker_keys deletes the initialize hostname keys which are used to
         # determine the list of hostnames to set available, so we need to keep
         # the list of hostnames in a variable here
         hostnames = list(self.iterate_worker_hostnames(worker_id))
-        self.del_worker_keys(worker_id, with_volume_config=False, with_available=False, with_ingress=False, with_deployment_flow=False)
-        for hostname in hostnames:
-            self.keys.hostname_available.set(hostname, '')
-            self.keys.hostname_ingress_hostname.set(hostname, json.dumps(ingress_hostname))
+        with self.pipeline() as pipeline:
+            self.del_worker_keys(worker_id, with_volume_config=False, with_available=False, with_ingress=False, with_deployment_flow=False,
+                                 hostnames=hostnames, pipeline=pipeline)
+            self.keys.hostname_available.set_many({hostname: '' for hostname in hostnames}, pipeline=pipeline)
+            self.keys.hostname_ingress_hostname.set_many({hostname: json.dumps(ingress_hostname) for hostname in hostnames}, pipeline=pipeline)
+            self.publish_hostname_events(hostname_events.EVENT_AVAILABLE, {hostname: ingress_hostname for hostname in hostnames}, pipeline)
 
     def is_worker_available(self, worker_id):
-        num_availale_hostnames = 0
-        for hostname in self.iterate_worker_hostnames(worker_id):
-            if not self.keys.hostname_available.exists(hostname):
-                return False
-            num_availale_hostnames += 1
-        return num_availale_hostnames > 0
+        hostnames_available = self.keys.hostname_available.exists_many(self.iterate_worker_hostnames(worker_id))
+        return len(hostnames_available) > 0 and all(hostnames_available)
 
     def del_worker_hostname_keys(self, hostname,
                                  with_error=True, with_available=True, with_ingress=True,
-                                 with_deployment_flow=True, with_throttle=False):
-        self.keys.hostname_initialize.delete(hostname)
-        self.keys.volume_config_hostname_worker_id.delete(hostname)
-        if with_available:
-            self.keys.hostname_available.delete(hostname)
-        if with_ingress:
-            self.keys.hostname_ingress_hostname.delete(hostname)
-        if with_error:
-            if with_throttle or self.keys.hostname_error.get(hostname) != self.WORKER_ERROR_THROTTLED.encode():
-                self.keys.hostname_error.delete(hostname)
-            self.keys.hostname_error_attempt_number.delete(hostname)
-        if with_deployment_flow:
-            self.keys.hostname_last_deployment_flow_action.delete(hostname)
-            self.keys.hostname_last_deployment_flow_time.delete(hostname)
-            self.keys.hostname_last_deployment_flow_worker_id.delete(hostname)
-
+                                 with_deployment_flow=True, with_throttle=False, pipeline=None):
+        self.del_worker_hostnames_keys([hostname],
+                                       with_error=with_error, with_available=with_available, with_ingress=with_ingress,
+                                       with_deployment_flow=with_deployment_flow, with_throttle=with_throttle, pipeline=pipeline)
+
+    def del_worker_hostnames_keys(self, hostnames,
+                                  with_error=True, with_available=True, with_ingress=True,
+                                  with_deployment_flow=True, with_throttle=False, pipeline=None):
+        hostnames = list(hostnames)
+        if len(hostnames) == 0:
+            return
+        with self.pipeline(pipeline) as pipeline:
+            self.keys.hostname_initialize.delete_many(hostnames, pipeline=pipeline)
+            self.keys.volume_config_hostname_worker_id.delete_many(hostnames, pipeline=pipeline)
+            self.invalidate_volume_config_cache(request_hostnames=hostnames, pipeline=pipeline)
+            if with_available:
+                self.keys.hostname_available.delete_many(hostnames, pipeline=pipeline)
+            if with_ingress:
+                self.keys.hostname_ingress_hostname.delete_many(hostnames, pipeline=pipeline)
+            if with_error:
+                self.keys.hostname_error.delete_many(hostnames, pipeline=pipeline,
+                                                     unless_value=None if with_throttle else self.WORKER_ERROR_THROTTLED)
+                self.keys.hostname_error_attempt_number.delete_many(hostnames, pipeline=pipeline)
+            if with_deployment_flow:
+                self.keys.hostname_last_deployment_flow_action.delete_many(hostnames, pipeline=pipeline)
+                self.keys.hostname_last_deployment_flow_time.delete_many(hostnames, pipeline=pipeline)
+                self.keys.hostname_last_deployment_flow_worker_id.delete_many(hostnames, pipeline=pipeline)
+            if with_available and with_error:
+                # when only some of the keys are deleted, the caller publishes the event of the keys it sets instead
+                self.publish_hostname_events(hostname_events.EVENT_DELETED, {hostname: None for hostname in hostnames}, pipeline)
+
+    # hostnames - list of the worker hostnames, if not provided they are fetched using iterate_worker_hostnames
     def del_worker_keys(self, worker_id,
                         with_error=True, with_volume_config=True, with_available=True,
                         with_ingress=True, with_metrics=False, with_deployment_flow=True,
-                        with_force_delete_data=False, with_throttle=False
+                        with_force_delete_data=False, with_throttle=False,
+                        hostnames=None, pipeline=None
                         ):
-        try:
-            for hostname in self.iterate_worker_hostnames(worker_id):
-                self.del_worker_hostname_keys(hostname,
-                                              with_error=with_error, with_available=with_available,
-                                              with_ingress=with_ingress, with_deployment_flow=with_deployment_flow,
-                                              with_throttle=with_throttle)
-        except:
-            print("Failed to delete worker hostname keys")
-            traceback.print_exc()
-        self.keys.worker_ready_for_deployment.delete(worker_id)
-        self.keys.worker_deployment_error_attempt.delete(worker_id)
-        self.keys.worker_waiting_for_deployment_complete.delete(worker_id)
-        self.keys.worker_force_update.delete(worker_id)
-        self.keys.worker_force_delete.delete(worker_id)
-        self.keys.worker_last_clear_cache.delete(worker_id)
-        self.keys.worker_health.delete(worker_id)
-        if with_metrics:
-            self.keys.worker_aggregated_metrics.delete(worker_id)
-            self.keys.worker_aggregated_metrics_last_sent_update.delete(worker_id)
-            self.keys.worker_total_used_bytes.delete(worker_id)
-            namespace_name = common.get_namespace_name_from_worker_id(worker_id)
-            self.keys.deployment_last_action.delete(namespace_name)
-            with self.keys.deployment_api_metric.get_redis() as r:
-                keys = r.keys(self.keys.deployment_api_metric._('{}:*'.format(namespace_name)))
+        with self.pipeline(pipeline) as pipeline:
+            try:
+                if hostnames is None:
+                    hostnames = list(self.iterate_worker_hostnames(worker_id))
+                self.del_worker_hostnames_keys(hostnames,
+                                               with_error=with_error, with_available=with_available,
+                                               with_ingress=with_ingress, with_deployment_flow=with_deployment_flow,
+                                               with_throttle=with_throttle, pipeline=pipeline)
+            except:
+                print("Failed to delete worker hostname keys")
+                traceback.print_exc()
+            worker_keys = [
+                self.keys.worker_ready_for_deployment,
+                self.keys.worker_deployment_error_attempt,
+                self.keys.worker_waiting_for_deployment_complete,
+                self.keys.worker_force_update,
+                self.keys.worker_force_delete,
+                self.keys.worker_last_clear_cache,
+                self.keys.worker_health,
+            ]
+            if with_metrics:
+                worker_keys += [
+                    self.keys.worker_aggregated_metrics,
+                    self.keys.worker_aggregated_metrics_last_sent_update,
+                    self.keys.worker_total_used_bytes,
+                ]
+                namespace_name = common.get_namespace_name_from_worker_id(worker_id)
+                self.keys.deployment_last_action.delete_many([namespace_name], pipeline=pipeline)
+                self.keys.deployment_api_metric.delete_many([namespace_name], pipeline=pipeline)
+                with self.keys.deployment_api_metric.get_redis() as r:
+                    keys = list(scan_iter(r, self.keys.deployment_api_metric._('{}:*'.format(namespace_name)), count=config.DOMAINS_CONFIG_SCAN_COUNT))
                 if keys:
-                    r.delete(*keys)
-        if with_volume_config:
-            self.keys.volume_config.delete(worker_id)
-        if with_deployment_flow:
-            self.keys.worker_last_deployment_flow_action.delete(worker_id)
-            self.keys.worker_last_deployment_flow_time.delete(worker_id)
-        if with_force_delete_data:
-            self.keys.worker_force_delete_data.delete(worker_id)
-        if with_throttle:
-            self.keys.worker_throttled_expiry.delete(worker_id)
-            self.keys.worker_last_throttle_check.delete(worker_id)
+                    pipeline.get_pipe(self.keys.deployment_api_metric.redis_pool_name).delete(*keys)
+            if with_volume_config:
+                worker_keys.append(self.keys.volume_config)
+                self.invalidate_volume_config_cache(worker_id=worker_id, pipeline=pipeline)
+                # worker ids which are not a str (e.g. bytes) don't match the volume config key either
+                if config.DOMAINS_CONFIG_SEARCH_INDEX_ENABLED and isinstance(worker_id, str):
+                    self.keys.search_index.remove_many(self.get_worker_search_index_entries(worker_id, self.get_worker_search_index_hostnames(worker_id, hostnames)), pipeline=pipeline)
+            if with_error and with_available:
+                # all the worker hostname keys were deleted
+                worker_keys.append(self.keys.worker_request_hostnames)
+            if with_deployment_flow:
+                worker_keys += [
+                    self.keys.worker_last_deployment_flow_action,
+                    self.keys.worker_last_deployment_flow_time,
+                ]
+            if with_force_delete_data:
+                worker_keys.append(self.keys.worker_force_delete_data)
+            if with_throttle:
+                worker_keys += [
+                    self.keys.worker_throttled_expiry,
+                    self.keys.worker_last_throttle_check,
+                ]
+            for key in worker_keys:
+                key.delete_many([worker_id], pipeline=pipeline)
 
     def set_worker_force_update(self, worker_id):
         self.keys.worker_force_update.set(worker_id, '')
@@ -737,6 +2159,35 @@ class DomainsConfig:
     def get_worker_ids_force_update(self):
         return list(self.keys.worker_force_update.iterate_prefix_key_suffixes())
 
+    # returns a dict of key name to the set of suffixes of each of the given prefix keys, read from the primary
+    # keys which are not indexed are scanned together, each round trip is a pipeline with a SCAN of each key prefix which wasn't completed yet
+    # in cluster mode each key is scanned separately, because SCAN has to be sent to each of the primary nodes
+    def get_prefix_keys_suffixes(self, key_names):
+        suffixes = {}
+        pool_scan_keys = {}
+        for key_name in key_names:
+            key = getattr(self.keys, key_name)
+            if key.is_indexed() or config.REDIS_CLUSTER_ENABLED:
+                suffixes[key_name] = set(key.iterate_prefix_key_suffixes(use_read_replica=False))
+            else:
+                suffixes[key_name] = set()
+                pool_scan_keys.setdefault(key.redis_pool_name, []).append(key)
+        for scan_keys in pool_scan_keys.values():
+            cursors = {key.key_name: 0 for key in scan_keys}
+            with scan_keys[0].get_redis() as r:
+                while cursors:
+                    pipe = r.pipeline(transaction=False)
+                    for key_name, cursor in cursors.items():
+                        pipe.scan(cursor, match='{}:*'.format(getattr(self.keys, key_name).key_prefix), count=config.DOMAINS_CONFIG_SCAN_COUNT)
+                    for key_name, (cursor, keys) in zip(list(cursors), pipe.execute()):
+                        key = getattr(self.keys, key_name)
+                        suffixes[key_name].update(key.get_param(k.decode()) for k in keys)
+                        if cursor:
+                            cursors[key_name] = cursor
+                        else:
+                            del cursors[key_name]
+        return suffixes
+
     def get_worker_aggregated_metrics(self, worker_id, clear=False):
         with self.keys.worker_aggregated_metrics.get_redis() as r:
             if clear:
@@ -749,21 +2200,52 @@ class DomainsConfig:
                 return None
 
     def get_deployment_api_metrics(self, namespace_name):
+        if config.DEPLOYMENT_API_METRICS_HASH_ENABLED:
+            values = self.keys.deployment_api_metric.get_hash(namespace_name)
+            if values:
+                return values
+        # legacy layout - a string key per metric
         with self.keys.deployment_api_metric.get_redis() as r:
             base_key = "{}:".format(self.keys.deployment_api_metric._(namespace_name))
             return {
                 key.decode().replace(base_key, ""): r.get(key).decode()
-                for key in r.keys(base_key + "*")
+                for key in scan_iter(r, base_key + "*", count=config.DOMAINS_CONFIG_SCAN_COUNT)
             }
 
     def update_deployment_api_metrics(self, namespace_name, data):
         from .kafka_streamer import DEPLOYMENT_API_METRICS_BASE_DATA
         assert data.keys() == DEPLOYMENT_API_METRICS_BASE_DATA.keys()
-        base_key = "{}:".format(self.keys.deployment_api_metric._(namespace_name))
-        with self.keys.deployment_api_metric.get_redis() as r:
-            for metric_key, value in data.items():
-                key = f'{base_key}{metric_key}'
-                r.incrby(key, value)
+        if config.DEPLOYMENT_API_METRICS_HASH_ENABLED:
+            self.keys.deployment_api_metric.increment_hash(namespace_name, data)
+        else:
+            base_key = "{}:".format(self.keys.deployment_api_metric._(namespace_name))
+            with self.keys.deployment_api_metric.get_redis() as r:
+                for metric_key, value in data.items():
+                    key = f'{base_key}{metric_key}'
+                    r.incrby(key, value)
+
+    # moves the legacy deployment api metric string keys to the per-namespace hashes, should run after enabling DEPLOYMENT_API_METRICS_HASH_ENABLED
+    # after enabling, metrics are incremented only in the hashes, so legacy values are added to the hash values
+    # returns the number of moved metrics
+    def migrate_deployment_api_metrics(self):
+        assert config.DEPLOYMENT_API_METRICS_HASH_ENABLED, 'deployment api metrics hash must be enabled before migration'
+        key = self.keys.deployment_api_metric
+        num_moved = 0
+        with key.get_redis() as r:
+            for legacy_key in list(scan_iter(r, key._('*:*'), count=config.DOMAINS_CONFIG_SCAN_COUNT)):
+                namespace_name, metric = legacy_key.decode()[len(key.key_prefix) + 1:].split(':', 1)
+                value = r.get(legacy_key)
+                if value is not None:
+                    value = value.decode()
+                    pipe = r.pipeline(transaction=False)
+                    if '.' in value:
+                        pipe.hincrbyfloat(key._(namespace_name), metric, float(value))
+                    else:
+                        pipe.hincrby(key._(namespace_name), metric, int(value))
+                    pipe.delete(legacy_key)
+                    pipe.execute()
+                    num_moved += 1
+        return num_moved
 
     def set_worker_aggregated_metrics(self, worker_id, agg_metrics):
         self.keys.worker_aggregated_metrics.set(worker_id, json.dumps(agg_metrics))
@@ -775,22 +2257,21 @@ class DomainsConfig:
         value = self.keys.worker_aggregated_metrics_last_sent_update.get(worker_id)
         if value:
             last_sent_update, last_update = value.decode().split(',')
-            last_sent_update = common.strptime(last_sent_update, '%Y%m%d%H%M%S')
-            last_update = common.strptime(last_update, '%Y%m%d%H%M%S')
+            last_sent_update = common.parse_datetime(last_sent_update)
+            last_update = common.parse_datetime(last_update)
             return last_sent_update, last_update
         else:
             return None, None
 
     def set_worker_aggregated_metrics_last_sent_update(self, worker_id, last_update):
-        value = '{},{}'.format(common.now().strftime('%Y%m%d%H%M%S'), last_update.strftime('%Y%m%d%H%M%S'))
+        value = '{},{}'.format(common.format_datetime(common.now(), '%Y%m%d%H%M%S'), common.format_datetime(last_update, '%Y%m%d%H%M%S'))
         self.keys.worker_aggregated_metrics_last_sent_update.set(worker_id, value)
 
     def get_deployment_last_action(self, namespace_name):
         latest_value = None
         value = self.keys.deployment_last_action.get(namespace_name)
         if value:
-            value = value.decode().split('.')[0].replace('-', '').replace(':', '')
-            value = common.strptime(value, "%Y%m%dT%H%M%S")
+            value = common.parse_datetime(value.decode().split('.')[0])
             if latest_value is None or value > latest_value:
                 latest_value = value
         return latest_value if latest_value else None
@@ -800,12 +2281,14 @@ class DomainsConfig:
 
     def get_key_summary_single_multi_domain(self, r, key_name, key, max_keys_per_summary, is_api=False):
         if isinstance(key, DomainsConfigKeyStatic):
-            match = key._()
+            iterate_keys = scan_iter(r, key._())
+        elif isinstance(key, DomainsConfigKeyPrefix) and key.is_worker_hash():
+            iterate_keys = (key._(suffix).encode() for suffix in key.iterate_prefix_key_suffixes())
         else:
-            match = key._('*')
+            iterate_keys = scan_iter(r, key._('*'))
         _keys = []
         _total_keys = 0
-        for _key in r.scan_iter(match):
+        for _key in iterate_keys:
             _total_keys += 1
             if len(_keys) < max_keys_per_summary:
                 _keys.append(_key.decode())
@@ -816,8 +2299,9 @@ class DomainsConfig:
             'pool': key.redis_pool_name
         }
 
-    def get_key_summary_single(self, key_name, key, worker_id, max_keys_per_summary, hostname=None, is_api=False):
-        with key.get_redis() as r:
+    # worker_hash - values of the worker hash fields, used for keys which are stored in the worker hash
+    def get_key_summary_single(self, key_name, key, worker_id, max_keys_per_summary, hostname=None, is_api=False, worker_hash=None):
+        with key.get_read_redis() as r:
             key_summary_param = getattr(key, 'keys_summary_param', None)
             if worker_id or hostname:
                 if key_summary_param in ['namespace_name', 'worker_id'] and worker_id:
@@ -827,10 +2311,17 @@ class DomainsConfig:
                 else:
                     _key = None
                 if _key:
-                    value = r.get(_key)
+                    if isinstance(key, DomainsConfigKeyPrefixSet):
+                        value = ' '.join(sorted(member.decode() for member in r.smembers(_key))) if r.exists(_key) else None
+                    elif isinstance(key, DomainsConfigKeyPrefixHash):
+                        value = json.dumps({field.decode(): value.decode() for field, value in r.hgetall(_key).items()}) if r.type(_key) == b'hash' else None
+                    elif worker_hash is not None and isinstance(key, DomainsConfigKeyPrefix) and key.is_worker_hash() and key.worker_hash_field in worker_hash:
+                        value = worker_hash[key.worker_hash_field]
+                    else:
+                        value = r.get(_key)
                     if value is not None:
                         try:
-                            value = value.decode()
+                            value = value_codec.to_text(value)
                         except:
                             pass
                     return {
@@ -845,7 +2336,7 @@ class DomainsConfig:
                 return self.get_key_summary_single_multi_domain(r, key_name, key, max_keys_per_summary)
 
     def get_key_summary_prefix_subkeys(self, key_name, key, worker_id, max_keys_per_summary, hostname=None, is_api=False):
-        with key.get_redis() as r:
+        with key.get_read_redis() as r:
             key_summary_param = getattr(key, 'keys_summary_param', None)
             if worker_id or hostname:
                 if key_summary_param in ['namespace_name', 'worker_id'] and worker_id:
@@ -858,7 +2349,7 @@ class DomainsConfig:
                     match = '{}:*'.format(_key)
                     _keys = []
                     _total_keys = 0
-                    for _key in r.scan_iter(match):
+                    for _key in scan_iter(r, match):
                         _total_keys += 1
                         if len(_keys) < max_keys_per_summary*3:
                             if is_api:
@@ -876,7 +2367,122 @@ class DomainsConfig:
             else:
                 return self.get_key_summary_single_multi_domain(r, key_name, key, max_keys_per_summary, is_api=is_api)
 
+    # yields tuples of (key_name, key) for all the keys of a redis pool, using a single scan
+    # each key is classified to the key with the longest matching prefix (exact match for static keys), key_name is None for other keys
+    # metrics_key_name - label of the scan commands in the redis metrics
+    def iterate_pool_classified_keys(self, pool_name, metrics_key_name):
+        exact_keys = {}
+        prefix_keys = {}
+        for key_name in dir(self.keys):
+            key = getattr(self.keys, key_name)
+            if not isinstance(key, DomainsConfigKey) or key.redis_pool_name != pool_name:
+                continue
+            if isinstance(key, DomainsConfigKeyStatic):
+                exact_keys[key._()] = key_name
+            elif isinstance(key, DomainsConfigKeyTemplate):
+                prefix, suffix = key.key_template.split('{}')
+                prefix_keys[prefix] = (key_name, suffix)
+            else:
+                prefix_keys['{}:'.format(key.key_prefix)] = (key_name, '')
+        with self.get_read_redis(pool_name, key_name=metrics_key_name) as r:
+            for _key in scan_iter(r, '*', count=config.DOMAINS_CONFIG_SCAN_COUNT):
+                _key = _key.decode()
+                key_name = exact_keys.get(_key)
+                # prefixes end with ':', so the longest matching prefix is found by trying the key up to each ':' from the end
+                end = len(_key)
+                while key_name is None and end > 0:
+                    end = _key.rfind(':', 0, end)
+                    prefix_key = prefix_keys.get(_key[:end + 1]) if end >= 0 else None
+                    if prefix_key and _key.endswith(prefix_key[1]):
+                        key_name = prefix_key[0]
+                yield key_name, _key
+
+    # returns a list of the summaries of all the keys, ordered by key name, using a single scan of each redis pool
+    # each scanned key is classified to the key with the longest matching prefix
+    # keys stored in the worker hash are iterated from the prefix index, like in get_key_summary_single_multi_domain
+    def get_keys_summary_multi_domain(self, max_keys_per_summary):
+        summaries = {}
+        for key_name in dir(self.keys):
+            key = getattr(self.keys, key_name)
+            if isinstance(key, DomainsConfigKey):
+                summaries[key_name] = {'title': key_name, 'keys': [], 'total': 0, 'pool': key.redis_pool_name}
+
+        def add_key(key_name, _key):
+            summary = summaries[key_name]
+            summary['total'] += 1
+            if len(summary['keys']) < max_keys_per_summary:
+                summary['keys'].append(_key)
+
+        for pool_name in REDIS_POOL_NAMES:
+            for key_name, _key in self.iterate_pool_classified_keys(pool_name, 'keys_summary'):
+                if key_name is not None:
+                    add_key(key_name, _key)
+
+        for key_name, key in self.iterate_prefix_keys():
+            if key.is_worker_hash():
+                summaries[key_name].update(keys=[], total=0)
+                for suffix in key.iterate_prefix_key_suffixes():
+                    add_key(key_name, key._(suffix))
+        return list(summaries.values())
+
+    # returns a list of the number of keys, memory usage and TTL coverage of each key of each redis pool, using a single scan of each pool
+    # memory usage and TTL are sampled - the first KEYS_MEMORY_REPORT_MIN_SAMPLES keys of each key and then keys are sampled with sample_rate
+    # keys which don't match any key are grouped by their prefix (e.g. '__index__:*'), keys stored in the worker hashes are grouped as 'worker:*'
+    # total_bytes is estimated from the mean size of the sampled keys, ttl_ratio is the ratio of sampled keys which have an expiry
+    def get_keys_memory_report(self, sample_rate=None):
+        if sample_rate is None:
+            sample_rate = config.KEYS_MEMORY_REPORT_SAMPLE_RATE
+        report = []
+        for pool_name in REDIS_POOL_NAMES:
+            groups = {}
+            samples = []
+            with self.get_read_redis(pool_name, key_name='keys_memory_report') as r:
+
+                def sample_batch():
+                    pipe = r.pipeline(transaction=False)
+                    for _, _key in samples:
+                        pipe.memory_usage(_key)
+                        pipe.ttl(_key)
+                    values = pipe.execute()
+                    for (group, _), memory_usage, ttl in zip(samples, values[::2], values[1::2]):
+                        # keys which were deleted since they were scanned are not sampled
+                        if memory_usage is not None:
+                            group['sizes'].append(memory_usage)
+                            if ttl >= 0:
+                                group['num_with_ttl'] += 1
+                    samples.clear()
+
+                for key_name, _key in self.iterate_pool_classified_keys(pool_name, 'keys_memory_report'):
+                    title = key_name if key_name else get_unknown_key_group(_key)
+                    group = groups.setdefault(title, {'pool': pool_name, 'title': title, 'known': bool(key_name), 'total': 0, 'sizes': [], 'num_with_ttl': 0})
+                    group['total'] += 1
+                    if group['total'] <= config.KEYS_MEMORY_REPORT_MIN_SAMPLES or random.random() < sample_rate:
+                        samples.append((group, _key))
+                        if len(samples) >= config.DOMAINS_CONFIG_SCAN_COUNT:
+                            sample_batch()
+                if samples:
+                    sample_batch()
+            for group in groups.values():
+                sizes = sorted(group.pop('sizes'))
+                num_with_ttl = group.pop('num_with_ttl')
+                report.append({
+                    **group,
+                    'sampled': len(sizes),
+                    'total_bytes': int(sum(sizes) / len(sizes) * group['total']) if sizes else 0,
+                    'p50_bytes': get_percentile(sizes, 50),
+                    'p99_bytes': get_percentile(sizes, 99),
+                    'ttl_ratio': num_with_ttl / len(sizes) if sizes else 0,
+                })
+        return sorted(report, key=lambda group: group['total_bytes'], reverse=True)
+
     def get_keys_summary(self, max_keys_per_summary=10, worker_id=None, hostname=None, is_api=False):
+        if not worker_id and not hostname:
+            if self.keys_summary_cache:
+                yield from self.keys_summary_cache.get(max_keys_per_summary)
+            else:
+                yield from self.get_keys_summary_multi_domain(max_keys_per_summary)
+            return
+        worker_hash = self.get_worker_hash(worker_id) if worker_id and config.DOMAINS_CONFIG_WORKER_HASH_ENABLED else None
         for key_name in dir(self.keys):
             key = getattr(self.keys, key_name)
             if not isinstance(key, DomainsConfigKey):
@@ -884,7 +2490,7 @@ class DomainsConfig:
             if getattr(key, 'keys_summary_type', None) == 'prefix-subkeys':
                 yield self.get_key_summary_prefix_subkeys(key_name, key, worker_id, max_keys_per_summary, hostname=hostname, is_api=is_api)
             else:
-                yield self.get_key_summary_single(key_name, key, worker_id, max_keys_per_summary, hostname=hostname, is_api=is_api)
+                yield self.get_key_summary_single(key_name, key, worker_id, max_keys_per_summary, hostname=hostname, is_api=is_api, worker_hash=worker_hash)
 
     def set_worker_total_used_bytes(self, worker_id, total_used_bytes):
         value = str(total_used_bytes)
@@ -911,12 +2517,10 @@ class DomainsConfig:
         return json.loads(alert) if alert else None
 
     def set_node_healthy(self, node_name, is_healthy):
-        key = self.keys.node_healthy._(node_name)
-        with self.keys.node_healthy.get_redis() as r:
-            if is_healthy:
-                r.set(key, "")
-            else:
-                r.delete(key)
+        if is_healthy:
+            self.keys.node_healthy.set(node_name, "")
+        else:
+            self.keys.node_healthy.delete(node_name)
 
     def iterate_healthy_node_names(self):
         for node_name in self.keys.node_healthy.iterate_prefix_key_suffixes():
@@ -924,7 +2528,92 @@ class DomainsConfig:
 
     def get_worker_last_clear_cache(self, worker_id):
         value = self.keys.worker_last_clear_cache.get(worker_id)
-        return common.strptime(value.decode(), "%Y%m%dT%H%M%S") if value else None
+        return common.parse_datetime(value)
+
+    def iterate_prefix_keys(self):
+        for key_name in dir(self.keys):
+            key = getattr(self.keys, key_name)
+            if isinstance(key, DomainsConfigKeyPrefix):
+                yield key_name, key
+
+    # returns the number of keys of each counted key (e.g. hostname_initialize), from the counters which are maintained by the key modifications
+    def get_flow_counters(self):
+        counted_keys = [(key_name, key) for key_name, key in self.iterate_prefix_keys() if key.with_count]
+        flow_counters = {}
+        for pool_name in REDIS_POOL_NAMES:
+            pool_counted_keys = [(key_name, key) for key_name, key in counted_keys if key.redis_pool_name == pool_name]
+            if pool_counted_keys:
+                with getattr(self, 'get_{}_redis'.format(pool_name))(key_name='flow_counters') as r:
+                    counter_keys = [key._count() for _, key in pool_counted_keys]
+                    values = r.mget_nonatomic(counter_keys) if is_redis_cluster(r) else r.mget(counter_keys)
+                # counters may be negative until they are reconciled, if keys were set without the operator and then deleted
+                for (key_name, _), value in zip(pool_counted_keys, values):
+                    flow_counters[key_name] = max(0, int(value or 0))
+        return flow_counters
+
+    # sets the counters to the number of keys, to correct drift due to keys which were not modified via the operator
+    # (e.g. hostname initialize keys which are set by cwm-worker-ingress or hostname errors which are expired by redis)
+    # the counter is read before the keys are counted and the difference is added to it, so that counter changes
+    # of keys modified while counting are kept, keys modified while counting may cause drift which is corrected on next run
+    # returns the drift of each counter which was corrected
+    def reconcile_flow_counters(self):
+        drift = {}
+        for key_name, key in self.iterate_prefix_keys():
+            if key.with_count:
+                with key.get_redis() as r:
+                    value = int(r.get(key._count()) or 0)
+                num_keys = sum(1 for _ in key.iterate_prefix_key_suffixes())
+                if value != num_keys:
+                    with key.get_redis() as r:
+                        self.counter_add_script(keys=[key._count()], args=[num_keys - value], client=r)
+                    drift[key_name] = value - num_keys
+        return drift
+
+    def backfill_prefix_indexes(self):
+        prefix_keys = [key for _, key in self.iterate_prefix_keys()]
+        for key_name, key in self.iterate_prefix_keys():
+            if key.with_index:
+                excluded_key_prefixes = [
+                    other_key.key_prefix for other_key in prefix_keys
+                    if other_key.redis_pool_name == key.redis_pool_name and other_key.key_prefix.startswith('{}:'.format(key.key_prefix))
+                ]
+                yield key_name, key.backfill_index(excluded_key_prefixes)
+
+    # moves the legacy string keys to the worker hashes, should run after enabling DOMAINS_CONFIG_WORKER_HASH_ENABLED
+    def migrate_worker_hashes(self):
+        assert config.DOMAINS_CONFIG_WORKER_HASH_ENABLED, 'worker hash layout must be enabled before migration'
+        with self.get_internal_redis() as r:
+            for key_name, key in self.iterate_prefix_keys():
+                if key.in_worker_hash:
+                    num_moved = 0
+                    for worker_id in list(key.scan_prefix_key_suffixes(use_read_replica=False)):
+                        pipe = r.pipeline()
+                        self.worker_hash_migrate_script(keys=[key._hash(worker_id), key._(worker_id)], args=[key.worker_hash_field], client=pipe)
+                        pipe.sadd(key._index(), worker_id)
+                        moved, _ = pipe.execute()
+                        num_moved += moved
+                    yield key_name, num_moved
+
+    # sets the TTL of existing keys which declare a TTL policy and don't have an expiry, should run after enabling DOMAINS_CONFIG_KEYS_TTL_ENABLED
+    # yields tuples of (key_name, number of keys which were set with an expiry)
+    def apply_keys_ttl(self):
+        assert config.DOMAINS_CONFIG_KEYS_TTL_ENABLED, 'keys TTL must be enabled before applying it to existing keys'
+        for key_name, key in self.iterate_prefix_keys():
+            if getattr(key, 'ttl_seconds_config', None):
+                num_expired = 0
+                with key.get_redis() as r:
+                    for suffix in key.scan_prefix_key_suffixes(use_read_replica=False):
+                        value = r.get(key._(suffix))
+                        ttl_seconds = key.get_ttl_seconds(value) if value is not None else None
+                        # keys which already have an expiry are not modified
+                        if ttl_seconds and r.ttl(key._(suffix)) == -1 and r.expire(key._(suffix), ttl_seconds):
+                            num_expired += 1
+                yield key_name, num_expired
+
+    # returns the worker hash fields and values, doesn't include legacy string keys
+    def get_worker_hash(self, worker_id):
+        with self.get_internal_redis() as r:
+            return {field.decode(): value for field, value in r.hgetall(get_worker_hash_key(worker_id)).items()}
 
     def set_worker_last_clear_cache(self, worker_id, last_clear_cache):
-        self.keys.worker_last_clear_cache.set(worker_id, last_clear_cache.strftime("%Y%m%dT%H%M%S"))
+        self.keys.worker_last_clear_cache.set(worker_id, common.format_datetime(last_clear_cache, "%Y%m%dT%H%M%S"))
@@ -0,0 +1,53 @@
+"""
+Hostname availability / error events
+
+Published by DomainsConfig on the DOMAINS_CONFIG_HOSTNAME_EVENTS_CHANNEL pub/sub channel of the ingress redis,
+after the hostname keys which the ingress uses were modified, so that the ingress doesn't need to poll them.
+Pub/sub messages are not persisted, subscribers should reload the hostname keys after (re)connecting.
+
+Each message is a compact json object:
+  h - hostname
+  e - event: available / error / deleted
+  t - time the event was published, in epoch milliseconds
+  d - available: the ingress hostname json, error: the error message, deleted: not set
+"""
+import json
+import time
+
+from cwm_worker_operator import config
+
+
+EVENT_AVAILABLE = 'available'
+EVENT_ERROR = 'error'
+EVENT_DELETED = 'deleted'
+
+
+def dumps(hostname, event, data=None, publish_time_ms=None):
+    message = {'h': hostname, 'e': event, 't': publish_time_ms if publish_time_ms is not None else int(time.time() * 1000)}
+    if data is not None:
+        message['d'] = data
+    return json.dumps(message, separators=(',', ':'))
+
+
+def loads(message):
+    return json.loads(message)
+
+
+# reference subscriber, calls on_event(event) with each event dict until stop_event is set
+# on_subscribed is called when the subscription is confirmed, the hostname keys should be (re)loaded at this point
+def subscribe(domains_config, on_event, stop_event=None, on_subscribed=None, timeout_seconds=1.0):
+    with domains_config.get_ingress_redis(key_name='hostname_events') as r:
+        pubsub = r.pubsub()
+        try:
+            pubsub.subscribe(config.DOMAINS_CONFIG_HOSTNAME_EVENTS_CHANNEL)
+            while stop_event is None or not stop_event.is_set():
+                message = pubsub.get_message(timeout=timeout_seconds)
+                if message is None:
+                    continue
+                elif message['type'] == 'subscribe':
+                    if on_subscribed:
+                        on_subscribed()
+                elif message['type'] == 'message':
+                    on_event(loads(message['data']))
+        finally:
+            pubsub.close()
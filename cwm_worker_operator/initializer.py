@@ -9,11 +9,12 @@ from cwm_worker_operator import logs
 from cwm_worker_operator import common
 from cwm_worker_operator.daemon import Daemon
 from cwm_worker_operator.domains_config import VolumeConfig
+from cwm_worker_operator.async_domains_config import run_async_single_iteration
 from cwm_worker_operator.deployment_flow_manager import InitializerDeploymentFlowManager
 
 
 def initialize_worker(domains_config, initializer_metrics, flow_manager, worker_id, volume_config: VolumeConfig, start_time, hostname=None):
-    worker_to_delete = domains_config.get_worker_force_delete(worker_id)
+    worker_to_delete = flow_manager.get_worker_force_delete(worker_id)
     if worker_to_delete and not worker_to_delete['allow_cancel']:
         # worker is forced to delete but the deletion cannot be canceled, so we cancel the deployment until delete will occur
         return
@@ -31,7 +32,7 @@ def initialize_worker(domains_config, initializer_metrics, flow_manager, worker_
             initializer_metrics.invalid_volume_zone(worker_id, start_time)
             logs.debug_info("Invalid volume zone", **log_kwargs)
             return
-        if hostname and not common.is_hostnames_match_in_list(hostname, volume_config.hostnames):
+        if hostname and hostname not in volume_config.get_hostnames_index():
             initializer_metrics.invalid_hostname(worker_id, start_time)
             logs.debug_info("Invalid hostname", **log_kwargs)
             flow_manager.set_hostname_error(hostname, domains_config.WORKER_ERROR_INVALID_HOSTNAME, worker_id=worker_id)
@@ -46,22 +47,67 @@ def initialize_worker(domains_config, initializer_metrics, flow_manager, worker_
         initializer_metrics.exception(worker_id, start_time)
 
 
-def run_single_iteration(domains_config, metrics, **_):
+def initialize_hostname(domains_config, initializer_metrics, flow_manager, hostname, volume_config, failed_to_get_volume_config):
+    start_time = common.now()
+    if failed_to_get_volume_config:
+        if config.DEBUG and config.DEBUG_VERBOSITY >= 5:
+            print(volume_config)
+        initializer_metrics.failed_to_get_volume_config(hostname, start_time)
+        flow_manager.set_hostname_error(hostname, domains_config.WORKER_ERROR_FAILED_TO_GET_VOLUME_CONFIG, allow_retry=True)
+        logs.debug_info("Failed to get volume config", hostname=hostname, start_time=start_time)
+    else:
+        initialize_worker(domains_config, initializer_metrics, flow_manager, volume_config.id, volume_config, start_time, hostname=hostname)
+
+
+def initialize_worker_forced_update(domains_config, initializer_metrics, flow_manager, worker_id):
+    volume_config = flow_manager.get_volume_config_forced_update(worker_id, initializer_metrics)
+    if volume_config is not None:
+        initialize_worker(domains_config, initializer_metrics, flow_manager, worker_id, volume_config, common.now())
+
+
+# hostnames_volume_configs - list of tuples of hostname and volume config of hostnames of the same worker
+# hostnames are initialized sequentially, so like in the sync iteration, hostnames after the first initialized hostname are skipped
+def initialize_worker_hostnames_waiting_for_initialization(domains_config, initializer_metrics, flow_manager, hostnames_volume_configs):
+    for hostname, volume_config in hostnames_volume_configs:
+        res = flow_manager.check_hostname_volume_config(volume_config)
+        if res is not None:
+            volume_config, failed_to_get_volume_config = res
+            initialize_hostname(domains_config, initializer_metrics, flow_manager, hostname, volume_config, failed_to_get_volume_config)
+
+
+# forced update workers are initialized before the hostnames, because hostnames of these workers are skipped
+# volume configs of the hostnames are fetched concurrently, then hostnames are grouped by worker id and workers are initialized concurrently
+async def async_run_single_iteration(async_domains_config, metrics, **_):
+    domains_config = async_domains_config.domains_config
+    flow_manager = InitializerDeploymentFlowManager(domains_config, with_snapshot=True)
+    await async_domains_config.map(
+        lambda worker_id: initialize_worker_forced_update(domains_config, metrics, flow_manager, worker_id),
+        await async_domains_config.run(flow_manager.get_worker_ids_force_update)
+    )
+    hostnames = await async_domains_config.run(flow_manager.get_hostnames_waiting_for_initialization)
+    volume_configs = await async_domains_config.map(lambda hostname: flow_manager.get_hostname_volume_config(hostname, metrics), hostnames)
+    worker_hostnames_volume_configs = {}
+    for hostname, volume_config in zip(hostnames, volume_configs):
+        if volume_config is not None:
+            # hostnames which failed to get a volume config are not grouped
+            group_key = volume_config.id if volume_config.id and not volume_config._error else (None, hostname)
+            worker_hostnames_volume_configs.setdefault(group_key, []).append((hostname, volume_config))
+    await async_domains_config.map(
+        lambda hostnames_volume_configs: initialize_worker_hostnames_waiting_for_initialization(domains_config, metrics, flow_manager, hostnames_volume_configs),
+        list(worker_hostnames_volume_configs.values())
+    )
+
+
+def run_single_iteration(domains_config, metrics, **kwargs):
+    if config.DAEMONS_ASYNC_CONCURRENCY > 0:
+        return run_async_single_iteration(async_run_single_iteration, domains_config, metrics=metrics, **kwargs)
     initializer_metrics = metrics
-    flow_manager = InitializerDeploymentFlowManager(domains_config)
+    flow_manager = InitializerDeploymentFlowManager(domains_config, with_snapshot=True)
     for volume_config, worker_id in flow_manager.iterate_volume_configs_forced_update(initializer_metrics):
         start_time = common.now()
         initialize_worker(domains_config, initializer_metrics, flow_manager, worker_id, volume_config, start_time)
     for volume_config, hostname, failed_to_get_volume_config in flow_manager.iterate_volume_config_hostnames_waiting_for_initialization(initializer_metrics):
-        start_time = common.now()
-        if failed_to_get_volume_config:
-            if config.DEBUG and config.DEBUG_VERBOSITY >= 5:
-                print(volume_config)
-            initializer_metrics.failed_to_get_volume_config(hostname, start_time)
-            flow_manager.set_hostname_error(hostname, domains_config.WORKER_ERROR_FAILED_TO_GET_VOLUME_CONFIG, allow_retry=True)
-            logs.debug_info("Failed to get volume config", hostname=hostname, start_time=start_time)
-        else:
-            initialize_worker(domains_config, initializer_metrics, flow_manager, volume_config.id, volume_config, start_time, hostname=hostname)
+        initialize_hostname(domains_config, initializer_metrics, flow_manager, hostname, volume_config, failed_to_get_volume_config)
 
 
 def start_daemon(once=False, with_prometheus=True, initializer_metrics=None, domains_config=None):
@@ -72,7 +118,9 @@ def start_daemon(once=False, with_prometheus=True, initializer_metrics=None, dom
         metrics=initializer_metrics,
         domains_config=domains_config,
         run_single_iteration_callback=run_single_iteration,
-        prometheus_metrics_port=config.PROMETHEUS_METRICS_PORT_INITIALIZER
+        prometheus_metrics_port=config.PROMETHEUS_METRICS_PORT_INITIALIZER,
+        wakeup_key_names=['hostname_initialize', 'worker_force_update'] if config.INITIALIZER_WAKEUP_ON_KEYSPACE_NOTIFICATIONS else None,
+        wakeup_max_sleep_seconds=config.INITIALIZER_WAKEUP_MAX_SLEEP_SECONDS
     ).start(
         once=once,
         with_prometheus=with_prometheus
@@ -1,5 +1,6 @@
 from prometheus_client.utils import INF
-from prometheus_client import Histogram, Counter, REGISTRY
+from prometheus_client import Histogram, Counter, Gauge, REGISTRY
+from prometheus_client.core import GaugeMetricFamily
 
 from cwm_worker_operator import config
 from cwm_worker_operator import common
@@ -27,7 +28,7 @@ class InitializerMetrics(BaseMetrics):
 
     def __init__(self):
         super(InitializerMetrics, self).__init__()
-        self._initializer_request = Histogram('initializer_request_latency', 'initializer request latency (identifier=hostname for failed_to_get_volume_config, else worker_id)', ["identifier", "status"])
+        self._initializer_request = Histogram('initializer_request_latency', 'initializer request latency (identifier=hostname for failed_to_get_volume_config / hostname_denied, else worker_id)', ["identifier", "status"])
 
     def invalid_volume_zone(self, worker_id, start_time):
         self._observe(self._initializer_request, worker_id, start_time, "invalid_volume_zone")
@@ -38,6 +39,9 @@ class InitializerMetrics(BaseMetrics):
     def failed_to_get_volume_config(self, hostname, start_time):
         self._observe(self._initializer_request, hostname, start_time, "failed_to_get_volume_config")
 
+    def hostname_denied(self, hostname, start_time):
+        self._observe(self._initializer_request, hostname, start_time, "hostname_denied")
+
     def initialized(self, worker_id, start_time):
         self._observe(self._initializer_request, worker_id, start_time, "initialized")
 
@@ -144,6 +148,89 @@ class DiskUsageUpdaterMetrics(BaseMetrics):
         self._observe(self._disk_usage_updater_request, worker_id, start_time, "disk_usage_update")
 
 
+class VolumeConfigCacheMetrics:
+
+    def __init__(self, registry=REGISTRY):
+        self._requests = Counter('volume_config_cache_requests', 'volume config in-process cache requests', ["status"], registry=registry)
+        self._invalidations = Counter('volume_config_cache_invalidations', 'volume config in-process cache invalidations', registry=registry)
+
+    def hit(self):
+        self._requests.labels("hit").inc()
+
+    def miss(self):
+        self._requests.labels("miss").inc()
+
+    def invalidate(self):
+        self._invalidations.inc()
+
+
+class RedisMetrics:
+
+    def __init__(self, registry=REGISTRY):
+        buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, INF)
+        self._pool_checkout = Histogram(
+            'redis_pool_checkout_latency',
+            'redis connection pool checkout latency (seconds), includes connecting new connections',
+            ["pool"], registry=registry, buckets=buckets
+        )
+        self._commands = Counter('redis_commands', 'redis commands (pipelines are counted as a single PIPELINE command)', ["pool", "key", "command"], registry=registry)
+        self._command_latency = Histogram('redis_command_latency', 'redis command latency (seconds)', ["pool", "key"], registry=registry, buckets=buckets)
+
+    def observe_pool_checkout(self, pool, duration_seconds):
+        self._pool_checkout.labels(pool).observe(duration_seconds)
+
+    def observe_command(self, pool, key, command, duration_seconds):
+        self._commands.labels(pool, key, command).inc()
+        self._command_latency.labels(pool, key).observe(duration_seconds)
+
+
+class KeysMemoryMetrics:
+
+    def __init__(self, registry=REGISTRY):
+        self._keys = Gauge('redis_keys', 'number of redis keys', ["pool", "key"], registry=registry)
+        self._memory_bytes = Gauge('redis_keys_memory_bytes', 'estimated total memory usage of redis keys (bytes)', ["pool", "key"], registry=registry)
+        self._memory_p50_bytes = Gauge('redis_keys_memory_p50_bytes', 'median memory usage of sampled redis keys (bytes)', ["pool", "key"], registry=registry)
+        self._memory_p99_bytes = Gauge('redis_keys_memory_p99_bytes', '99th percentile memory usage of sampled redis keys (bytes)', ["pool", "key"], registry=registry)
+        self._ttl_ratio = Gauge('redis_keys_ttl_ratio', 'ratio of sampled redis keys which have an expiry', ["pool", "key"], registry=registry)
+        self._labels = set()
+
+    # report - as returned by DomainsConfig.get_keys_memory_report
+    # labels of key groups which are not in the report (e.g. no keys left) are removed
+    def update(self, report):
+        labels = {(group['pool'], group['title']) for group in report}
+        for removed_labels in self._labels - labels:
+            for gauge in (self._keys, self._memory_bytes, self._memory_p50_bytes, self._memory_p99_bytes, self._ttl_ratio):
+                gauge.remove(*removed_labels)
+        self._labels = labels
+        for group in report:
+            self._keys.labels(group['pool'], group['title']).set(group['total'])
+            self._memory_bytes.labels(group['pool'], group['title']).set(group['total_bytes'])
+            self._memory_p50_bytes.labels(group['pool'], group['title']).set(group['p50_bytes'])
+            self._memory_p99_bytes.labels(group['pool'], group['title']).set(group['p99_bytes'])
+            self._ttl_ratio.labels(group['pool'], group['title']).set(group['ttl_ratio'])
+
+
+# gauge of the flow counters, which are read from redis on each collection
+class FlowCountersCollector:
+    _registered = False
+
+    def __init__(self, domains_config):
+        self.domains_config = domains_config
+
+    def collect(self):
+        gauge = GaugeMetricFamily('flow_stage_keys', 'number of keys in each deployment flow stage (e.g. hostname_initialize)', labels=["key"])
+        for key_name, num_keys in self.domains_config.get_flow_counters().items():
+            gauge.add_metric([key_name], num_keys)
+        yield gauge
+
+    # registers the collector once per process, so that it can be called by each daemon which runs in the process
+    @staticmethod
+    def register(domains_config, registry=REGISTRY):
+        if not FlowCountersCollector._registered:
+            registry.register(FlowCountersCollector(domains_config))
+            FlowCountersCollector._registered = True
+
+
 class NasCheckerMetrics:
 
     def __init__(self):
@@ -56,7 +56,7 @@ def update_release_metrics(domains_config, deployments_manager, metrics_updater_
     try:
         agg_metrics = domains_config.get_worker_aggregated_metrics(worker_id, clear=True)
         if agg_metrics:
-            last_agg_update = common.strptime(agg_metrics[LAST_UPDATE_KEY], DATEFORMAT)
+            last_agg_update = common.parse_datetime(agg_metrics[LAST_UPDATE_KEY])
         else:
             last_agg_update = None
             agg_metrics = {}
@@ -6,6 +6,7 @@ from collections import defaultdict
 from cwm_worker_operator import config, common, logs
 from cwm_worker_operator.daemon import Daemon
 from cwm_worker_operator.domains_config import DomainsConfig
+from cwm_worker_operator.async_domains_config import run_async_single_iteration
 
 
 def cleanup_hostname_error(domains_config: DomainsConfig, hostname, stats):
@@ -27,7 +28,9 @@ def cleanup_hostname_error(domains_config: DomainsConfig, hostname, stats):
             domains_config.del_worker_hostname_keys(hostname, with_deployment_flow=False)
             stats['hostname_error_failed_deploy_deleted'] += 1
             return
-    handle_hostname_error_any(domains_config, hostname, stats, last_deployment_flow_time)
+    # when keys TTL is enabled, the hostname error keys are expired by redis
+    if not config.DOMAINS_CONFIG_KEYS_TTL_ENABLED:
+        handle_hostname_error_any(domains_config, hostname, stats, last_deployment_flow_time)
 
 
 def handle_hostname_error_any(domains_config: DomainsConfig, hostname, stats, last_deployment_flow_time='-'):
@@ -43,12 +46,47 @@ def handle_hostname_error_any(domains_config: DomainsConfig, hostname, stats, la
         domains_config.del_worker_hostname_keys(hostname)
 
 
-def run_single_iteration(domains_config: DomainsConfig, **_):
+# drift - as returned by DomainsConfig.reconcile_flow_counters
+def reconcile_flow_counters(drift, stats):
+    for key_name, key_drift in drift.items():
+        stats['flow_counter_drift_{}'.format(key_name)] += key_drift
+
+
+# each hostname is processed with separate stats, because the stats are modified concurrently
+async def async_run_single_iteration(async_domains_config, **_):
+    domains_config = async_domains_config.domains_config
+
+    def get_stats(func, hostname):
+        hostname_stats = defaultdict(int)
+        func(domains_config, hostname, hostname_stats)
+        return hostname_stats
+
+    stats = defaultdict(int)
+    for func, key in [
+        (cleanup_hostname_error, async_domains_config.keys.hostname_error),
+        *([] if config.DOMAINS_CONFIG_KEYS_TTL_ENABLED else [(handle_hostname_error_any, async_domains_config.keys.hostname_error_attempt_number)]),
+    ]:
+        hostnames = await key.iterate_prefix_key_suffixes()
+        for hostname_stats in await async_domains_config.map(lambda hostname: get_stats(func, hostname), hostnames):
+            for k, v in hostname_stats.items():
+                stats[k] += v
+    if config.DOMAINS_CONFIG_FLOW_COUNTERS_ENABLED:
+        reconcile_flow_counters(await async_domains_config.reconcile_flow_counters(), stats)
+    if len(stats) > 0:
+        logs.debug('', debug_verbosity=2, stats=dict(stats))
+
+
+def run_single_iteration(domains_config: DomainsConfig, **kwargs):
+    if config.DAEMONS_ASYNC_CONCURRENCY > 0:
+        return run_async_single_iteration(async_run_single_iteration, domains_config, **kwargs)
     stats = defaultdict(int)
     for hostname in domains_config.keys.hostname_error.iterate_prefix_key_suffixes():
         cleanup_hostname_error(domains_config, hostname, stats)
-    for hostname in domains_config.keys.hostname_error_attempt_number.iterate_prefix_key_suffixes():
-        handle_hostname_error_any(domains_config, hostname, stats)
+    if not config.DOMAINS_CONFIG_KEYS_TTL_ENABLED:
+        for hostname in domains_config.keys.hostname_error_attempt_number.iterate_prefix_key_suffixes():
+            handle_hostname_error_any(domains_config, hostname, stats)
+    if config.DOMAINS_CONFIG_FLOW_COUNTERS_ENABLED:
+        reconcile_flow_counters(domains_config.reconcile_flow_counters(), stats)
     if len(stats) > 0:
         logs.debug('', debug_verbosity=2, stats=dict(stats))
 
@@ -6,6 +6,7 @@ import datetime
 from cwm_worker_operator import config, common
 from cwm_worker_operator.daemon import Daemon
 from cwm_worker_operator.domains_config import DomainsConfig
+from cwm_worker_operator.async_domains_config import run_async_single_iteration
 
 
 def _throttle_start(domains_config, now, worker_id,
@@ -38,7 +39,7 @@ def check_worker_throttle(domains_config, worker_id, now=None):
         now = common.now()
     last_throttle_check = domains_config.keys.worker_last_throttle_check.get(worker_id)
     if last_throttle_check and last_throttle_check.get('t'):
-        last_throttle_check_datetime = common.strptime(last_throttle_check['t'], '%Y-%m-%d %H:%M:%S')
+        last_throttle_check_datetime = common.parse_datetime(last_throttle_check['t'])
         last_throttle_check_num_requests_total = int(last_throttle_check.get('r') or 0)
         seconds_since_last_throttle_check = (now - last_throttle_check_datetime).total_seconds()
     else:
@@ -49,7 +50,7 @@ def check_worker_throttle(domains_config, worker_id, now=None):
         deployment_api_metrics = domains_config.get_deployment_api_metrics(common.get_namespace_name_from_worker_id(worker_id))
         num_requests_total = sum([int(deployment_api_metrics.get(key) or 0) for key in ['num_requests_in', 'num_requests_misc', 'num_requests_out']])
         domains_config.keys.worker_last_throttle_check.set(worker_id, {
-            't': now.strftime('%Y-%m-%d %H:%M:%S'),
+            't': common.format_datetime(now, '%Y-%m-%d %H:%M:%S'),
             'r': num_requests_total
         })
         if last_throttle_check_num_requests_total is not None:
@@ -68,7 +69,19 @@ def check_worker_throttle_expiry(domains_config, worker_id, now=None):
         _throttle_stop(domains_config, worker_id)
 
 
-def run_single_iteration(domains_config: DomainsConfig, now=None, **_):
+async def async_run_single_iteration(async_domains_config, now=None, **_):
+    domains_config = async_domains_config.domains_config
+    worker_ids = {worker_id for _, worker_id in await async_domains_config.iterate_ingress_hostname_worker_ids()}
+    await async_domains_config.map(lambda worker_id: check_worker_throttle(domains_config, worker_id, now), worker_ids)
+    await async_domains_config.map(
+        lambda worker_id: check_worker_throttle_expiry(domains_config, worker_id, now),
+        await async_domains_config.keys.worker_throttled_expiry.iterate_prefix_key_suffixes()
+    )
+
+
+def run_single_iteration(domains_config: DomainsConfig, now=None, **kwargs):
+    if config.DAEMONS_ASYNC_CONCURRENCY > 0:
+        return run_async_single_iteration(async_run_single_iteration, domains_config, now=now, **kwargs)
     checked_worker_ids = set()
     for _, worker_id in domains_config.iterate_ingress_hostname_worker_ids():
         if worker_id not in checked_worker_ids:
@@ -104,7 +104,7 @@ def send_agg_metrics(domains_config, updater_metrics, worker_id, start_time, cwm
     try:
         agg_metrics = domains_config.get_worker_aggregated_metrics(worker_id)
         if agg_metrics:
-            current_last_update = common.strptime(agg_metrics.get(metrics_updater.LAST_UPDATE_KEY), metrics_updater.DATEFORMAT)
+            current_last_update = common.parse_datetime(agg_metrics.get(metrics_updater.LAST_UPDATE_KEY))
             current_minutes = agg_metrics.get(metrics_updater.MINUTES_KEY)
             if current_last_update and current_minutes:
                 previous_last_update_sent, previous_last_update = domains_config.get_worker_aggregated_metrics_last_sent_update(worker_id)
@@ -131,7 +131,7 @@ def send_agg_metrics(domains_config, updater_metrics, worker_id, start_time, cwm
 def get_instances_updates(domains_config: DomainsConfig, cwm_api_manager: CwmApiManager):
     last_update = domains_config.keys.updater_last_cwm_api_update.get()
     if last_update:
-        from_datetime = common.strptime(last_update.decode(), '%Y-%m-%dT%H:%M:%S') + datetime.timedelta(seconds=1)
+        from_datetime = common.parse_datetime(last_update) + datetime.timedelta(seconds=1)
     else:
         from_datetime = common.now() - datetime.timedelta(seconds=config.UPDATER_DEFAULT_LAST_UPDATE_DATETIME_SECONDS)
     last_update = None
@@ -0,0 +1,97 @@
+"""
+Encoding of json values which the operator stores in redis
+
+Encoded values start with a version byte which identifies the codec used to encode the rest of the value.
+Values which don't start with a registered version byte are decoded as legacy plain json,
+a json document can't start with a version byte, so codecs can be changed without migrating existing values.
+"""
+import json
+import zlib
+
+from cwm_worker_operator import config
+
+
+CODEC_JSON = 'json'
+CODEC_COMPACT = 'compact'
+
+
+class JsonCodec:
+    # legacy plain json, encoded without a version byte
+    version = None
+
+    def encode(self, value):
+        return json.dumps(value).encode()
+
+    def decode(self, data):
+        return json.loads(data)
+
+
+class CompactJsonCodec:
+    version = 1
+
+    def encode(self, value):
+        return json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode()
+
+    def decode(self, data):
+        return json.loads(data)
+
+
+class ZlibCompactJsonCodec(CompactJsonCodec):
+    version = 2
+
+    def encode(self, value):
+        return zlib.compress(super(ZlibCompactJsonCodec, self).encode(value), config.DOMAINS_CONFIG_JSON_CODEC_ZLIB_LEVEL)
+
+    def decode(self, data):
+        return super(ZlibCompactJsonCodec, self).decode(zlib.decompress(data))
+
+
+CODECS = {}
+
+
+def register_codec(codec):
+    assert 0 < codec.version < 32 and codec.version not in CODECS
+    CODECS[codec.version] = codec
+
+
+register_codec(CompactJsonCodec())
+register_codec(ZlibCompactJsonCodec())
+
+
+def encode(value, codec_name=None):
+    codec_name = codec_name or config.DOMAINS_CONFIG_JSON_CODEC
+    if codec_name == CODEC_JSON:
+        return JsonCodec().encode(value)
+    elif codec_name == CODEC_COMPACT:
+        data = CODECS[CompactJsonCodec.version].encode(value)
+        if 0 < config.DOMAINS_CONFIG_JSON_CODEC_ZLIB_MIN_BYTES <= len(data):
+            codec = CODECS[ZlibCompactJsonCodec.version]
+            data = zlib.compress(data, config.DOMAINS_CONFIG_JSON_CODEC_ZLIB_LEVEL)
+        else:
+            codec = CODECS[CompactJsonCodec.version]
+        return bytes([codec.version]) + data
+    else:
+        raise Exception("Invalid json codec: {}".format(codec_name))
+
+
+def is_encoded(data):
+    return bool(data) and data[0] in CODECS
+
+
+def decode(data):
+    if not data:
+        return None
+    if isinstance(data, str):
+        data = data.encode()
+    if data[0] in CODECS:
+        return CODECS[data[0]].decode(data[1:])
+    else:
+        return JsonCodec().decode(data)
+
+
+def to_text(data):
+    # returns a readable representation of a value which may be encoded, used for display purposes
+    if is_encoded(data):
+        return json.dumps(decode(data))
+    else:
+        return data.decode()
@@ -104,14 +104,20 @@ class WaiterMultiprocessor(Multiprocessor):
         return worker_id
 
 
-def run_single_iteration(domains_config: domains_config.DomainsConfig, metrics, deployments_manager, is_async=False, **_):
+def run_initialization(domains_config: domains_config.DomainsConfig, **_):
+    if config.DEPLOYMENT_FLOW_QUEUES_ENABLED:
+        WaiterDeploymentFlowManager(domains_config).recover_queue()
+
+
+def run_single_iteration(domains_config: domains_config.DomainsConfig, metrics, deployments_manager, is_async=False, queue_block_seconds=None, **_):
     multiprocessor = WaiterMultiprocessor(config.WAITER_MAX_PARALLEL_DEPLOY_PROCESSES if is_async else 1)
     waiter_metrics = metrics
     flow_manager = WaiterDeploymentFlowManager(domains_config)
-    worker_ids_waiting_for_deployment_complete = set(flow_manager.iterate_worker_ids_waiting_for_deployment_complete())
+    worker_ids_waiting_for_deployment_complete = set(flow_manager.iterate_worker_ids_waiting_for_deployment_complete(queue_block_seconds))
     for worker_id in worker_ids_waiting_for_deployment_complete:
         multiprocessor.process(worker_id, domains_config, waiter_metrics, deployments_manager, flow_manager)
     multiprocessor.finalize()
+    flow_manager.complete_iteration()
 
 
 def start_daemon(once=False, with_prometheus=True, waiter_metrics=None, domains_config=None):
@@ -122,7 +128,11 @@ def start_daemon(once=False, with_prometheus=True, waiter_metrics=None, domains_
         domains_config=domains_config,
         metrics=waiter_metrics,
         run_single_iteration_callback=run_single_iteration,
-        run_single_iteration_extra_kwargs={'is_async': True},
+        run_initialization_callback=run_initialization,
+        run_single_iteration_extra_kwargs={
+            'is_async': True,
+            'queue_block_seconds': config.DEPLOYMENT_FLOW_QUEUES_BLOCK_SECONDS
+        },
         prometheus_metrics_port=config.PROMETHEUS_METRICS_PORT_WAITER
     ).start(
         once=once,
@@ -3,11 +3,15 @@ A web interface for debugging
 """
 import json
 import traceback
+
+import prometheus_client
 from http.server import ThreadingHTTPServer
 from http.server import BaseHTTPRequestHandler
 
 from cwm_worker_operator import config, common
 from cwm_worker_operator import domains_config
+from cwm_worker_operator import value_codec
+from cwm_worker_operator import metrics
 
 
 def debug_print(*args):
@@ -25,6 +29,8 @@ def get_header(is_api, server):
             'hostname': '/api/hostname/<HOSTNAME>',
             'redis key': '/api/redis_key/<POOL>/<REDIS_KEY>',
             'nodes': '/api/nodes',
+            'keys memory': '/api/keys_memory',
+            'search': '/api/search/<PREFIX>',
         }
     else:
         yield '<p>' + ' | '.join([
@@ -33,6 +39,8 @@ def get_header(is_api, server):
             '<a href="/hostname/loadtest.cwmc-eu-test2.cloudwm-obj.com">hostname</a>',
             '<a href="/redis_key/ingress/hostname:error:loadtest.cwmc-eu-test2.cloudwm-obj.com">redis key</a>',
             '<a href="/nodes">nodes</a>',
+            '<a href="/keys_memory">keys memory</a>',
+            '<a href="/search/cwm">search</a>',
         ]) + '</p>'
 
 
@@ -105,7 +113,8 @@ def get_hostname(is_api, server, hostname):
 
 def get_redis_key(is_api, server, pool, key):
     yield from get_header(is_api, server)
-    with getattr(server.dc, 'get_{}_redis'.format(pool))() as r:
+    is_write = key.startswith('delete/') or key.startswith('set/')
+    with (getattr(server.dc, 'get_{}_redis'.format(pool))() if is_write else server.dc.get_read_redis(pool)) as r:
         if key.startswith('delete/'):
             key = key.replace('delete/', '')
             r.delete(key)
@@ -122,9 +131,15 @@ def get_redis_key(is_api, server, pool, key):
             else:
                 yield '<p style="color:red;font-weight:bold;">Key was set: {} = {}</p>'.format(key, value)
         else:
-            value = r.get(key)
-            if value:
-                value = value.decode()
+            key_type = r.type(key)
+            if key_type == b'set':
+                value = ' '.join(sorted(member.decode() for member in r.smembers(key)))
+            elif key_type == b'hash':
+                value = json.dumps({field.decode(): value_codec.to_text(field_value) for field, field_value in r.hgetall(key).items()})
+            else:
+                value = r.get(key)
+                if value:
+                    value = value_codec.to_text(value)
             if is_api:
                 yield {'key': key, 'value': value}
             else:
@@ -141,15 +156,15 @@ def get_redis_key(is_api, server, pool, key):
 def get_nodes(is_api, server):
     yield from get_header(is_api, server)
     nodes = {}
-    with server.dc.get_internal_redis() as r:
-        for key in map(bytes.decode, r.keys('node:nas:*')):
+    with server.dc.get_read_redis('internal') as r:
+        for key in map(bytes.decode, domains_config.scan_iter(r, 'node:nas:*', count=config.DOMAINS_CONFIG_SCAN_COUNT)):
             _, _, key, node, nas_ip = key.split(':')
             if key == 'is_healthy':
                 nodes.setdefault(node, {}).setdefault('nas_ips', {}).setdefault(nas_ip, {})['nas_healthy'] = True
             elif key == 'last_check':
                 nodes.setdefault(node, {}).setdefault('nas_ips', {}).setdefault(nas_ip, {})['nas_last_check'] = server.dc.keys.node_nas_last_check.get('{}:{}'.format(node, nas_ip))
-    with server.dc.get_ingress_redis() as r:
-        for key in map(bytes.decode, r.keys('node:healthy:*')):
+    with server.dc.get_read_redis('ingress') as r:
+        for key in map(bytes.decode, domains_config.scan_iter(r, 'node:healthy:*', count=config.DOMAINS_CONFIG_SCAN_COUNT)):
             _, _, node_name = key.split(':')
             nodes.setdefault(node_name, {})['healthy'] = True
     if not is_api:
@@ -176,6 +191,59 @@ def get_nodes(is_api, server):
     if not is_api:
         yield '</table>'
 
+
+def get_keys_memory(is_api, server):
+    yield from get_header(is_api, server)
+    report = server.dc.get_keys_memory_report()
+    if not is_api:
+        yield '<p>Memory usage and TTL are sampled, unknown keys are grouped by prefix. <a href="/keys_memory/metrics">Prometheus metrics</a></p>'
+        yield '<table border="1" cellpadding="3">'
+        yield '<tr>{}</tr>'.format(''.join('<td><b>{}</b></td>'.format(title) for title in [
+            'pool', 'key', 'keys', 'sampled', 'total (MB)', 'p50 (bytes)', 'p99 (bytes)', 'with TTL'
+        ]))
+    for group in report:
+        if is_api:
+            yield group
+        else:
+            yield '<tr>{}</tr>'.format(''.join('<td>{}</td>'.format(value) for value in [
+                group['pool'], group['title'] if group['known'] else '<i>{}</i>'.format(group['title']),
+                group['total'], group['sampled'], round(group['total_bytes'] / 1024 / 1024, 2),
+                group['p50_bytes'], group['p99_bytes'], '{}%'.format(round(group['ttl_ratio'] * 100))
+            ]))
+    if not is_api:
+        yield '</table>'
+
+
+def get_search(is_api, server, prefix):
+    yield from get_header(is_api, server)
+    if not prefix:
+        yield "Please input a search prefix" if not is_api else {'error': 'missing search prefix'}
+        return
+    if not config.DOMAINS_CONFIG_SEARCH_INDEX_ENABLED:
+        yield "Search index is not enabled" if not is_api else {'error': 'search index is not enabled'}
+        return
+    if not is_api:
+        yield "<h3>Search: {}</h3>".format(prefix)
+    for entry_type, value in server.dc.keys.search_index.search(prefix, config.DOMAINS_CONFIG_SEARCH_MAX_RESULTS):
+        if entry_type == domains_config.DomainsConfigKeyLexIndex.TYPE_HOSTNAME:
+            path = '/hostname/{}'.format(value)
+        elif entry_type == domains_config.DomainsConfigKeyLexIndex.TYPE_NAMESPACE:
+            path = '/worker/{}'.format(common.get_worker_id_from_namespace_name(value))
+        else:
+            path = '/worker/{}'.format(value)
+        if is_api:
+            yield {'type': entry_type, 'value': value, 'url': '/api{}'.format(path)}
+        else:
+            yield '{}: <a href="{}">{}</a><br/>'.format(entry_type, path, value)
+
+
+# returns the keys memory report in prometheus text format
+def get_keys_memory_metrics(server):
+    registry = prometheus_client.CollectorRegistry()
+    metrics.KeysMemoryMetrics(registry=registry).update(server.dc.get_keys_memory_report())
+    return prometheus_client.generate_latest(registry)
+
+
 class CwmWorkerOperatorHTTPRequestHandler(BaseHTTPRequestHandler):
 
     def _send_response(self, res):
@@ -207,6 +275,12 @@ class CwmWorkerOperatorHTTPRequestHandler(BaseHTTPRequestHandler):
             self.wfile.write(data.encode())
         debug_print("end send_html")
 
+    def _send_text(self, data, content_type):
+        self.send_response(200)
+        self.send_header("Content-type", content_type)
+        self.end_headers()
+        self.wfile.write(data)
+
     def _send_server_error(self, error='Server Error', status_code=500):
         debug_print("start send_server_error({} {})".format(status_code, error))
         self.send_response(status_code)
@@ -240,6 +314,13 @@ class CwmWorkerOperatorHTTPRequestHandler(BaseHTTPRequestHandler):
                 self._send_response(get_redis_key(self.is_api, self.server, pool, key))
             elif self.path.startswith('/nodes'):
                 self._send_response(get_nodes(self.is_api, self.server))
+            elif self.path == '/keys_memory/metrics' and not self.is_api:
+                self._send_text(get_keys_memory_metrics(self.server), prometheus_client.CONTENT_TYPE_LATEST)
+            elif self.path == '/keys_memory':
+                self._send_response(get_keys_memory(self.is_api, self.server))
+            elif self.path.startswith('/search/'):
+                prefix = self.path.replace('/search/', '', 1)
+                self._send_response(get_search(self.is_api, self.server, prefix))
             else:
                 self._send_request_error()
         except:
@@ -0,0 +1,79 @@
+"""
+Benchmark daemon iterations with sequential and concurrent (asyncio) processing of workers
+
+Runs iterations of the initializer, throttler and redis_cleaner daemons which process all the workers
+but don't modify any keys, so the same iteration can be repeated:
+  initializer - hostnames waiting for initialization of workers which are already ready for deployment
+  throttler - workers which were checked recently and throttled workers which didn't expire yet
+  redis_cleaner - hostname errors with a recent deployment flow action
+
+Requires the same environment as the tests, keys are created for dedicated benchmark worker ids and deleted at the end.
+
+Usage: python -m tests.benchmarks.async_daemons [NUM_WORKERS] [CONCURRENCY]
+"""
+import sys
+import json
+import time
+import datetime
+
+from cwm_worker_operator import config
+from cwm_worker_operator import common
+from cwm_worker_operator import initializer, throttler, redis_cleaner
+from cwm_worker_operator.domains_config import DomainsConfig
+
+from ..common import get_volume_config_json
+from ..mocks.metrics import MockInitializerMetrics
+
+
+def set_worker_keys(dc, worker_id, hostname, now):
+    dc.keys.volume_config.set(worker_id, get_volume_config_json(worker_id=worker_id, hostname=hostname))
+    dc.keys.volume_config_hostname_worker_id.set(hostname, worker_id)
+    dc.keys.hostname_initialize.set(hostname, '')
+    dc.keys.worker_ready_for_deployment.set(worker_id, '')
+    dc.keys.hostname_ingress_hostname.set(hostname, json.dumps({
+        'http': 'minio-nginx.{}.svc.cluster.local'.format(common.get_namespace_name_from_worker_id(worker_id)),
+    }))
+    dc.keys.worker_last_throttle_check.set(worker_id, {'t': now.strftime('%Y-%m-%d %H:%M:%S'), 'r': 0})
+    dc.keys.worker_throttled_expiry.set(worker_id, now + datetime.timedelta(days=1))
+    dc.keys.hostname_error.set(hostname, dc.WORKER_ERROR_INVALID_HOSTNAME)
+    dc.keys.hostname_last_deployment_flow_time.set(hostname, now)
+
+
+def measure(func, concurrency):
+    original_concurrency = config.DAEMONS_ASYNC_CONCURRENCY
+    config.DAEMONS_ASYNC_CONCURRENCY = concurrency
+    try:
+        start_time = time.perf_counter()
+        func()
+        return time.perf_counter() - start_time
+    finally:
+        config.DAEMONS_ASYNC_CONCURRENCY = original_concurrency
+
+
+def main(num_workers=5000, concurrency=32):
+    dc = DomainsConfig()
+    now = common.now()
+    worker_hostnames = {'bnchmrk{}'.format(i): 'bnchmrk{}.example.com'.format(i) for i in range(num_workers)}
+    for worker_id, hostname in worker_hostnames.items():
+        set_worker_keys(dc, worker_id, hostname, now)
+    daemons = {
+        'initializer': lambda: initializer.run_single_iteration(dc, MockInitializerMetrics()),
+        'throttler': lambda: throttler.run_single_iteration(dc, now=now),
+        'redis_cleaner': lambda: redis_cleaner.run_single_iteration(dc),
+    }
+    try:
+        print('{} workers, concurrency {}, iteration duration in seconds'.format(num_workers, concurrency))
+        for name, func in daemons.items():
+            sequential_seconds = measure(func, 0)
+            concurrent_seconds = measure(func, concurrency)
+            print('{:<14} sequential={:.3f} concurrent={:.3f} speedup={:.2f}'.format(
+                name, sequential_seconds, concurrent_seconds, sequential_seconds / concurrent_seconds
+            ))
+    finally:
+        for worker_id, hostname in worker_hostnames.items():
+            dc.del_worker_hostname_keys(hostname)
+            dc.del_worker_keys(worker_id, with_metrics=True, with_throttle=True)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
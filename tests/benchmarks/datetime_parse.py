@@ -0,0 +1,48 @@
+"""
+Benchmark parsing of datetime values stored in redis
+
+Compares common.strptime of each legacy format with common.parse_datetime of the same values and of epoch milliseconds.
+
+Doesn't require redis, values are generated in memory.
+
+Usage: python -m tests.benchmarks.datetime_parse [NUM_KEYS]
+"""
+import sys
+import time
+import datetime
+
+from cwm_worker_operator import config
+from cwm_worker_operator import common
+
+
+LEGACY_DATEFORMATS = ['%Y%m%d%H%M%S', '%Y%m%dT%H%M%S.%f', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S']
+
+
+def measure(func, values):
+    start_time = time.perf_counter()
+    for value in values:
+        func(value)
+    return time.perf_counter() - start_time
+
+
+def main(num_keys=100000):
+    now = common.now()
+    datetimes = [now - datetime.timedelta(seconds=i, microseconds=i) for i in range(num_keys)]
+    original_epoch_ms = config.DOMAINS_CONFIG_DATETIME_EPOCH_MS
+    try:
+        print('{} keys, parse duration in seconds'.format(num_keys))
+        for dateformat in LEGACY_DATEFORMATS:
+            config.DOMAINS_CONFIG_DATETIME_EPOCH_MS = False
+            values = [common.format_datetime(dt, dateformat) for dt in datetimes]
+            strptime_seconds = measure(lambda value: common.strptime(value, dateformat), values)
+            parse_datetime_seconds = measure(common.parse_datetime, values)
+            print('{:<20} strptime={:.3f} parse_datetime={:.3f}'.format(dateformat, strptime_seconds, parse_datetime_seconds))
+        config.DOMAINS_CONFIG_DATETIME_EPOCH_MS = True
+        values = [common.format_datetime(dt, None) for dt in datetimes]
+        print('{:<20} parse_datetime={:.3f}'.format('epoch ms', measure(common.parse_datetime, values)))
+    finally:
+        config.DOMAINS_CONFIG_DATETIME_EPOCH_MS = original_epoch_ms
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
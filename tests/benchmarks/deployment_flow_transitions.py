@@ -0,0 +1,142 @@
+"""
+Benchmark deployment flow state transitions latency
+
+Compares the legacy implementation, which runs a separate redis command per key,
+with the current implementation, which runs a single atomic script call per redis pool.
+
+Requires the same environment as the tests, keys are created for dedicated benchmark worker ids and deleted at the end.
+
+Usage: python -m tests.benchmarks.deployment_flow_transitions [NUM_WORKERS] [NUM_HOSTNAMES_PER_WORKER]
+"""
+import sys
+import time
+import json
+import statistics
+
+from cwm_worker_operator import deployment_flow_manager
+from cwm_worker_operator.domains_config import DomainsConfig
+
+from ..common import get_volume_config_json
+
+
+def legacy_del_worker_hostname_keys(dc, hostname, with_error=True, with_available=True, with_ingress=True, with_deployment_flow=True):
+    dc.keys.hostname_initialize.delete(hostname)
+    dc.keys.volume_config_hostname_worker_id.delete(hostname)
+    if with_available:
+        dc.keys.hostname_available.delete(hostname)
+    if with_ingress:
+        dc.keys.hostname_ingress_hostname.delete(hostname)
+    if with_error:
+        if dc.keys.hostname_error.get(hostname) != dc.WORKER_ERROR_THROTTLED.encode():
+            dc.keys.hostname_error.delete(hostname)
+        dc.keys.hostname_error_attempt_number.delete(hostname)
+    if with_deployment_flow:
+        dc.keys.hostname_last_deployment_flow_action.delete(hostname)
+        dc.keys.hostname_last_deployment_flow_time.delete(hostname)
+        dc.keys.hostname_last_deployment_flow_worker_id.delete(hostname)
+
+
+def legacy_del_worker_keys(dc, worker_id, with_error=True, with_available=True, with_ingress=True):
+    for hostname in dc.iterate_worker_hostnames(worker_id):
+        legacy_del_worker_hostname_keys(dc, hostname, with_error=with_error, with_available=with_available,
+                                        with_ingress=with_ingress, with_deployment_flow=False)
+    for key in [dc.keys.worker_ready_for_deployment, dc.keys.worker_deployment_error_attempt,
+                dc.keys.worker_waiting_for_deployment_complete, dc.keys.worker_force_update,
+                dc.keys.worker_force_delete, dc.keys.worker_last_clear_cache, dc.keys.worker_health]:
+        key.delete(worker_id)
+
+
+def legacy_set_worker_error(dc, worker_id, error_msg):
+    for hostname in dc.iterate_worker_hostnames(worker_id):
+        dc.keys.hostname_error.set(hostname, error_msg)
+    legacy_del_worker_keys(dc, worker_id, with_error=False)
+
+
+def legacy_set_worker_available(dc, worker_id, ingress_hostname):
+    hostnames = list(dc.iterate_worker_hostnames(worker_id))
+    legacy_del_worker_keys(dc, worker_id, with_available=False, with_ingress=False)
+    for hostname in hostnames:
+        dc.keys.hostname_available.set(hostname, '')
+        dc.keys.hostname_ingress_hostname.set(hostname, json.dumps(ingress_hostname))
+
+
+def legacy_set_last_action(dc, worker_id, action):
+    dc.keys.worker_last_deployment_flow_action.set(worker_id, action)
+    dc.keys.worker_last_deployment_flow_time.set(worker_id)
+    for hostname in dc.iterate_worker_hostnames(worker_id):
+        dc.keys.hostname_last_deployment_flow_action.set(hostname, action)
+        dc.keys.hostname_last_deployment_flow_time.set(hostname)
+        dc.keys.hostname_last_deployment_flow_worker_id.set(hostname, worker_id)
+
+
+class MockFlowManager:
+
+    def __init__(self, dc):
+        self.domains_config = dc
+
+
+def get_transitions(dc):
+    ingress_hostname = {'http': 'nginx.cwm-worker-benchmark.svc.cluster.local', 'https': 'nginx.cwm-worker-benchmark.svc.cluster.local'}
+    flow_manager = MockFlowManager(dc)
+    return {
+        'set_worker_error': (
+            lambda worker_id: legacy_set_worker_error(dc, worker_id, 'BENCHMARK'),
+            lambda worker_id: dc.set_worker_error(worker_id, 'BENCHMARK'),
+        ),
+        'set_worker_available': (
+            lambda worker_id: legacy_set_worker_available(dc, worker_id, ingress_hostname),
+            lambda worker_id: dc.set_worker_available(worker_id, ingress_hostname),
+        ),
+        'set_last_action': (
+            lambda worker_id: legacy_set_last_action(dc, worker_id, 'BENCHMARK'),
+            lambda worker_id: deployment_flow_manager.set_last_action(flow_manager, 'BENCHMARK', worker_id=worker_id),
+        ),
+    }
+
+
+def measure(worker_ids, func, before_each):
+    durations = []
+    for worker_id in worker_ids:
+        before_each(worker_id)
+        start_time = time.perf_counter()
+        func(worker_id)
+        durations.append((time.perf_counter() - start_time) * 1000)
+    durations.sort()
+    return {
+        'mean': statistics.mean(durations),
+        'p50': durations[len(durations) // 2],
+        'p99': durations[min(len(durations) - 1, int(len(durations) * 0.99))],
+    }
+
+
+def main(num_workers=200, num_hostnames_per_worker=3):
+    dc = DomainsConfig()
+    worker_hostnames = {}
+    for i in range(num_workers):
+        worker_id = 'bnchmrk{}'.format(i)
+        hostnames = ['bnchmrk{}-{}.example.com'.format(i, j) for j in range(num_hostnames_per_worker)]
+        worker_hostnames[worker_id] = hostnames
+        dc.keys.volume_config.set(worker_id, get_volume_config_json(
+            worker_id=worker_id, hostname=hostnames[0],
+            additional_hostnames=[{'hostname': hostname} for hostname in hostnames[1:]]
+        ))
+
+    def before_each(worker_id):
+        dc.set_worker_ready_for_deployment(worker_id)
+        dc.set_worker_waiting_for_deployment(worker_id)
+        for hostname in worker_hostnames[worker_id]:
+            dc.keys.hostname_initialize.set(hostname, '')
+
+    try:
+        print('{} workers, {} hostnames per worker, latency in ms'.format(num_workers, num_hostnames_per_worker))
+        for name, (legacy_func, func) in get_transitions(dc).items():
+            for impl_name, impl_func in [('legacy', legacy_func), ('current', func)]:
+                res = measure(worker_hostnames.keys(), impl_func, before_each)
+                print('{:<22} {:<8} mean={:.3f} p50={:.3f} p99={:.3f}'.format(name, impl_name, res['mean'], res['p50'], res['p99']))
+    finally:
+        for worker_id in worker_hostnames:
+            dc.del_worker_keys(worker_id, with_metrics=True, with_force_delete_data=True, with_throttle=True)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
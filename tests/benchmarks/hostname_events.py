@@ -0,0 +1,70 @@
+"""
+Benchmark latency of the hostname availability events
+
+Measures the time from the waiter decision that a worker is available (WaiterDeploymentFlowManager.set_worker_available)
+until the event of the worker hostname is received by the reference subscriber (hostname_events.subscribe).
+
+Requires the same environment as the tests, keys are created for dedicated benchmark worker ids and deleted at the end.
+
+Usage: python -m tests.benchmarks.hostname_events [NUM_WORKERS]
+"""
+import sys
+import time
+import threading
+
+from cwm_worker_operator import config
+from cwm_worker_operator import hostname_events
+from cwm_worker_operator.domains_config import DomainsConfig
+from cwm_worker_operator.deployment_flow_manager import WaiterDeploymentFlowManager
+
+from ..common import get_volume_config_json
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main(num_workers=1000):
+    dc = DomainsConfig()
+    flow_manager = WaiterDeploymentFlowManager(dc)
+    worker_hostnames = {'bnchmrk{}'.format(i): 'bnchmrk{}.example.com'.format(i) for i in range(num_workers)}
+    for worker_id, hostname in worker_hostnames.items():
+        dc.keys.volume_config.set(worker_id, get_volume_config_json(worker_id=worker_id, hostname=hostname))
+    decision_times, receive_times = {}, {}
+    subscribed_event, stop_event, all_received_event = threading.Event(), threading.Event(), threading.Event()
+
+    def on_event(event):
+        if event['e'] == hostname_events.EVENT_AVAILABLE and event['h'] in decision_times:
+            receive_times[event['h']] = time.perf_counter()
+            if len(receive_times) == num_workers:
+                all_received_event.set()
+
+    thread = threading.Thread(target=hostname_events.subscribe, args=(dc, on_event),
+                              kwargs=dict(stop_event=stop_event, on_subscribed=subscribed_event.set, timeout_seconds=0.1), daemon=True)
+    thread.start()
+    original_hostname_events_enabled = config.DOMAINS_CONFIG_HOSTNAME_EVENTS_ENABLED
+    config.DOMAINS_CONFIG_HOSTNAME_EVENTS_ENABLED = True
+    try:
+        assert subscribed_event.wait(10), 'failed to subscribe to hostname events'
+        for worker_id, hostname in worker_hostnames.items():
+            decision_times[hostname] = time.perf_counter()
+            flow_manager.set_worker_available(worker_id, {'http': 'minio-nginx.bnchmrk.svc.cluster.local'})
+        all_received_event.wait(10)
+        latencies_ms = [(receive_times[hostname] - decision_times[hostname]) * 1000 for hostname in receive_times]
+        print('{} workers, received {} events, latency from waiter decision to subscriber receipt in ms'.format(num_workers, len(latencies_ms)))
+        if latencies_ms:
+            print('p50={:.3f} p90={:.3f} p99={:.3f} max={:.3f}'.format(
+                percentile(latencies_ms, 50), percentile(latencies_ms, 90), percentile(latencies_ms, 99), max(latencies_ms)
+            ))
+    finally:
+        config.DOMAINS_CONFIG_HOSTNAME_EVENTS_ENABLED = original_hostname_events_enabled
+        stop_event.set()
+        thread.join()
+        for worker_id, hostname in worker_hostnames.items():
+            dc.del_worker_hostname_keys(hostname)
+            dc.del_worker_keys(worker_id, hostnames=[hostname])
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
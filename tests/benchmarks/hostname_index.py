@@ -0,0 +1,58 @@
+"""
+Benchmark matching of request hostnames with partial hostnames
+
+Compares a linear scan of the partial hostnames using the legacy string splitting comparison with common.HostnameIndex,
+half of the request hostnames are subdomains of partial hostnames and half don't match any partial hostname.
+
+Doesn't require redis, hostnames are generated in memory.
+
+Usage: python -m tests.benchmarks.hostname_index [NUM_HOSTNAMES] [NUM_LINEAR_SCAN_REQUESTS]
+"""
+import sys
+import time
+
+from cwm_worker_operator import common
+
+
+def legacy_is_hostnames_match(full_hostname, partial_hostname):
+    if full_hostname.lower() == partial_hostname.lower():
+        return True
+    elif '.'.join(full_hostname.split('.')[1:]).lower() == partial_hostname.lower():
+        return True
+    else:
+        return False
+
+
+def legacy_is_hostnames_match_in_list(full_hostname, partial_hostnames):
+    return any((legacy_is_hostnames_match(full_hostname, partial_hostname) for partial_hostname in partial_hostnames))
+
+
+def measure(func, request_hostnames):
+    start_time = time.perf_counter()
+    num_matches = sum(1 for request_hostname in request_hostnames if func(request_hostname))
+    return time.perf_counter() - start_time, num_matches
+
+
+def main(num_hostnames=50000, num_linear_scan_requests=200):
+    partial_hostnames = ['bnchmrk{}.Example.com'.format(i) for i in range(num_hostnames)]
+    request_hostnames = [
+        ('www.bnchmrk{}.example.com' if i % 2 == 0 else 'www.bnchmrk{}.example.org').format(i)
+        for i in range(num_hostnames)
+    ]
+    print('{} partial hostnames, {} request hostnames, duration in seconds'.format(num_hostnames, num_hostnames))
+    linear_scan_seconds, linear_scan_matches = measure(lambda request_hostname: legacy_is_hostnames_match_in_list(request_hostname, partial_hostnames),
+                                                       request_hostnames[:num_linear_scan_requests])
+    linear_scan_seconds = linear_scan_seconds * num_hostnames / num_linear_scan_requests
+    start_time = time.perf_counter()
+    hostname_index = common.HostnameIndex(partial_hostnames)
+    build_seconds = time.perf_counter() - start_time
+    index_seconds, index_matches = measure(lambda request_hostname: request_hostname in hostname_index, request_hostnames)
+    assert index_matches == num_hostnames // 2 + num_hostnames % 2
+    assert linear_scan_matches == num_linear_scan_requests // 2 + num_linear_scan_requests % 2
+    print('linear scan={:.3f} (estimated from {} requests)'.format(linear_scan_seconds, num_linear_scan_requests))
+    print('hostname index={:.3f} (build={:.3f})'.format(index_seconds + build_seconds, build_seconds))
+    print('speedup={:.0f}'.format(linear_scan_seconds / (index_seconds + build_seconds)))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,46 @@
+"""
+Benchmark prefix search of hostnames
+
+Compares a prefix search using the search index (ZRANGEBYLEX of a single sorted set key)
+with scanning the hostname keys of the ingress redis, which is the only option without the index.
+
+Requires the same environment as the tests, keys are created for dedicated benchmark hostnames and deleted at the end.
+
+Usage: python -m tests.benchmarks.search_index [NUM_HOSTNAMES] [NUM_SEARCHES]
+"""
+import sys
+import time
+
+from cwm_worker_operator import config
+from cwm_worker_operator.domains_config import DomainsConfig, DomainsConfigKeyLexIndex, scan_iter
+
+
+def main(num_hostnames=100000, num_searches=100):
+    dc = DomainsConfig()
+    hostnames = ['bnchmrk{}.example.com'.format(i) for i in range(num_hostnames)]
+    prefixes = ['bnchmrk{}'.format(i * 997 % num_hostnames) for i in range(num_searches)]
+    entries = [(DomainsConfigKeyLexIndex.TYPE_HOSTNAME, hostname) for hostname in hostnames]
+    try:
+        for i in range(0, num_hostnames, 1000):
+            with dc.pipeline() as pipeline:
+                dc.keys.search_index.add_many(entries[i:i + 1000], pipeline=pipeline)
+                dc.keys.hostname_available.set_many({hostname: '' for hostname in hostnames[i:i + 1000]}, pipeline=pipeline)
+        start_time = time.perf_counter()
+        for prefix in prefixes:
+            dc.keys.search_index.search(prefix, config.DOMAINS_CONFIG_SEARCH_MAX_RESULTS)
+        index_ms = (time.perf_counter() - start_time) * 1000 / num_searches
+        start_time = time.perf_counter()
+        with dc.keys.hostname_available.get_redis() as r:
+            for prefix in prefixes[:max(1, num_searches // 10)]:
+                list(scan_iter(r, dc.keys.hostname_available._('{}*'.format(prefix)), count=config.DOMAINS_CONFIG_SCAN_COUNT))
+        scan_ms = (time.perf_counter() - start_time) * 1000 / max(1, num_searches // 10)
+        print('{} hostnames, search duration in ms: index={:.3f} scan={:.3f}'.format(num_hostnames, index_ms, scan_ms))
+    finally:
+        for i in range(0, num_hostnames, 1000):
+            with dc.pipeline() as pipeline:
+                dc.keys.search_index.remove_many(entries[i:i + 1000], pipeline=pipeline)
+                dc.keys.hostname_available.delete_many(hostnames[i:i + 1000], pipeline=pipeline)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
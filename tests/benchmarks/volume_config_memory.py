@@ -0,0 +1,93 @@
+"""
+Benchmark internal redis memory used by volume config keys
+
+Compares the legacy plain json codec with the compact codec (compact json, compressed with zlib above a size threshold),
+volume configs include certificates and private keys for each hostname, similar to volume configs returned by the cwm api.
+
+Requires the same environment as the tests, keys are created for dedicated benchmark worker ids and deleted at the end.
+
+Usage: python -m tests.benchmarks.volume_config_memory [NUM_WORKERS] [NUM_HOSTNAMES_PER_WORKER]
+"""
+import os
+import sys
+import time
+import base64
+
+from cwm_worker_operator import config
+from cwm_worker_operator import common
+from cwm_worker_operator import value_codec
+from cwm_worker_operator.domains_config import DomainsConfig
+
+from ..common import get_volume_config_dict
+
+
+def get_pem_lines(title, num_bytes):
+    data = base64.b64encode(os.urandom(num_bytes)).decode()
+    return ['-----BEGIN {}-----'.format(title), *[data[i:i + 64] for i in range(0, len(data), 64)], '-----END {}-----'.format(title)]
+
+
+def get_worker_volume_config(worker_id, num_hostnames):
+    hostnames = [
+        {'hostname': 'bnchmrk-{}-{}.example.com'.format(worker_id, i), 'privateKey': get_pem_lines('PRIVATE KEY', 1200),
+         'fullChain': get_pem_lines('CERTIFICATE', 1300) + get_pem_lines('CERTIFICATE', 1100), 'chain': get_pem_lines('CERTIFICATE', 1100)}
+        for i in range(num_hostnames)
+    ]
+    volume_config = get_volume_config_dict(worker_id=worker_id, hostname=hostnames[0]['hostname'], with_ssl=hostnames[0], additional_hostnames=hostnames[1:],
+                                           additional_volume_config={'protocol': 'https', 'client_id': 'bnchmrk', 'secret': 'bnchmrk', 'zone': 'EU'})
+    volume_config['__request_hostname'] = hostnames[0]['hostname']
+    volume_config['__last_update'] = common.now().strftime("%Y%m%dT%H%M%S")
+    return volume_config
+
+
+def measure(dc, volume_configs):
+    with dc.keys.volume_config.get_redis() as r:
+        used_memory_before = r.info('memory')['used_memory']
+        start_time = time.perf_counter()
+        for worker_id, volume_config in volume_configs.items():
+            dc.keys.volume_config.set_json(worker_id, volume_config)
+        set_seconds = time.perf_counter() - start_time
+        used_memory_after = r.info('memory')['used_memory']
+        start_time = time.perf_counter()
+        for worker_id in volume_configs:
+            dc.keys.volume_config.get_json(worker_id)
+        get_seconds = time.perf_counter() - start_time
+        pipe = r.pipeline(transaction=False)
+        for worker_id in volume_configs:
+            pipe.memory_usage(dc.keys.volume_config._(worker_id))
+            pipe.strlen(dc.keys.volume_config._(worker_id))
+        values = pipe.execute()
+        return {
+            'memory_usage': sum(values[::2]),
+            'value_bytes': sum(values[1::2]),
+            'used_memory': used_memory_after - used_memory_before,
+            'set_ms': set_seconds * 1000 / len(volume_configs),
+            'get_ms': get_seconds * 1000 / len(volume_configs),
+        }
+
+
+def main(num_workers=10000, num_hostnames_per_worker=3):
+    dc = DomainsConfig()
+    volume_configs = {
+        'bnchmrk{}'.format(i): get_worker_volume_config('bnchmrk{}'.format(i), num_hostnames_per_worker)
+        for i in range(num_workers)
+    }
+    original_codec = config.DOMAINS_CONFIG_JSON_CODEC
+    results = {}
+    try:
+        print('{} workers, {} hostnames per worker'.format(num_workers, num_hostnames_per_worker))
+        for codec_name in [value_codec.CODEC_JSON, value_codec.CODEC_COMPACT]:
+            config.DOMAINS_CONFIG_JSON_CODEC = codec_name
+            results[codec_name] = res = measure(dc, volume_configs)
+            dc.keys.volume_config.delete_many(volume_configs.keys())
+            print('{:<8} memory_usage={:.1f}MB value_bytes={:.1f}MB used_memory_delta={:.1f}MB set_ms={:.3f} get_ms={:.3f}'.format(
+                codec_name, res['memory_usage'] / 1024 / 1024, res['value_bytes'] / 1024 / 1024, res['used_memory'] / 1024 / 1024, res['set_ms'], res['get_ms']
+            ))
+        saved_bytes = results[value_codec.CODEC_JSON]['memory_usage'] - results[value_codec.CODEC_COMPACT]['memory_usage']
+        print('saved {:.1f}MB ({:.1f}%)'.format(saved_bytes / 1024 / 1024, saved_bytes * 100 / results[value_codec.CODEC_JSON]['memory_usage']))
+    finally:
+        config.DOMAINS_CONFIG_JSON_CODEC = original_codec
+        dc.keys.volume_config.delete_many(volume_configs.keys())
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -64,3 +64,52 @@ def test_local_storage_json_last_items():
         }
         for i in [99, 98, 97, 96, 95]
     ]
+
+
+def test_parse_datetime():
+    expected_dt = datetime.datetime(2020, 11, 3, 22, 11, 12, tzinfo=datetime.timezone.utc)
+    for value in ['20201103221112', '20201103T221112', '2020-11-03 22:11:12', '2020-11-03T22:11:12',
+                  '2020-11-03T22:11:12+00:00', '20201103T221112+0000', b'20201103221112', '1604441472000']:
+        assert common.parse_datetime(value) == expected_dt, value
+    assert common.parse_datetime('20201103T221112.123456') == expected_dt.replace(microsecond=123456)
+    assert common.parse_datetime('2020-11-03T22:11:12.5') == expected_dt.replace(microsecond=500000)
+    assert common.parse_datetime('1604441472123') == expected_dt.replace(microsecond=123000)
+    assert common.parse_datetime('2020-11-03T23:11:12+01:00') == expected_dt
+    assert common.parse_datetime('') is None
+    assert common.parse_datetime(None) is None
+    for value in ['foobar', '2020-11-03', '20201103221112.x', '2020-11-03T22:11:12+1']:
+        with pytest.raises(ValueError):
+            common.parse_datetime(value)
+    for dateformat in ['%Y%m%d%H%M%S', '%Y%m%dT%H%M%S.%f', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S']:
+        assert common.parse_datetime(expected_dt.strftime(dateformat)) == common.strptime(expected_dt.strftime(dateformat), dateformat)
+
+
+def test_format_datetime():
+    dt = datetime.datetime(2020, 11, 3, 22, 11, 12, 123456, tzinfo=datetime.timezone.utc)
+    original_epoch_ms = config.DOMAINS_CONFIG_DATETIME_EPOCH_MS
+    try:
+        config.DOMAINS_CONFIG_DATETIME_EPOCH_MS = False
+        assert common.format_datetime(dt, '%Y%m%d%H%M%S') == '20201103221112'
+        config.DOMAINS_CONFIG_DATETIME_EPOCH_MS = True
+        assert common.format_datetime(dt, '%Y%m%d%H%M%S') == '1604441472123'
+        assert common.format_datetime(dt.replace(tzinfo=None), '%Y%m%d%H%M%S') == '1604441472123'
+        assert common.parse_datetime(common.format_datetime(dt, '%Y%m%d%H%M%S')) == dt.replace(microsecond=123000)
+    finally:
+        config.DOMAINS_CONFIG_DATETIME_EPOCH_MS = original_epoch_ms
+
+
+def test_hostname_index():
+    hostname_index = common.HostnameIndex(['Example.com', 'foo.example.com', 'bar.com'])
+    assert len(hostname_index) == 3
+    assert hostname_index.match('example.com') == 'Example.com'
+    assert hostname_index.match('WWW.example.COM') == 'Example.com'
+    assert hostname_index.match('foo.example.com') == 'foo.example.com'
+    assert hostname_index.match('www.foo.example.com') == 'foo.example.com'
+    assert hostname_index.match('www.www.example.com') is None
+    assert hostname_index.match('com') is None
+    assert 'a.bar.com' in hostname_index
+    assert 'a.baz.com' not in hostname_index
+    for full_hostname in ['example.com', 'a.bar.com', 'a.b.bar.com', 'bar.co', 'BAR.COM']:
+        assert common.is_hostnames_match_in_list(full_hostname, ['example.com', 'Bar.com']) == any(
+            common.is_hostnames_match(full_hostname, partial_hostname) for partial_hostname in ['example.com', 'Bar.com']
+        )
@@ -1,14 +1,27 @@
 import os
 import json
+import time
+import asyncio
 import datetime
+import threading
 
 import pytz
+from prometheus_client import REGISTRY
+from redis.crc import key_slot
 
-from cwm_worker_operator.domains_config import DomainsConfigKey, DomainsConfig, VolumeConfigGatewayTypeS3, DomainsConfigKeyPrefixInt
+from cwm_worker_operator.domains_config import DomainsConfigKey, DomainsConfig, VolumeConfig, VolumeConfigCache, KeysSummaryCache, VolumeConfigGatewayTypeS3, DomainsConfigKeyPrefix, DomainsConfigKeyPrefixInt, DomainsConfigKeyOps
 from cwm_worker_operator.common import strptime, get_namespace_name_from_worker_id
 from cwm_worker_operator import config
+from cwm_worker_operator import common
+from cwm_worker_operator import deployment_flow_manager
+from cwm_worker_operator import value_codec
+from cwm_worker_operator import metrics
+from cwm_worker_operator import metrics_updater
+from cwm_worker_operator import hostname_events
+from cwm_worker_operator.async_domains_config import AsyncDomainsConfig
 
 from .common import set_volume_config_key, get_volume_config_dict, get_volume_config_json
+from .mocks.domains_config import MockDomainsConfig
 
 
 CERTIFICATE_PEM = ["-----BEGIN CERTIFICATE-----", "MIIETTCCAzWgAwIBAgIBADANBgkqhkiG9w0BAQsFADCBwDEnMCUGA1UEAwweNGVl", "NGFiMDU2Yy5nZW8uY2xvdWR3bS1vYmouY29tMSkwJwYJKoZIhvcNAQkBFhpvYmpl", "Y3RzdG9yYWdlb3JpQGdtYWlsLmNvbTEiMCAGA1UECgwZb2JqZWN0c3RvcmFnZS5j", "bG91ZHdtLmNvbTEiMCAGA1UECwwZb2JqZWN0c3RvcmFnZS5jbG91ZHdtLmNvbTEL", "MAkGA1UEBhMCWFgxFTATBgNVBAcMDERlZmF1bHQgQ2l0eTAeFw0yMTA1MTAxMjM3", "MDdaFw0yMjA1MTAxMjM3MDdaMIHAMScwJQYDVQQDDB40ZWU0YWIwNTZjLmdlby5j", "bG91ZHdtLW9iai5jb20xKTAnBgkqhkiG9w0BCQEWGm9iamVjdHN0b3JhZ2VvcmlA", "Z21haWwuY29tMSIwIAYDVQQKDBlvYmplY3RzdG9yYWdlLmNsb3Vkd20uY29tMSIw", "IAYDVQQLDBlvYmplY3RzdG9yYWdlLmNsb3Vkd20uY29tMQswCQYDVQQGEwJYWDEV", "MBMGA1UEBwwMRGVmYXVsdCBDaXR5MIIBIjANBgkqhkiG9w0BAQEFAAOCAQ8AMIIB", "CgKCAQEAuV7j9Vla8Zr59lBrTIcQlLtDjwL+/hXjPNz0nOKqt2YmjDuZ+c5+A0k/", "BcMpkh8byttFfKhkz66HefO6BzI+at11PyRn/zfQ6NpRAUMIwJb9wuIcNH5e5RtC", "0D3ZZoQVtHz0+UyCQdCgQ5/n7AQ9g0j1u1dNU/1qJ5y37vh8TFiVxuiQ/A2lLJQq", "Hccd6z39jC9HzXrVrH7TowHy4tgGieg1F41rqLuW7vl4vScnb6efZpi1a/5iMy8f", "RVLiSlpTWcGc7Ood1LoxzviR5HENZ8+ILYkbdBUJ6ZgnP4g+woY8Jo5WoeT8ruwr", "YSNpbz7QFahVw1s7Ypr7z5EHB9PTdQIDAQABo1AwTjAdBgNVHQ4EFgQUFexsmCL7", "uySB9HnU4TUx7Qn5gugwHwYDVR0jBBgwFoAUFexsmCL7uySB9HnU4TUx7Qn5gugw", "DAYDVR0TBAUwAwEB/zANBgkqhkiG9w0BAQsFAAOCAQEARQMUrM1zANELXKDWRc2T", "TWQvj/0LmkhLnxeI4B66l1unFMwJNi5Rvokz+CsA7rwEOwHeCPcUGcQNbQl5/KFf", "E8k8jtlpatS/dN6ZlRFGVQV5AOcL1aKVMfsjgSjwGJCDgJ2/A0KWL/fQ7O5+0+Fh", "s9Gq8YWgFLBzsS/j1JxdA4z9jfSj8maMQNx0RZClfCYXyWqw0fgDu1U/GT28XTT6", "LLwK/1bkPQygIrnYN3A1vNAR+8oGZqf00MMaY7w/Of61mMm9HK03wHu9OI3B9Luh", "SsUwkNFMcGFzf9qkf8+6Pu1f6rMR9oDHWAq3ipKunNqJpHPlEzBkrf9OeoUPkxZ7", "nw==", "-----END CERTIFICATE-----"]
@@ -186,6 +199,38 @@ def test_volume_config_hostname_worker_id_cache(domains_config):
     assert volume_config.hostnames[0] == hostname
 
 
+def test_volume_config_no_redundant_writes(domains_config):
+    dc = domains_config
+    worker_id = 'worker1'
+    hostname = 'example007.com'
+    data = get_volume_config_dict(worker_id=worker_id, hostname=hostname, with_ssl=True, additional_volume_config={
+        'zone': 'EU', 'minio_extra_configs': {'protocols-enabled': ['https'], 'metricsLogger': {'S3_STORE_AS': 'txt'}}
+    })
+    original_data = json.loads(json.dumps(data))
+    volume_config = VolumeConfig(data, None)
+    assert volume_config.hostnames == [hostname] and volume_config.protocols_enabled == {'https'}
+    assert volume_config.minio_extra_configs['metricsLogger'] == {'S3_STORE_AS': 'text'}
+    assert 'www.' + hostname in volume_config.get_hostnames_index()
+    assert volume_config.get_hostnames_index() is volume_config.get_hostnames_index()
+    assert json.loads(str(volume_config))['hostnames'] == [hostname]
+    assert data == original_data
+    dc._cwm_api_volume_configs['hostname:{}'.format(hostname)] = data
+    writes = []
+    for key_name in ['volume_config', 'volume_config_hostname_worker_id']:
+        key = getattr(dc.keys, key_name)
+        key.set = lambda param, value, key_name=key_name, set=key.set: writes.append(key_name) or set(param, value)
+        key.set_many = lambda values, pipeline=None, key_name=key_name, set_many=key.set_many: writes.append(key_name) or set_many(values, pipeline=pipeline)
+    assert dc.get_cwm_api_volume_config(hostname=hostname).id == worker_id
+    assert writes == ['volume_config', 'volume_config_hostname_worker_id']
+    assert data == original_data
+    # volume config and hostname mapping are unchanged when the volume config is loaded using the hostname mapping
+    for _ in range(3):
+        volume_config = dc.get_cwm_api_volume_config(hostname=hostname)
+        assert volume_config.id == worker_id and volume_config.hostnames == [hostname]
+    assert writes == ['volume_config', 'volume_config_hostname_worker_id']
+    assert dc.keys.volume_config.get_json(worker_id)['minio_extra_configs'] == original_data['minio_extra_configs']
+
+
 def test_volume_config_force_update(domains_config):
     dc = domains_config
     worker_id = 'worker1'
@@ -250,6 +295,32 @@ def test_deployment_api_metrics(domains_config):
     assert dc.get_deployment_api_metrics(namespace_name) == {'mymetric': '5'}
 
 
+def test_deployment_api_metrics_hash(domains_config):
+    dc = domains_config
+    namespace_name = 'cwm-worker-worker1'
+    data = {'bytes_in': 10, 'bytes_out': 20, 'num_requests_in': 1, 'num_requests_out': 2, 'num_requests_misc': 0}
+    dc.update_deployment_api_metrics(namespace_name, data)
+    dc.keys.deployment_api_metric.set(namespace_name + ':bytes_out_float', '1.5')
+    original_enabled = config.DEPLOYMENT_API_METRICS_HASH_ENABLED
+    try:
+        config.DEPLOYMENT_API_METRICS_HASH_ENABLED = True
+        # hash doesn't exist yet, metrics are read from the legacy keys
+        assert dc.get_deployment_api_metrics(namespace_name) == {**{k: str(v) for k, v in data.items()}, 'bytes_out_float': '1.5'}
+        dc.update_deployment_api_metrics(namespace_name, data)
+        assert dc.get_deployment_api_metrics(namespace_name) == {k: str(v) for k, v in data.items()}
+        assert dc.migrate_deployment_api_metrics() == 6
+        assert dc.get_deployment_api_metrics(namespace_name) == {**{k: str(v * 2) for k, v in data.items()}, 'bytes_out_float': '1.5'}
+        with dc.get_metrics_redis() as r:
+            assert set(r.keys('deploymentid:minio-metrics:*')) == {'deploymentid:minio-metrics:{}'.format(namespace_name).encode()}
+        assert {
+            key_summary['title']: key_summary['keys'] for key_summary in dc.get_keys_summary(worker_id='worker1') if key_summary
+        }['deployment_api_metric'] == ['deploymentid:minio-metrics:{} = {}'.format(namespace_name, json.dumps(dc.get_deployment_api_metrics(namespace_name)))]
+        dc.del_worker_keys('worker1', with_metrics=True)
+        assert dc.get_deployment_api_metrics(namespace_name) == {}
+    finally:
+        config.DEPLOYMENT_API_METRICS_HASH_ENABLED = original_enabled
+
+
 def test_deployment_last_action(domains_config):
     dc = domains_config
     namespace_name = 'worker1'
@@ -262,6 +333,32 @@ def test_deployment_last_action(domains_config):
     assert dc.get_deployment_last_action(namespace_name) == datetime.datetime(2020, 11, 3, 22, 11, 12, tzinfo=pytz.UTC)
 
 
+def test_datetime_epoch_ms(domains_config):
+    dc = domains_config
+    dt = datetime.datetime(2020, 11, 3, 22, 11, 12, tzinfo=pytz.UTC)
+    dc.keys.worker_throttled_expiry.set('worker1', dt)
+    assert dc.keys.worker_throttled_expiry.get('worker1') == dt
+    original_epoch_ms = config.DOMAINS_CONFIG_DATETIME_EPOCH_MS
+    try:
+        config.DOMAINS_CONFIG_DATETIME_EPOCH_MS = True
+        # legacy values are still parsed after enabling epoch milliseconds
+        assert dc.keys.worker_throttled_expiry.get('worker1') == dt
+        dc.keys.worker_throttled_expiry.set('worker2', dt)
+        assert dc.keys.worker_throttled_expiry.get('worker2') == dt
+        assert DomainsConfigKeyPrefix.get(dc.keys.worker_throttled_expiry, 'worker2') == b'1604441472000'
+        dc.set_worker_ready_for_deployment('worker1')
+        assert (common.now() - dc.get_worker_ready_for_deployment_start_time('worker1')).total_seconds() < 5
+        # deployment last action is in the shared metrics redis so it keeps the legacy format
+        dc.set_deployment_last_action('worker1')
+        assert (common.now() - dc.get_deployment_last_action('worker1')).total_seconds() < 5
+        assert 'T' in dc.keys.deployment_last_action.get('worker1').decode()
+        agg_metrics, current_metrics = {}, {}
+        metrics_updater.update_agg_metrics(agg_metrics, dt, current_metrics)
+        assert agg_metrics[metrics_updater.LAST_UPDATE_KEY] == current_metrics[metrics_updater.TIMESTAMP_KEY] == '20201103221112'
+    finally:
+        config.DOMAINS_CONFIG_DATETIME_EPOCH_MS = original_epoch_ms
+
+
 def test_get_worker_ready_for_deployment_start_time_exception(domains_config):
     dc = domains_config
     worker_id = 'worker1'
@@ -278,7 +375,7 @@ def test_del_worker_keys(domains_config):
     for key_name in dir(domains_config.keys):
         key = getattr(domains_config.keys, key_name)
         keys_summary_param = getattr(key, 'keys_summary_param', None)
-        if not isinstance(key, DomainsConfigKey) or key_name in ['alerts', 'updater_last_cwm_api_update'] or keys_summary_param == 'node':
+        if not isinstance(key, DomainsConfigKey) or key_name in ['alerts', 'updater_last_cwm_api_update', 'worker_ready_for_deployment_queue', 'worker_waiting_for_deployment_complete_queue', 'search_index', 'hostname_deny', 'hostname_deny_count'] or keys_summary_param == 'node':
             continue
         val = '1' if isinstance(key, DomainsConfigKeyPrefixInt) else ''
         if key_name == 'deployment_api_metric':
@@ -320,6 +417,292 @@ def test_del_worker_keys_throttle(domains_config):
     assert domains_config._get_all_redis_pools_values() == {}
 
 
+def test_prefix_index(domains_config):
+    dc = domains_config
+    config.DOMAINS_CONFIG_PREFIX_INDEX_ENABLED = True
+    try:
+        dc.set_worker_ready_for_deployment('worker1')
+        dc.set_worker_ready_for_deployment('worker2')
+        dc.keys.volume_config.set('worker1', '{}')
+        dc.keys.volume_config_hostname_worker_id.set('example007.com', 'worker1')
+        assert set(dc.get_worker_ids_ready_for_deployment()) == {'worker1', 'worker2'}
+        assert list(dc.keys.volume_config.iterate_prefix_key_suffixes()) == ['worker1']
+        with dc.get_internal_redis() as r:
+            assert r.smembers(dc.keys.worker_ready_for_deployment._index()) == {b'worker1', b'worker2'}
+            # key deleted directly in redis is pruned from the index on next iteration
+            r.delete(dc.keys.worker_ready_for_deployment._('worker2'))
+            assert dc.get_worker_ids_ready_for_deployment() == ['worker1']
+            assert r.smembers(dc.keys.worker_ready_for_deployment._index()) == {b'worker1'}
+            dc.keys.worker_ready_for_deployment.delete('worker1')
+            assert dc.get_worker_ids_ready_for_deployment() == []
+            assert not r.exists(dc.keys.worker_ready_for_deployment._index())
+            assert dc.increment_worker_deployment_attempt_number('worker1') == 1
+            assert list(dc.keys.worker_deployment_error_attempt.iterate_prefix_key_suffixes()) == ['worker1']
+        # keys written by cwm-worker-ingress are not indexed
+        dc.keys.hostname_initialize.set('example007.com', '')
+        assert dc.get_hostnames_waiting_for_initialization() == ['example007.com']
+        with dc.get_ingress_redis() as r:
+            assert not r.exists(dc.keys.hostname_initialize._index())
+    finally:
+        config.DOMAINS_CONFIG_PREFIX_INDEX_ENABLED = False
+
+
+def test_backfill_prefix_indexes(domains_config):
+    dc = domains_config
+    dc.keys.volume_config.set('worker1', '{}')
+    dc.keys.volume_config_hostname_worker_id.set('example007.com', 'worker1')
+    dc.set_worker_force_update('worker2')
+    dc.keys.hostname_initialize.set('example007.com', '')
+    backfilled = dict(dc.backfill_prefix_indexes())
+    assert backfilled['volume_config'] == 1
+    assert backfilled['volume_config_hostname_worker_id'] == 1
+    assert backfilled['worker_force_update'] == 1
+    assert 'hostname_initialize' not in backfilled
+    config.DOMAINS_CONFIG_PREFIX_INDEX_ENABLED = True
+    try:
+        assert list(dc.keys.volume_config.iterate_prefix_key_suffixes()) == ['worker1']
+        assert dc.get_worker_ids_force_update() == ['worker2']
+    finally:
+        config.DOMAINS_CONFIG_PREFIX_INDEX_ENABLED = False
+
+
+def test_keys_batch_api(domains_config):
+    dc = domains_config
+    hostnames = ['example007.com', 'example008.com', 'example009.com']
+    dc.keys.hostname_error.set_many({hostname: 'error' for hostname in hostnames[:2]})
+    assert dc.keys.hostname_error.get_many(hostnames) == [b'error', b'error', None]
+    assert dc.keys.hostname_error.exists_many(hostnames) == [True, True, False]
+    dc.keys.hostname_error_attempt_number.set_many({hostname: 0 for hostname in hostnames})
+    dc.keys.worker_deployment_error_attempt.set_many({'worker1': 2})
+    assert dc.keys.worker_deployment_error_attempt.get_many(['worker1', 'worker2']) == [2, 0]
+    dt = datetime.datetime(2021, 7, 1, 10, 12, 33, tzinfo=pytz.UTC)
+    dc.keys.worker_throttled_expiry.set_many({'worker1': dt})
+    assert dc.keys.worker_throttled_expiry.get_many(['worker1', 'worker2']) == [dt, None]
+    dc.keys.node_nas_is_healthy.set_many({'node1': True, 'node2': False})
+    assert dc.keys.node_nas_is_healthy.get_many(['node1', 'node2']) == [True, False]
+    with dc.pipeline() as pipeline:
+        dc.keys.hostname_error.delete_many(hostnames, pipeline=pipeline)
+        dc.keys.hostname_error_attempt_number.delete_many(hostnames, pipeline=pipeline)
+        # commands are executed only when the pipeline context exits
+        assert dc.keys.hostname_error.exists_many(hostnames) == [True, True, False]
+    assert dc.keys.hostname_error.exists_many(hostnames) == [False, False, False]
+    assert dc._get_all_redis_pools_keys() == {
+        'node:nas:is_healthy:node1',
+        'worker:opstatus:deployment_error_attempt:worker1',
+        'worker:throttle:expiry:worker1',
+    }
+
+
+def test_deployment_flow_queues(domains_config):
+
+    def get_queue_items(queue):
+        with queue.get_redis() as r:
+            return (
+                [item.decode() for item in r.lrange(queue._(), 0, -1)],
+                [item.decode() for item in r.lrange(queue.processing_key(), 0, -1)],
+                [item.decode() for item in r.zrange(queue.delayed_key(), 0, -1)]
+            )
+
+    def set_delayed_items_due(queue):
+        with queue.get_redis() as r:
+            r.zadd(queue.delayed_key(), {item: 0 for item in r.zrange(queue.delayed_key(), 0, -1)})
+
+    deployer_queue = domains_config.keys.worker_ready_for_deployment_queue
+    waiter_queue = domains_config.keys.worker_waiting_for_deployment_complete_queue
+    config.DEPLOYMENT_FLOW_QUEUES_ENABLED = True
+    try:
+        domains_config.set_worker_ready_for_deployment('worker1')
+        domains_config.set_worker_ready_for_deployment('worker2')
+        assert get_queue_items(deployer_queue) == (['worker2', 'worker1'], [], [])
+        deployer_flow_manager = deployment_flow_manager.DeployerDeploymentFlowManager(domains_config)
+        assert list(deployer_flow_manager.iterate_worker_ids_ready_for_deployment()) == ['worker1', 'worker2']
+        assert get_queue_items(deployer_queue) == ([], ['worker2', 'worker1'], [])
+        # worker2 was not handled, so it's queued again after a delay, worker1 is queued by the transition to the waiter
+        domains_config.set_worker_waiting_for_deployment('worker1')
+        deployer_flow_manager.complete_iteration()
+        assert get_queue_items(deployer_queue) == ([], [], ['worker2'])
+        assert get_queue_items(waiter_queue) == (['worker1'], [], [])
+        # delayed worker ids are popped only when they are due
+        assert list(deployer_flow_manager.iterate_worker_ids_ready_for_deployment()) == []
+        deployer_flow_manager.complete_iteration()
+        set_delayed_items_due(deployer_queue)
+        assert list(deployer_flow_manager.iterate_worker_ids_ready_for_deployment()) == ['worker2']
+        deployer_flow_manager.complete_iteration()
+        assert get_queue_items(deployer_queue) == ([], [], ['worker2'])
+        # worker1 is still waiting for deployment, so it's checked again after a delay
+        waiter_flow_manager = deployment_flow_manager.WaiterDeploymentFlowManager(domains_config)
+        assert list(waiter_flow_manager.iterate_worker_ids_waiting_for_deployment_complete()) == ['worker1']
+        waiter_flow_manager.complete_iteration()
+        assert get_queue_items(waiter_queue) == ([], [], ['worker1'])
+        assert list(waiter_flow_manager.iterate_worker_ids_waiting_for_deployment_complete()) == []
+        # worker1 is handed back to the deployer
+        set_delayed_items_due(waiter_queue)
+        assert list(waiter_flow_manager.iterate_worker_ids_waiting_for_deployment_complete()) == ['worker1']
+        waiter_flow_manager.set_worker_wait_for_error_complete('worker1')
+        waiter_flow_manager.complete_iteration()
+        assert get_queue_items(waiter_queue) == ([], [], [])
+        assert get_queue_items(deployer_queue) == (['worker1'], [], ['worker2'])
+        # items left in processing are recovered, keys which are not in the queue or delayed are added
+        assert deployer_queue.pop_all() == ['worker1']
+        domains_config.keys.worker_ready_for_deployment.set('worker3', '')
+        deployment_flow_manager.DeployerDeploymentFlowManager(domains_config).recover_queue()
+        assert get_queue_items(deployer_queue) == (['worker3', 'worker1'], [], ['worker2'])
+        # worker ids without the flow keys are skipped and removed from the queue
+        domains_config.del_worker_keys('worker1')
+        assert list(deployer_flow_manager.iterate_worker_ids_ready_for_deployment()) == ['worker3']
+        deployer_flow_manager.complete_iteration()
+        assert get_queue_items(deployer_queue) == ([], [], ['worker2', 'worker3'])
+    finally:
+        config.DEPLOYMENT_FLOW_QUEUES_ENABLED = False
+
+
+def test_worker_hash_layout(domains_config):
+    keys = domains_config.keys
+    keys.worker_ready_for_deployment.set('worker1', 'ready')
+    assert keys.worker_deployment_error_attempt.increment('worker1') == 1
+    keys.worker_health.set('worker1', 'healthy')
+    assert list(domains_config.backfill_prefix_indexes())
+    config.DOMAINS_CONFIG_WORKER_HASH_ENABLED = True
+    try:
+        # legacy keys are readable before migration
+        assert keys.worker_ready_for_deployment.get('worker1') == b'ready'
+        assert keys.worker_ready_for_deployment.exists('worker1')
+        assert domains_config.get_worker_ids_ready_for_deployment() == ['worker1']
+        assert keys.worker_deployment_error_attempt.increment('worker1') == 2
+        keys.worker_health.set('worker1', 'unhealthy')
+        keys.worker_last_deployment_flow_time.set('worker1')
+        assert keys.worker_health.get_many(['worker1', 'worker2']) == [b'unhealthy', None]
+        assert domains_config.get_worker_hash('worker1').keys() == {'opstatus:deployment_error_attempt', 'health', 'last_deployment_flow:time'}
+        assert dict(domains_config.migrate_worker_hashes())['worker_ready_for_deployment'] == 1
+        assert domains_config.get_worker_hash('worker1') == {
+            'opstatus:ready_for_deployment': b'ready',
+            'opstatus:deployment_error_attempt': b'2',
+            'health': b'unhealthy',
+            'last_deployment_flow:time': keys.worker_last_deployment_flow_time._format_value(keys.worker_last_deployment_flow_time.get('worker1')).encode()
+        }
+        assert {key for key in domains_config._get_all_redis_pools_keys() if not key.startswith('__index__:')} == {'worker:worker1'}
+        assert keys.worker_ready_for_deployment.get('worker1') == b'ready'
+        assert keys.worker_deployment_error_attempt.get('worker1') == 2
+        assert domains_config.get_worker_ids_ready_for_deployment() == ['worker1']
+        assert {
+            key_summary['title']: key_summary['keys'] for key_summary in domains_config.get_keys_summary(worker_id='worker1') if key_summary
+        }['worker_health'] == ['worker:health:worker1 = unhealthy']
+        domains_config.del_worker_keys('worker1')
+        assert domains_config._get_all_redis_pools_keys() == set()
+        assert domains_config.get_worker_ids_ready_for_deployment() == []
+    finally:
+        config.DOMAINS_CONFIG_WORKER_HASH_ENABLED = False
+
+
+def test_worker_request_hostnames(domains_config):
+    config.DOMAINS_CONFIG_WORKER_REQUEST_HOSTNAMES_ENABLED = True
+    try:
+        worker_id, hostname, _ = domains_config._set_mock_volume_config()
+        request_hostname = 'www.{}'.format(hostname)
+        domains_config.keys.hostname_initialize.set(request_hostname, '')
+        domains_config.keys.hostname_initialize.set('www.example007.com', '')
+        assert list(domains_config.iterate_worker_hostnames(worker_id)) == [hostname]
+        # the request hostname is added to the worker request hostnames when it's initialized
+        VolumeConfig(get_volume_config_dict(worker_id=worker_id, hostname=hostname), domains_config, request_hostname=request_hostname)
+        assert domains_config.keys.worker_request_hostnames.get(worker_id) == {request_hostname}
+        assert list(domains_config.iterate_worker_hostnames(worker_id)) == [hostname, request_hostname]
+        domains_config.set_worker_available(worker_id, 'internal-hostname')
+        assert domains_config.keys.hostname_available.exists_many([hostname, request_hostname]) == [True, True]
+        assert list(domains_config.iterate_worker_hostnames(worker_id)) == [hostname, request_hostname]
+        # hostnames which don't have keys are not yielded
+        domains_config.del_worker_hostname_keys(request_hostname)
+        assert list(domains_config.iterate_worker_hostnames(worker_id)) == [hostname]
+        domains_config.del_worker_keys(worker_id)
+        assert domains_config.keys.worker_request_hostnames.get(worker_id) == set()
+        # backfill from existing hostname keys
+        domains_config.keys.hostname_error.set(request_hostname, 'error')
+        domains_config.keys.volume_config_hostname_worker_id.set(request_hostname, worker_id)
+        assert domains_config.backfill_worker_request_hostnames() == 1
+        assert domains_config.keys.worker_request_hostnames.get(worker_id) == {request_hostname}
+    finally:
+        config.DOMAINS_CONFIG_WORKER_REQUEST_HOSTNAMES_ENABLED = False
+
+
+def test_volume_config_cache(domains_config):
+
+    def get_cache_requests(status):
+        return REGISTRY.get_sample_value('volume_config_cache_requests_total', {'status': status}) or 0
+
+    config.VOLUME_CONFIG_CACHE_MAX_SIZE, config.VOLUME_CONFIG_CACHE_INVALIDATION = 2, 'version'
+    domains_config.volume_config_cache = VolumeConfigCache(domains_config)
+    try:
+        hits, misses = get_cache_requests('hit'), get_cache_requests('miss')
+        domains_config._set_mock_volume_config('worker1', 'example001.com')
+        volume_config = domains_config.get_cwm_api_volume_config(worker_id='worker1')
+        assert volume_config.hostnames == ['example001.com']
+        assert domains_config.get_cwm_api_volume_config(worker_id='worker1') is volume_config
+        assert (get_cache_requests('hit') - hits, get_cache_requests('miss') - misses) == (1, 1)
+        # modification of the volume config invalidates the cache
+        domains_config._set_mock_volume_config('worker1', 'example002.com')
+        assert domains_config.get_cwm_api_volume_config(worker_id='worker1').hostnames == ['example002.com']
+        # least recently used entries are removed
+        domains_config._set_mock_volume_config('worker2', 'example003.com')
+        domains_config._set_mock_volume_config('worker3', 'example004.com')
+        for worker_id in ['worker1', 'worker2', 'worker3']:
+            domains_config.get_cwm_api_volume_config(worker_id=worker_id)
+        assert list(domains_config.volume_config_cache.entries.keys()) == [('worker2', None), ('worker3', None)]
+    finally:
+        config.VOLUME_CONFIG_CACHE_MAX_SIZE, config.VOLUME_CONFIG_CACHE_INVALIDATION = 0, 'keyspace'
+        domains_config.volume_config_cache = None
+
+
+def test_volume_config_cache_keyspace_notifications(domains_config):
+    config.VOLUME_CONFIG_CACHE_MAX_SIZE = 10
+    domains_config.volume_config_cache = VolumeConfigCache(domains_config)
+    try:
+        domains_config._set_mock_volume_config('worker1', 'example001.com')
+        volume_config = domains_config.get_cwm_api_volume_config(worker_id='worker1')
+        assert domains_config.get_cwm_api_volume_config(worker_id='worker1') is volume_config
+        domains_config._set_mock_volume_config('worker1', 'example002.com')
+        start_time = time.time()
+        while ('worker1', None) in domains_config.volume_config_cache.entries:
+            assert time.time() - start_time < 5, 'cache was not invalidated'
+            time.sleep(0.01)
+        assert domains_config.get_cwm_api_volume_config(worker_id='worker1').hostnames == ['example002.com']
+    finally:
+        config.VOLUME_CONFIG_CACHE_MAX_SIZE = 0
+        for thread in domains_config.volume_config_cache.notifications_threads or []:
+            thread.stop()
+        domains_config.volume_config_cache = None
+
+
+
+def test_volume_config_cache_own_writes(domains_config):
+    dc = domains_config
+    config.VOLUME_CONFIG_CACHE_MAX_SIZE = 10
+    dc.volume_config_cache = VolumeConfigCache(dc)
+    try:
+        dc._set_mock_volume_config('worker1', 'example001.com')
+        volume_config = dc.get_cwm_api_volume_config(worker_id='worker1')
+        assert dc.get_cwm_api_volume_config(worker_id='worker1') is volume_config
+        # a forced update is visible on the next read, without waiting for the keyspace notification
+        dc._cwm_api_volume_configs['id:worker1'] = get_volume_config_dict(worker_id='worker1', hostname='example002.com')
+        assert dc.get_cwm_api_volume_config(worker_id='worker1', force_update=True).hostnames == ['example002.com']
+        assert dc.get_cwm_api_volume_config(worker_id='worker1').hostnames == ['example002.com']
+        assert dc.get_cwm_api_volume_config(worker_id='worker1').hostnames == ['example002.com']
+        assert ('worker1', None) in dc.volume_config_cache.entries
+        # deleting the volume config keys invalidates the entries when the pipeline is executed
+        dc.keys.volume_config_hostname_worker_id.set('example002.com', 'worker1')
+        dc.get_cwm_api_volume_config(hostname='example002.com')
+        assert ('worker1', 'example002.com') in dc.volume_config_cache.entries
+        with dc.pipeline() as pipeline:
+            dc.del_worker_hostname_keys('example002.com', pipeline=pipeline)
+            assert ('worker1', 'example002.com') in dc.volume_config_cache.entries
+        assert ('worker1', 'example002.com') not in dc.volume_config_cache.entries
+        assert ('worker1', None) in dc.volume_config_cache.entries
+        dc.del_worker_keys('worker1', hostnames=[])
+        assert dc.volume_config_cache.entries == {}
+    finally:
+        config.VOLUME_CONFIG_CACHE_MAX_SIZE = 0
+        for thread in dc.volume_config_cache.notifications_threads or []:
+            thread.stop()
+        dc.volume_config_cache = None
+
 def test_redis_pools(domains_config):
     dc = domains_config
     with dc.get_internal_redis() as internal_redis:
@@ -589,3 +972,350 @@ def test_iterate_ingress_hostname_worker_ids(domains_config):
         ('www.valid2.com', 'valid2'),
         ('www.valid1-2.com', 'valid1')
     }
+
+
+def test_volume_config_codec(domains_config):
+    volume_config_dict = get_volume_config_dict(worker_id='worker1', hostname='example001.com', with_ssl={'certificate_key': CERTIFICATE_KEY, 'certificate_pem': CERTIFICATE_PEM})
+    # legacy json values are decoded regardless of the configured codec
+    for value in [None, b'', b'{}', '{"a": 1}', json.dumps(volume_config_dict).encode()]:
+        assert value_codec.decode(value) == (json.loads(value) if value else None)
+    config.DOMAINS_CONFIG_JSON_CODEC = 'compact'
+    try:
+        small_value = value_codec.encode({'a': 1})
+        assert small_value == b'\x01{"a":1}' and value_codec.decode(small_value) == {'a': 1}
+        large_value = value_codec.encode(volume_config_dict)
+        assert large_value[0] == value_codec.ZlibCompactJsonCodec.version
+        assert len(large_value) < len(json.dumps(volume_config_dict)) * 0.8
+        assert value_codec.decode(large_value) == volume_config_dict
+        assert value_codec.to_text(large_value) == json.dumps(volume_config_dict)
+        # volume configs written by the operator are encoded, and read back transparently
+        domains_config.keys.volume_config.set_json('worker1', volume_config_dict)
+        assert domains_config.keys.volume_config.get('worker1') == large_value
+        volume_config = domains_config.get_cwm_api_volume_config(worker_id='worker1')
+        assert volume_config.hostnames == ['example001.com']
+        assert volume_config.hostname_certs['example001.com']['privkey'] == '\n'.join(CERTIFICATE_KEY)
+        # legacy json values which already exist are still readable
+        set_volume_config_key(domains_config, worker_id='worker2', hostname='example002.com')
+        assert domains_config.get_cwm_api_volume_config(worker_id='worker2').hostnames == ['example002.com']
+        key_summary = domains_config.get_key_summary_single('volume_config', domains_config.keys.volume_config, 'worker1', 10, is_api=True)
+        assert json.loads(key_summary['keys'][0]['worker:volume:config:worker1'])['instanceId'] == 'worker1'
+    finally:
+        config.DOMAINS_CONFIG_JSON_CODEC = 'json'
+
+
+def test_redis_cluster_key_names(domains_config):
+    keys = domains_config.keys
+    config.REDIS_CLUSTER_ENABLED = True
+    try:
+        assert keys.volume_config._('worker1') == 'worker:volume:config:{worker1}'
+        assert keys.worker_health._hash('worker1') == 'worker:{worker1}'
+        assert keys.hostname_available._('example001.com') == 'hostname:available:{example001.com}'
+        assert keys.hostname_ingress_hostname._('example001.com') == 'hostname:ingress:hostname:{example001.com}'
+        assert keys.node_healthy._('node1') == 'node:healthy:node1'
+        assert keys.deployment_last_action._('cwm-worker-worker1') == 'deploymentid:last_action:cwm-worker-worker1'
+        assert keys.worker_ready_for_deployment_queue.processing_key() == '{queue:worker:ready_for_deployment}:processing'
+        for key, param in [(keys.volume_config, 'worker1'), (keys.hostname_ingress_hostname, 'example001.com'), (keys.node_healthy, 'node1')]:
+            assert key.get_param(key._(param)) == param
+        # operations are grouped by slot, keys of a worker are in the same slot
+        key_ops = DomainsConfigKeyOps()
+        keys.worker_health._queue_set(key_ops, 'worker1', 'healthy')
+        keys.hostname_error_attempt_number._queue_set(key_ops, 'example001.com', '1')
+        key_ops.hset(keys.worker_health._hash('worker1'), 'force_delete', '')
+        keys.worker_force_update._queue_delete(key_ops, 'worker1')
+        assert list(key_ops.iterate_slots_key_ops(lambda key: key_slot(key.encode()))) == [
+            (['worker:health:{worker1}', 'worker:{worker1}', 'worker:force_update:{worker1}'], ['set', 'healthy', 'hset', 'force_delete', '', 'del']),
+            (['hostname:error_attempt_number:{example001.com}'], ['set', '1']),
+        ]
+    finally:
+        config.REDIS_CLUSTER_ENABLED = False
+    assert keys.volume_config._('worker1') == 'worker:volume:config:worker1'
+
+
+def test_redis_metrics(domains_config):
+
+    def get_sample_value(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    config.REDIS_METRICS_ENABLED = True
+    try:
+        dc = DomainsConfig()
+    finally:
+        config.REDIS_METRICS_ENABLED = False
+    commands = get_sample_value('redis_commands_total', pool='ingress', key='hostname_error', command='SET')
+    latency_count = get_sample_value('redis_command_latency_count', pool='ingress', key='hostname_error')
+    checkouts = get_sample_value('redis_pool_checkout_latency_count', pool='ingress')
+    dc.keys.hostname_error.set('example001.com', 'error')
+    assert dc.keys.hostname_error.get('example001.com') == b'error'
+    assert get_sample_value('redis_commands_total', pool='ingress', key='hostname_error', command='SET') - commands == 1
+    assert get_sample_value('redis_command_latency_count', pool='ingress', key='hostname_error') - latency_count == 2
+    assert get_sample_value('redis_pool_checkout_latency_count', pool='ingress') - checkouts == 2
+    pipelines = get_sample_value('redis_commands_total', pool='internal', key='worker_health', command='PIPELINE')
+    dc.keys.worker_health.exists_many(['worker1', 'worker2'])
+    assert get_sample_value('redis_commands_total', pool='internal', key='worker_health', command='PIPELINE') - pipelines == 1
+    others = get_sample_value('redis_commands_total', pool='metrics', key='other', command='GET')
+    with dc.get_metrics_redis() as r:
+        r.get('foo')
+    assert get_sample_value('redis_commands_total', pool='metrics', key='other', command='GET') - others == 1
+
+
+def test_async_domains_config(domains_config):
+    async_domains_config = AsyncDomainsConfig(domains_config, concurrency=4)
+
+    async def run():
+        await async_domains_config.keys.worker_last_throttle_check.set('worker1', {'t': 1})
+        await async_domains_config.map(lambda worker_id: domains_config.set_worker_force_update(worker_id), ['worker2', 'worker3'])
+        return (
+            await async_domains_config.keys.worker_last_throttle_check.get('worker1'),
+            sorted(await async_domains_config.keys.worker_force_update.iterate_prefix_key_suffixes()),
+            await async_domains_config.get_worker_ids_force_update(),
+        )
+
+    try:
+        last_throttle_check, force_update_worker_ids, worker_ids_force_update = asyncio.run(run())
+    finally:
+        async_domains_config.close()
+    assert last_throttle_check == {'t': 1}
+    assert force_update_worker_ids == ['worker2', 'worker3']
+    assert sorted(worker_ids_force_update) == ['worker2', 'worker3']
+    assert async_domains_config.WORKER_ERROR_THROTTLED == domains_config.WORKER_ERROR_THROTTLED
+
+
+def test_keys_summary_multi_domain(domains_config):
+    dc = domains_config
+    dc.keys.volume_config.set('worker1', '{}')
+    dc.keys.volume_config.set('worker2', '{}')
+    dc.keys.volume_config_hostname_worker_id.set('example002.com', 'worker1')
+    dc.keys.hostname_ingress_hostname.set('example002.com', '{}')
+    dc.keys.hostname_initialize.set('example002.com', '')
+    dc.keys.updater_last_cwm_api_update.set('20201103T221112')
+    dc.keys.deployment_last_action.set('cwm-worker-worker1', '20201103T221112')
+    dc.keys.worker_health.set('worker1', 'healthy')
+    summaries = {summary['title']: summary for summary in dc.get_keys_summary(max_keys_per_summary=1)}
+    assert list(summaries) == sorted(summaries)
+    # keys of volume_config_hostname_worker_id are not counted for volume_config, although they match its prefix
+    assert summaries['volume_config']['total'] == 2 and len(summaries['volume_config']['keys']) == 1
+    assert summaries['volume_config_hostname_worker_id'] == {'title': 'volume_config_hostname_worker_id', 'keys': ['worker:volume:config:hostname_worker_id:example002.com'], 'total': 1, 'pool': 'internal'}
+    assert summaries['hostname_ingress_hostname']['keys'] == ['hostname:ingress:hostname:example002.com']
+    assert summaries['hostname_initialize']['keys'] == ['hostname:initialize:example002.com']
+    assert summaries['updater_last_cwm_api_update']['keys'] == ['updater_last_cwm_api_update']
+    assert summaries['deployment_last_action']['keys'] == ['deploymentid:last_action:cwm-worker-worker1']
+    assert summaries['worker_health']['keys'] == ['worker:health:worker1']
+    assert summaries['hostname_error']['total'] == 0
+    original_ttl_seconds = config.KEYS_SUMMARY_CACHE_TTL_SECONDS
+    try:
+        config.KEYS_SUMMARY_CACHE_TTL_SECONDS = 60
+        dc.keys_summary_cache = KeysSummaryCache(dc)
+        assert {summary['title']: summary['total'] for summary in dc.get_keys_summary()}['hostname_error'] == 0
+        dc.keys.hostname_error.set('example002.com', 'error')
+        assert {summary['title']: summary['total'] for summary in dc.get_keys_summary()}['hostname_error'] == 0
+        dc.keys_summary_cache.entries[10] = (dc.keys_summary_cache.entries[10][0], time.monotonic() - 61)
+        # expired summary is returned while it's refreshed in the background
+        assert {summary['title']: summary['total'] for summary in dc.get_keys_summary()}['hostname_error'] == 0
+        for _ in range(50):
+            if not dc.keys_summary_cache.refreshing:
+                break
+            time.sleep(0.1)
+        assert {summary['title']: summary['total'] for summary in dc.get_keys_summary()}['hostname_error'] == 1
+    finally:
+        config.KEYS_SUMMARY_CACHE_TTL_SECONDS = original_ttl_seconds
+        dc.keys_summary_cache = None
+
+
+def test_keys_memory_report(domains_config):
+    dc = domains_config
+    for i in range(5):
+        dc.keys.hostname_error.set('example{}.com'.format(i), dc.WORKER_ERROR_INVALID_HOSTNAME)
+    dc.keys.volume_config.set('worker1', get_volume_config_json(worker_id='worker1', hostname='example1.com'))
+    with dc.get_internal_redis() as r:
+        r.set('foo:bar:baz', 'x', ex=60)
+    report = {(group['pool'], group['title']): group for group in dc.get_keys_memory_report(sample_rate=0)}
+    hostname_error = report[('ingress', 'hostname_error')]
+    assert hostname_error['known'] and hostname_error['total'] == 5 and hostname_error['sampled'] == 5
+    assert 0 < hostname_error['p50_bytes'] <= hostname_error['p99_bytes'] and hostname_error['ttl_ratio'] == 0
+    assert hostname_error['total_bytes'] >= hostname_error['p50_bytes'] * 4
+    assert report[('internal', 'volume_config')]['total'] == 1
+    unknown = report[('internal', 'foo:*')]
+    assert not unknown['known'] and unknown['total'] == 1 and unknown['ttl_ratio'] == 1
+    assert list(report.values()) == sorted(report.values(), key=lambda group: group['total_bytes'], reverse=True)
+
+
+def test_read_replica(domains_config):
+    original_host, original_port = config.INTERNAL_REDIS_READ_REPLICA_HOST, config.INTERNAL_REDIS_READ_REPLICA_PORT
+    # the test redis is used as the replica of itself, it's a primary so the replica is never in sync
+    config.INTERNAL_REDIS_READ_REPLICA_HOST, config.INTERNAL_REDIS_READ_REPLICA_PORT = config.INTERNAL_REDIS_HOST, config.INTERNAL_REDIS_PORT
+    try:
+        dc = MockDomainsConfig()
+    finally:
+        config.INTERNAL_REDIS_READ_REPLICA_HOST, config.INTERNAL_REDIS_READ_REPLICA_PORT = original_host, original_port
+    assert set(dc.read_replicas) == {'internal'}
+    read_replica = dc.read_replicas['internal']
+    dc.keys.worker_ready_for_deployment.set('worker1', '')
+    with dc.get_read_redis('internal') as r:
+        assert r.connection_pool is dc.internal_redis_pool
+    with dc.get_read_redis('ingress') as r:
+        assert r.connection_pool is dc.ingress_redis_pool
+    assert dc.get_worker_ids_ready_for_deployment() == ['worker1']
+    # in sync replica is used for reads, writes use the primary
+    read_replica.check_in_sync = lambda: True
+    read_replica.last_check_time = None
+    with dc.get_read_redis('internal') as r:
+        assert r.connection_pool is read_replica.redis_pool
+    with dc.keys.worker_ready_for_deployment.get_redis() as r:
+        assert r.connection_pool is dc.internal_redis_pool
+    assert dc.get_worker_ids_ready_for_deployment() == ['worker1']
+    # replication state is not checked again until the check interval passed
+    read_replica.check_in_sync = lambda: False
+    with dc.get_read_redis('internal') as r:
+        assert r.connection_pool is read_replica.redis_pool
+    read_replica.last_check_time -= config.REDIS_READ_REPLICA_CHECK_INTERVAL_SECONDS
+    with dc.get_read_redis('internal') as r:
+        assert r.connection_pool is dc.internal_redis_pool
+
+
+def test_flow_counters(domains_config):
+    dc = domains_config
+    original_flow_counters_enabled = config.DOMAINS_CONFIG_FLOW_COUNTERS_ENABLED
+    try:
+        config.DOMAINS_CONFIG_FLOW_COUNTERS_ENABLED = True
+        assert set(dc.get_flow_counters().values()) == {0}
+        dc.keys.hostname_initialize.set('example1.com', '')
+        dc.keys.hostname_initialize.set('example1.com', '')
+        dc.keys.hostname_initialize.set('example2.com', '')
+        dc.set_worker_error_by_hostname('example3.com', dc.WORKER_ERROR_INVALID_HOSTNAME)
+        dc.set_worker_ready_for_deployment('worker1')
+        dc.set_worker_ready_for_deployment('worker2')
+        dc.set_worker_force_delete('worker1')
+        dc.keys.worker_throttled_expiry.set('worker3', common.now())
+        assert dc.get_flow_counters() == {
+            'hostname_error': 1, 'hostname_initialize': 2, 'worker_force_delete': 1, 'worker_ready_for_deployment': 2,
+            'worker_throttled_expiry': 1, 'worker_waiting_for_deployment_complete': 0,
+        }
+        dc.keys.worker_ready_for_deployment.delete('worker1')
+        dc.keys.worker_ready_for_deployment.delete('worker1')
+        dc.set_worker_waiting_for_deployment('worker1')
+        dc.del_worker_keys('worker1', hostnames=[])
+        dc.del_worker_hostname_keys('example3.com')
+        assert dc.get_flow_counters() == {
+            'hostname_error': 0, 'hostname_initialize': 2, 'worker_force_delete': 0, 'worker_ready_for_deployment': 1,
+            'worker_throttled_expiry': 1, 'worker_waiting_for_deployment_complete': 0,
+        }
+        with dc.get_internal_redis() as r:
+            assert not r.exists(dc.keys.worker_force_delete._count())
+        # keys which are modified without the operator are corrected by the reconciliation
+        with dc.get_ingress_redis() as r:
+            r.set(dc.keys.hostname_initialize._('example4.com'), '')
+            r.delete(dc.keys.hostname_initialize._('example1.com'), dc.keys.hostname_initialize._('example2.com'))
+        dc.keys.hostname_initialize.delete('example4.com')
+        assert dc.get_flow_counters()['hostname_initialize'] == 1
+        assert dc.reconcile_flow_counters() == {'hostname_initialize': 1}
+        assert dc.reconcile_flow_counters() == {}
+        # counter changes while the keys are counted are not overwritten
+        key = dc.keys.hostname_initialize
+
+        def iterate_prefix_key_suffixes(iterate_prefix_key_suffixes=key.iterate_prefix_key_suffixes):
+            with dc.get_ingress_redis() as r:
+                r.incr(key._count())
+            yield from iterate_prefix_key_suffixes()
+
+        key.iterate_prefix_key_suffixes = iterate_prefix_key_suffixes
+        try:
+            assert dc.reconcile_flow_counters() == {}
+        finally:
+            del key.iterate_prefix_key_suffixes
+        assert dc.get_flow_counters()['hostname_initialize'] == 1
+        assert dc.reconcile_flow_counters() == {'hostname_initialize': 1}
+        assert dc.get_flow_counters()['hostname_initialize'] == 0
+        samples = {sample.labels['key']: sample.value for family in metrics.FlowCountersCollector(dc).collect() for sample in family.samples}
+        assert samples['worker_ready_for_deployment'] == 1 and samples['hostname_initialize'] == 0
+    finally:
+        config.DOMAINS_CONFIG_FLOW_COUNTERS_ENABLED = original_flow_counters_enabled
+
+
+def test_hostname_events(domains_config):
+    dc = domains_config
+    worker_id, hostname, _ = dc._set_mock_volume_config()
+    events, subscribed_event, stop_event = [], threading.Event(), threading.Event()
+    thread = threading.Thread(target=hostname_events.subscribe, args=(dc, events.append),
+                              kwargs=dict(stop_event=stop_event, on_subscribed=subscribed_event.set, timeout_seconds=0.01), daemon=True)
+    thread.start()
+    original_hostname_events_enabled = config.DOMAINS_CONFIG_HOSTNAME_EVENTS_ENABLED
+    try:
+        assert subscribed_event.wait(5)
+        # events are not published unless enabled
+        config.DOMAINS_CONFIG_HOSTNAME_EVENTS_ENABLED = False
+        dc.set_worker_available(worker_id, {'http': 'ingress-http.hostname'})
+        config.DOMAINS_CONFIG_HOSTNAME_EVENTS_ENABLED = True
+        start_time_ms = int(time.time() * 1000)
+        dc.set_worker_available(worker_id, {'http': 'ingress-http.hostname'})
+        dc.set_worker_error(worker_id, dc.WORKER_ERROR_FAILED_TO_DEPLOY)
+        dc.del_worker_hostname_keys(hostname)
+        # partial deletion of the hostname keys doesn't publish an event
+        dc.del_worker_hostname_keys(hostname, with_error=False)
+        for _ in range(500):
+            if len(events) >= 3:
+                break
+            time.sleep(0.01)
+        assert [(event['h'], event['e'], event.get('d')) for event in events] == [
+            (hostname, hostname_events.EVENT_AVAILABLE, {'http': 'ingress-http.hostname'}),
+            (hostname, hostname_events.EVENT_ERROR, dc.WORKER_ERROR_FAILED_TO_DEPLOY),
+            (hostname, hostname_events.EVENT_DELETED, None),
+        ]
+        assert all(event['t'] >= start_time_ms for event in events)
+    finally:
+        config.DOMAINS_CONFIG_HOSTNAME_EVENTS_ENABLED = original_hostname_events_enabled
+        stop_event.set()
+        thread.join()
+
+
+def test_search_index(domains_config):
+    dc = domains_config
+    dc._cwm_api_volume_configs['id:Worker1'] = {
+        'instanceId': 'Worker1', 'zone': config.CWM_ZONE, 'minio_extra_configs': {'hostnames': [{'hostname': 'Example1.com'}, {'hostname': 'example2.com'}]}
+    }
+    dc._cwm_api_volume_configs['hostname:www.example1.com'] = dc._cwm_api_volume_configs['id:Worker1']
+    original_search_index_enabled = config.DOMAINS_CONFIG_SEARCH_INDEX_ENABLED
+    try:
+        config.DOMAINS_CONFIG_SEARCH_INDEX_ENABLED = True
+        dc.get_cwm_api_volume_config(worker_id='Worker1', force_update=True)
+        dc.get_cwm_api_volume_config(hostname='www.example1.com', force_update=True)
+        namespace_name = get_namespace_name_from_worker_id('Worker1')
+        assert dc.keys.search_index.count() == 5
+        assert dc.keys.search_index.search('EXAMPLE', 10) == [('hostname', 'Example1.com'), ('hostname', 'example2.com')]
+        assert dc.keys.search_index.search('example1.com', 10) == [('hostname', 'Example1.com')]
+        assert dc.keys.search_index.search('worker', 10) == [('worker', 'Worker1')]
+        assert dc.keys.search_index.search('cwm-worker', 10) == [('namespace', namespace_name)]
+        assert dc.keys.search_index.search('www', 10) == [('hostname', 'www.example1.com')]
+        assert dc.keys.search_index.search('', 2) == [('namespace', namespace_name), ('hostname', 'Example1.com')]
+        assert dc.keys.search_index.search('foo', 10) == []
+        # worker keys deletion without the volume config keeps the worker in the index
+        dc.set_worker_error('Worker1', dc.WORKER_ERROR_FAILED_TO_DEPLOY)
+        assert dc.keys.search_index.count() == 5
+        # hostnames which were removed from the volume config are removed from the index
+        dc._cwm_api_volume_configs['id:Worker1'] = {
+            'instanceId': 'Worker1', 'zone': config.CWM_ZONE, 'minio_extra_configs': {'hostnames': [{'hostname': 'Example1.com'}, {'hostname': 'example3.com'}]}
+        }
+        dc.get_cwm_api_volume_config(worker_id='Worker1', force_update=True)
+        assert dc.keys.search_index.search('EXAMPLE', 10) == [('hostname', 'Example1.com'), ('hostname', 'example3.com')]
+        assert dc.keys.search_index.count() == 5
+        # the hostnames are taken from the volume config and the request hostnames, not only from the hostnames param
+        dc.keys.worker_request_hostnames.add_many('Worker1', ['www.example1.com'])
+        dc.del_worker_keys('Worker1', hostnames=[])
+        assert dc.keys.search_index.count() == 0
+        # invalid worker ids are indexed without a namespace
+        dc._cwm_api_volume_configs['id:bad_id'] = {
+            'instanceId': 'bad_id', 'zone': config.CWM_ZONE, 'minio_extra_configs': {'hostnames': [{'hostname': 'bad.example.com'}]}
+        }
+        assert dc.get_cwm_api_volume_config(worker_id='bad_id', force_update=True).id == 'bad_id'
+        assert dc.keys.search_index.search('', 10) == [('hostname', 'bad.example.com'), ('worker', 'bad_id')]
+        dc.del_worker_keys('bad_id', hostnames=[])
+        assert dc.keys.search_index.count() == 0
+        dc._cwm_api_volume_configs['id:Worker1'] = {
+            'instanceId': 'Worker1', 'zone': config.CWM_ZONE, 'minio_extra_configs': {'hostnames': [{'hostname': 'Example1.com'}, {'hostname': 'example2.com'}]}
+        }
+        # backfill from existing keys
+        dc.keys.volume_config.set_json('Worker1', dc._cwm_api_volume_configs['id:Worker1'])
+        dc.keys.volume_config_hostname_worker_id.set('www.example1.com', 'Worker1')
+        assert dc.backfill_search_index() == 5
+        assert dc.keys.search_index.search('w', 10) == [('worker', 'Worker1'), ('hostname', 'www.example1.com')]
+    finally:
+        config.DOMAINS_CONFIG_SEARCH_INDEX_ENABLED = original_search_index_enabled
@@ -1,5 +1,6 @@
 import json
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 from cwm_worker_operator import initializer
 from cwm_worker_operator import config
@@ -50,6 +51,43 @@ def test_initialize_invalid_volume_config(domains_config, initializer_metrics):
     assert [','.join(o['labels']) for o in initializer_metrics.observations] == expected_metrics_observations
 
 
+def test_initialize_denied_hostname(domains_config, initializer_metrics):
+    hostname = 'example007.com'
+    original_deny_enabled = config.HOSTNAME_DENY_ENABLED
+    config.HOSTNAME_DENY_ENABLED = True
+    try:
+        domains_config.keys.hostname_initialize.set(hostname, '')
+        for i in range(config.WORKER_ERROR_MAX_ATTEMPTS):
+            initializer.run_single_iteration(domains_config, initializer_metrics)
+        assert domains_config.keys.hostname_error.get(hostname).decode() == 'FAILED_TO_GET_VOLUME_CONFIG'
+        assert domains_config.is_hostname_denied(hostname)
+        assert domains_config.keys.hostname_deny_count.get(hostname) == 1
+        with domains_config.keys.hostname_deny.get_redis() as r:
+            assert 0 < r.ttl(domains_config.keys.hostname_deny._(hostname)) <= config.HOSTNAME_DENY_MIN_SECONDS
+        # hostname error was cleaned and ingress requested the hostname again
+        domains_config.del_worker_hostname_keys(hostname)
+        domains_config.keys.hostname_initialize.set(hostname, '')
+        initializer_metrics.observations = []
+        initializer.run_single_iteration(domains_config, initializer_metrics)
+        # cwm api was not called
+        assert [','.join(o['labels']) for o in initializer_metrics.observations] == [',hostname_denied']
+        assert domains_config.keys.hostname_error.get(hostname).decode() == 'FAILED_TO_GET_VOLUME_CONFIG'
+        assert not domains_config.keys.hostname_initialize.exists(hostname)
+        assert domains_config.keys.hostname_last_deployment_flow_action.get(hostname).decode() == deployment_flow_manager.INITIALIZER_HOSTNAME_DENIED
+        # deny duration doubles on each deny
+        assert domains_config.deny_hostname(hostname) == config.HOSTNAME_DENY_MIN_SECONDS * 2
+        assert domains_config.deny_hostname(hostname) == config.HOSTNAME_DENY_MIN_SECONDS * 4
+        assert domains_config.keys.hostname_deny_count.get(hostname) == 3
+        with domains_config.keys.hostname_deny_count.get_redis() as r:
+            assert config.HOSTNAME_DENY_DECAY_SECONDS < r.ttl(domains_config.keys.hostname_deny_count._(hostname)) <= config.HOSTNAME_DENY_MIN_SECONDS * 4 + config.HOSTNAME_DENY_DECAY_SECONDS
+        # concurrent denies are all counted
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(domains_config.deny_hostname, [hostname] * 8))
+        assert domains_config.keys.hostname_deny_count.get(hostname) == 11
+    finally:
+        config.HOSTNAME_DENY_ENABLED = original_deny_enabled
+
+
 def test_initialize_invalid_volume_zone(domains_config, initializer_metrics):
     worker_id, hostname = 'worker1', 'invalid-zone.com'
     domains_config.keys.hostname_initialize.set(hostname, '')
@@ -294,3 +332,95 @@ def test_initialize_invalid_hostname(domains_config, initializer_metrics):
     # success observation is for success getting volume config from api
     # invalid_volume_zone is from initializer
     assert [','.join(o['labels']) for o in initializer_metrics.observations] == [',success', ',invalid_hostname']
+
+
+def test_keyspace_notifications_wakeup(domains_config):
+    wakeup_keys = [domains_config.keys.hostname_initialize, domains_config.keys.worker_force_update]
+    with domains_config.keyspace_notifications_event(wakeup_keys, sleep_time_seconds=0.01) as wakeup_event:
+        assert not wakeup_event.wait(0.2)
+        domains_config.keys.hostname_initialize.set('example007.com', '')
+        assert wakeup_event.wait(5)
+        wakeup_event.clear()
+        domains_config.keys.hostname_initialize.delete('example007.com')
+        assert not wakeup_event.wait(0.2)
+        domains_config.keys.worker_force_update.set('worker1', '')
+        assert wakeup_event.wait(5)
+        wakeup_event.clear()
+        domains_config.keys.worker_ready_for_deployment.set('worker1', '')
+        assert not wakeup_event.wait(0.2)
+
+
+def test_flow_snapshot(domains_config, initializer_metrics):
+    domains_config.keys.worker_ready_for_deployment.set('worker1', '')
+    domains_config.keys.worker_waiting_for_deployment_complete.set('worker2', '')
+    domains_config.keys.worker_force_update.set('worker3', '')
+    domains_config.keys.worker_force_delete.set('worker4', 'allow_cancel')
+    hostnames = ['Www.Example.com', *['host{}.domain'.format(i) for i in range(5)]]
+    for hostname in hostnames:
+        domains_config.keys.hostname_initialize.set(hostname, '')
+    original_scan_count = config.DOMAINS_CONFIG_SCAN_COUNT
+    config.DOMAINS_CONFIG_SCAN_COUNT = 2
+    try:
+        snapshot = deployment_flow_manager.FlowSnapshot(domains_config)
+        assert sorted(snapshot.get_suffixes('hostname_initialize')) == sorted(hostnames)
+    finally:
+        config.DOMAINS_CONFIG_SCAN_COUNT = original_scan_count
+    assert snapshot.get_suffixes('worker_force_update') == ['worker3']
+    assert snapshot.exists('worker_ready_for_deployment', 'worker1')
+    assert not snapshot.exists('worker_ready_for_deployment', 'worker2')
+    assert snapshot.exists('worker_waiting_for_deployment_complete', 'worker2')
+    assert snapshot.exists('worker_force_delete', 'worker4')
+    assert snapshot.is_hostname_initialize_match(['example.com'])
+    assert snapshot.is_hostname_initialize_match(['other.domain', 'www.example.com'])
+    assert not snapshot.is_hostname_initialize_match(['example', 'com'])
+    # changes are not visible until the keys are invalidated
+    domains_config.keys.worker_ready_for_deployment.delete('worker1')
+    domains_config.keys.hostname_initialize.delete('Www.Example.com')
+    assert snapshot.exists('worker_ready_for_deployment', 'worker1')
+    assert snapshot.is_hostname_initialize_match(['example.com'])
+    snapshot.invalidate(worker_id='worker1', hostname='Www.Example.com')
+    assert not snapshot.exists('worker_ready_for_deployment', 'worker1')
+    assert not snapshot.is_hostname_initialize_match(['example.com'])
+    # initializer iteration uses the snapshot, worker which was set ready for deployment by the iteration is invalidated
+    for hostname in hostnames[1:]:
+        domains_config.keys.hostname_initialize.delete(hostname)
+    domains_config._cwm_api_volume_configs['id:worker3'] = {
+        'instanceId': 'worker3', 'zone': config.CWM_ZONE, 'minio_extra_configs': {'hostnames': [{'hostname': 'host0.domain'}]}
+    }
+    domains_config._cwm_api_volume_configs['hostname:host0.domain'] = domains_config._cwm_api_volume_configs['id:worker3']
+    domains_config.keys.hostname_initialize.set('host0.domain', '')
+    original_snapshot_enabled = config.DEPLOYMENT_FLOW_SNAPSHOT_ENABLED
+    config.DEPLOYMENT_FLOW_SNAPSHOT_ENABLED = True
+    try:
+        flow_manager = deployment_flow_manager.InitializerDeploymentFlowManager(domains_config, with_snapshot=True)
+        assert flow_manager.get_worker_force_delete('worker3') is None
+        assert flow_manager.get_worker_force_delete('worker4') == {'worker_id': 'worker4', 'allow_cancel': True}
+        initializer.run_single_iteration(domains_config, initializer_metrics)
+    finally:
+        config.DEPLOYMENT_FLOW_SNAPSHOT_ENABLED = original_snapshot_enabled
+    assert domains_config.keys.worker_ready_for_deployment.exists('worker3')
+    # hostname of the forced update worker was skipped
+    assert [','.join(o['labels']) for o in initializer_metrics.observations] == [',success', ',initialized']
+
+
+def test_async_worker_multiple_hostnames(domains_config, initializer_metrics):
+    worker_id = 'worker1'
+    hostnames = ['valid{}.example.com'.format(i) for i in range(4)]
+    volume_config = {'instanceId': worker_id, 'zone': config.CWM_ZONE, 'minio_extra_configs': {'hostnames': [{'hostname': hostname} for hostname in hostnames]}}
+    for hostname in hostnames:
+        domains_config.keys.hostname_initialize.set(hostname, '')
+        domains_config._cwm_api_volume_configs['hostname:{}'.format(hostname)] = volume_config
+    ready_for_deployment_worker_ids = []
+    original_set_worker_ready_for_deployment = domains_config.set_worker_ready_for_deployment
+    original_async_concurrency = config.DAEMONS_ASYNC_CONCURRENCY
+    try:
+        domains_config.set_worker_ready_for_deployment = lambda worker_id: ready_for_deployment_worker_ids.append(worker_id) or original_set_worker_ready_for_deployment(worker_id)
+        config.DAEMONS_ASYNC_CONCURRENCY = 4
+        initializer.run_single_iteration(domains_config, initializer_metrics)
+    finally:
+        domains_config.set_worker_ready_for_deployment = original_set_worker_ready_for_deployment
+        config.DAEMONS_ASYNC_CONCURRENCY = original_async_concurrency
+    # worker is initialized once, like in the sync iteration
+    assert ready_for_deployment_worker_ids == [worker_id]
+    assert [o['labels'][1] for o in initializer_metrics.observations].count('initialized') == 1
+    assert domains_config.keys.worker_ready_for_deployment.exists(worker_id)
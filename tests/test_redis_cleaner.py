@@ -69,3 +69,70 @@ def test_error_any_deletion(domains_config):
     assert domains_config._get_all_redis_pools_values(blank_keys=[
         domains_config.keys.hostname_last_deployment_flow_time._(hostname)
     ]) == {}
+
+
+def test_async(domains_config):
+    hostnames = ['invalid{}.example.com'.format(i) for i in range(20)]
+    for hostname in hostnames:
+        domains_config.keys.hostname_error.set(hostname, domains_config.WORKER_ERROR_INVALID_HOSTNAME)
+        domains_config.keys.hostname_available.set(hostname, '')
+    domains_config.keys.hostname_last_deployment_flow_time.set(hostnames[0])
+    original_async_concurrency = config.DAEMONS_ASYNC_CONCURRENCY
+    try:
+        config.DAEMONS_ASYNC_CONCURRENCY = 4
+        redis_cleaner.run_single_iteration(domains_config)
+    finally:
+        config.DAEMONS_ASYNC_CONCURRENCY = original_async_concurrency
+    # hostnames without a recent deployment flow action are deleted
+    assert domains_config._get_all_redis_pools_values(blank_keys=[
+        domains_config.keys.hostname_last_deployment_flow_time._(hostnames[0])
+    ]) == {
+        domains_config.keys.hostname_error._(hostnames[0]): domains_config.WORKER_ERROR_INVALID_HOSTNAME,
+        domains_config.keys.hostname_last_deployment_flow_time._(hostnames[0]): '',
+        domains_config.keys.hostname_available._(hostnames[0]): ''
+    }
+
+
+def test_keys_ttl(domains_config):
+    hostname = 'www.example.com'
+    throttled_hostname = 'throttled.example.com'
+    failed_to_deploy_hostname = 'failed-to-deploy.example.com'
+    legacy_hostname = 'legacy.example.com'
+    original_keys_ttl_enabled = config.DOMAINS_CONFIG_KEYS_TTL_ENABLED
+    try:
+        config.DOMAINS_CONFIG_KEYS_TTL_ENABLED = False
+        domains_config.keys.hostname_error.set(legacy_hostname, domains_config.WORKER_ERROR_INVALID_HOSTNAME)
+        config.DOMAINS_CONFIG_KEYS_TTL_ENABLED = True
+        domains_config.keys.hostname_error.set(hostname, domains_config.WORKER_ERROR_INVALID_VOLUME_ZONE)
+        domains_config.keys.hostname_error.set(throttled_hostname, domains_config.WORKER_ERROR_THROTTLED)
+        domains_config.set_worker_error_by_hostname(failed_to_deploy_hostname, domains_config.WORKER_ERROR_FAILED_TO_DEPLOY)
+        domains_config.keys.hostname_last_deployment_flow_time.set(hostname, common.now() - datetime.timedelta(seconds=config.REDIS_CLEANER_DELETE_ANY_HOSTNAME_ERROR_MIN_SECONDS + 1))
+        domains_config.keys.hostname_last_deployment_flow_time.set(failed_to_deploy_hostname, common.now() - datetime.timedelta(seconds=config.REDIS_CLEANER_DELETE_FAILED_TO_DEPLOY_HOSTNAME_ERROR_MIN_SECONDS + 1))
+        domains_config.keys.hostname_last_deployment_flow_worker_id.set(failed_to_deploy_hostname, 'worker1')
+        with domains_config.get_ingress_redis() as r:
+            assert 0 < r.ttl(domains_config.keys.hostname_error._(hostname)) <= config.REDIS_CLEANER_DELETE_ANY_HOSTNAME_ERROR_MIN_SECONDS
+            assert r.ttl(domains_config.keys.hostname_error._(throttled_hostname)) == -1
+            assert r.ttl(domains_config.keys.hostname_error._(legacy_hostname)) == -1
+        with domains_config.get_internal_redis() as r:
+            assert r.ttl(domains_config.keys.hostname_last_deployment_flow_time._(hostname)) > 0
+        assert dict(domains_config.apply_keys_ttl())['hostname_error'] == 1
+        with domains_config.get_ingress_redis() as r:
+            assert r.ttl(domains_config.keys.hostname_error._(legacy_hostname)) > 0
+        redis_cleaner.run_single_iteration(domains_config)
+        # other errors are left for redis to expire, failed deployment of unavailable worker is still deleted by the cleaner
+        assert set(domains_config.keys.hostname_error.iterate_prefix_key_suffixes()) == {hostname, throttled_hostname, legacy_hostname}
+    finally:
+        config.DOMAINS_CONFIG_KEYS_TTL_ENABLED = original_keys_ttl_enabled
+
+
+def test_flow_counters(domains_config):
+    original_flow_counters_enabled = config.DOMAINS_CONFIG_FLOW_COUNTERS_ENABLED
+    try:
+        config.DOMAINS_CONFIG_FLOW_COUNTERS_ENABLED = True
+        with domains_config.get_ingress_redis() as r:
+            r.set(domains_config.keys.hostname_initialize._('www.example.com'), '')
+        assert domains_config.get_flow_counters()['hostname_initialize'] == 0
+        redis_cleaner.run_single_iteration(domains_config)
+        assert domains_config.get_flow_counters()['hostname_initialize'] == 1
+    finally:
+        config.DOMAINS_CONFIG_FLOW_COUNTERS_ENABLED = original_flow_counters_enabled
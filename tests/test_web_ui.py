@@ -1,6 +1,10 @@
 import json
 
+import prometheus_client
+
 from cwm_worker_operator import web_ui
+from cwm_worker_operator import config
+from cwm_worker_operator import metrics
 
 
 class MockServer:
@@ -23,12 +27,20 @@ def test_hostname_api(domains_config):
         {'header': True,
          'hostname': '/api/hostname/<HOSTNAME>',
          'index': '/api/',
+         'keys memory': '/api/keys_memory',
          'nodes': '/api/nodes',
          'redis key': '/api/redis_key/<POOL>/<REDIS_KEY>',
+         'search': '/api/search/<PREFIX>',
          'worker': '/api/worker/<WORKER_ID>'},
         {'keys': [{'hostname:available:test.example.com': ''}],
          'title': 'hostname_available',
          'total': 1},
+        {'keys': [{'hostname:deny:test.example.com': None}],
+         'title': 'hostname_deny',
+         'total': 0},
+        {'keys': [{'hostname:deny_count:test.example.com': None}],
+         'title': 'hostname_deny_count',
+         'total': 0},
         {'keys': [{'hostname:error:test.example.com': 'FAILED_TO_DEPLOY'}],
          'title': 'hostname_error',
          'total': 1},
@@ -58,3 +70,31 @@ def test_hostname_api(domains_config):
     ]
     for data in res:
         json.dumps(data).encode()
+
+
+def test_search_api(domains_config):
+    server = MockServer(domains_config)
+    original_search_index_enabled = config.DOMAINS_CONFIG_SEARCH_INDEX_ENABLED
+    try:
+        config.DOMAINS_CONFIG_SEARCH_INDEX_ENABLED = True
+        domains_config.keys.search_index.add_many(domains_config.get_worker_search_index_entries('worker1', ['test.example.com']))
+        res = list(web_ui.get_search(True, server, 'TEST'))
+        assert res[1:] == [{'type': 'hostname', 'value': 'test.example.com', 'url': '/api/hostname/test.example.com'}]
+        res = list(web_ui.get_search(True, server, 'cwm-worker-'))
+        assert res[1:] == [{'type': 'namespace', 'value': 'cwm-worker-worker1', 'url': '/api/worker/worker1'}]
+        res = list(web_ui.get_search(False, server, 'worker'))
+        assert res[2:] == ['worker: <a href="/worker/worker1">worker1</a><br/>']
+    finally:
+        config.DOMAINS_CONFIG_SEARCH_INDEX_ENABLED = original_search_index_enabled
+
+
+def test_keys_memory_metrics_update():
+    registry = prometheus_client.CollectorRegistry()
+    keys_memory_metrics = metrics.KeysMemoryMetrics(registry=registry)
+    group = {'total': 2, 'total_bytes': 200, 'p50_bytes': 100, 'p99_bytes': 100, 'ttl_ratio': 0}
+    keys_memory_metrics.update([{**group, 'pool': 'ingress', 'title': 'hostname_error'}, {**group, 'pool': 'internal', 'title': 'foo:*'}])
+    assert registry.get_sample_value('redis_keys', {'pool': 'internal', 'key': 'foo:*'}) == 2
+    keys_memory_metrics.update([{**group, 'pool': 'ingress', 'title': 'hostname_error', 'total': 3}])
+    assert registry.get_sample_value('redis_keys', {'pool': 'ingress', 'key': 'hostname_error'}) == 3
+    assert registry.get_sample_value('redis_keys', {'pool': 'internal', 'key': 'foo:*'}) is None
+    assert registry.get_sample_value('redis_keys_memory_bytes', {'pool': 'internal', 'key': 'foo:*'}) is None